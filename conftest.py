@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Tests never open the app's library.db: every engine is pointed at a copy.
+# Modules read LIBRARY_DB when imported, so the default is set before any of
+# them is; the fixtures below still pass explicit paths.
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEGACY_DB = os.path.join(HERE, 'library.db')
+os.environ['LIBRARY_DB'] = os.path.join(tempfile.mkdtemp(prefix='library-tests-'), 'library.db')
+os.environ['LIBRARY_JOBS'] = 'off'
+os.environ['LIBRARY_ANALYTICS'] = 'off'
+
+import library_db
+
+# A copy of the checked-in database as the original app left it: schema
+# version 0, text timestamps, no derived tables
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = str(tmp_path / 'library.db')
+    shutil.copy(LEGACY_DB, path)
+    return path
+
+# The legacy copy brought up to the latest schema
+@pytest.fixture
+def db(legacy_db):
+    library_db.bootstrap(legacy_db)
+    yield legacy_db
+    library_db.close_pools()
+
+# A separate connection on the test database, for reads and direct writes
+@pytest.fixture
+def conn(db):
+    conn = library_db.connect(db, isolation_level=None)
+    yield conn
+    conn.close()
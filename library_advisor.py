@@ -0,0 +1,111 @@
+import os
+import re
+import threading
+
+import library_db
+
+# Statements whose plans are worth checking
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+# Collapse whitespace and literals so repeated executions group together
+def normalize(sql):
+    return _SPACES.sub(' ', _LITERALS.sub('?', sql)).strip()
+
+# Return the EXPLAIN QUERY PLAN detail lines for a statement
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+# Classify the plan steps that read more than they need to
+def plan_findings(plan):
+    findings = []
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail:
+            if ' INDEX ' in detail:
+                findings.append(('index scan', detail))
+            else:
+                findings.append(('full scan', detail))
+        elif detail.startswith('USE TEMP B-TREE'):
+            findings.append(('temp b-tree', detail))
+    return findings
+
+# Records every statement run on library connections and explains them on demand.
+# Statements arrive through the sqlite3 trace callback with their parameters
+# already bound, so the recorded text can be explained as-is.
+class IndexAdvisor:
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    # Trace every connection opened from now on
+    def install(self):
+        if self.attach not in library_db.CONNECT_HOOKS:
+            library_db.CONNECT_HOOKS.append(self.attach)
+
+    def uninstall(self):
+        if self.attach in library_db.CONNECT_HOOKS:
+            library_db.CONNECT_HOOKS.remove(self.attach)
+
+    def attach(self, conn):
+        conn.set_trace_callback(self.record)
+
+    def record(self, sql):
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return
+        key = normalize(sql)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                self._statements[key] = {'sql': sql, 'count': 1}
+            else:
+                entry['count'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+    # Explain every recorded statement, worst offenders first
+    def report(self, only_flagged=False):
+        with self._lock:
+            statements = [(key, dict(entry)) for key, entry in self._statements.items()]
+
+        conn = library_db.connect(self.path)
+        conn.set_trace_callback(None)
+        results = []
+        try:
+            for key, entry in statements:
+                try:
+                    plan = explain(conn, entry['sql'])
+                except Exception as e:
+                    plan = [f"could not explain: {e}"]
+                findings = plan_findings(plan)
+                if only_flagged and not findings:
+                    continue
+                results.append({
+                    'statement': key,
+                    'executions': entry['count'],
+                    'full_scans': sum(1 for kind, _ in findings if kind == 'full scan'),
+                    'findings': '; '.join(f"{kind}: {detail}" for kind, detail in findings),
+                    'plan': ' | '.join(plan),
+                })
+        finally:
+            conn.close()
+        results.sort(key=lambda r: (r['full_scans'], r['executions']), reverse=True)
+        return results
+
+_advisor = None
+_advisor_lock = threading.Lock()
+
+# Return the process-wide advisor when LIBRARY_INDEX_ADVISOR is set, else None
+def get_advisor():
+    global _advisor
+    if not os.environ.get('LIBRARY_INDEX_ADVISOR'):
+        return None
+    with _advisor_lock:
+        if _advisor is None:
+            _advisor = IndexAdvisor()
+            _advisor.install()
+    return _advisor
@@ -0,0 +1,154 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+import library_db
+from library_export import export_file
+
+# Columnar analytics over periodic snapshots, opt-in with LIBRARY_ANALYTICS=on.
+# A background job exports the library tables to Parquet next to the
+# database (<db>.analytics/). Reports that can live with data up to MAX_AGE
+# seconds old read those files as Arrow tables and aggregate them with Arrow
+# compute kernels, and hand back Arrow-backed DataFrames, so no rows are
+# converted one at a time in Python. When there is no recent snapshot the
+# reports fall back to SQLite.
+#
+# Tables are exported one after another, so a snapshot is not one
+# point-in-time view; loans newer than the books snapshot simply have no
+# category yet. DuckDB, when installed, can run ad-hoc SQL over the same
+# files (`python library_analytics.py query "SELECT ..."`).
+
+# Off by default: when on, every app process exports every table in full once an hour
+ANALYTICS = os.environ.get('LIBRARY_ANALYTICS', 'off')
+MAX_AGE = int(os.environ.get('LIBRARY_ANALYTICS_MAX_AGE', 24 * 3600))
+SNAPSHOT_INTERVAL = 3600
+TABLES = ['books', 'members', 'loans', 'reservations']
+
+def enabled():
+    return ANALYTICS not in ('', '0', 'off')
+
+def snapshot_dir(path=None):
+    return (path or library_db.DB_PATH) + '.analytics'
+
+def _manifest(path=None):
+    return os.path.join(snapshot_dir(path), 'snapshot.json')
+
+# Export every table to Parquet, replacing the previous snapshot file by file
+def take_snapshot(path=None):
+    out = snapshot_dir(path)
+    os.makedirs(out, exist_ok=True)
+    taken_at = datetime.now().replace(microsecond=0)
+    rows = {}
+    for name in TABLES:
+        target = os.path.join(out, f"{name}.parquet")
+        rows[name] = export_file(name, target + '.tmp', 'parquet', path)
+        os.replace(target + '.tmp', target)
+    with open(_manifest(path) + '.tmp', 'w') as f:
+        json.dump({'taken_at': library_db.to_epoch(taken_at), 'rows': rows}, f)
+    os.replace(_manifest(path) + '.tmp', _manifest(path))
+    return sum(rows.values())
+
+# When the current snapshot was taken, or None if there is none
+def snapshot_time(path=None):
+    try:
+        with open(_manifest(path)) as f:
+            return library_db.from_epoch(json.load(f)['taken_at'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+# The snapshot time if the snapshot is recent enough to answer reports
+def fresh_snapshot(path=None, max_age=MAX_AGE):
+    if not enabled():
+        return None
+    taken_at = snapshot_time(path)
+    if taken_at is None or (datetime.now() - taken_at).total_seconds() > max_age:
+        return None
+    return taken_at
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+# A snapshot table as an Arrow table, memory-mapped and kept until the file changes
+def table(name, path=None):
+    import pyarrow.parquet as pq
+    file = os.path.join(snapshot_dir(path), f"{name}.parquet")
+    mtime = os.stat(file).st_mtime_ns
+    with _tables_lock:
+        cached = _tables.get(file)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, pq.read_table(file, memory_map=True))
+            _tables[file] = cached
+    return cached[1]
+
+# An Arrow-backed DataFrame of the table. columns maps the table's column
+# names to the frame's, in the frame's order; group_by().aggregate() puts
+# keys and aggregates in an order that differs between pyarrow releases, so
+# columns are always picked by name.
+def to_frame(arrow_table, columns=None):
+    import pandas as pd
+    if columns:
+        arrow_table = arrow_table.select(list(columns)).rename_columns(list(columns.values()))
+    return arrow_table.to_pandas(types_mapper=pd.ArrowDtype)
+
+# Books per publication decade, newest first (decades before the 1950s are
+# grouped, as are books from the 2020s onwards)
+def publication_decades(path=None):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    year = pc.fill_null(table('books', path)['publication_year'], 0)
+    decade = pc.min_element_wise(pc.multiply(pc.divide(year, 10), 10), 2020)
+    label = pc.if_else(
+        pc.less(decade, 1950),
+        'Before 1950',
+        pc.binary_join_element_wise(pc.cast(decade, pa.string()), 's', ''),
+    )
+    counts = pa.table({'decade': label}).group_by('decade').aggregate([([], 'count_all')])
+    return to_frame(counts.sort_by([('decade', 'descending')]), {'decade': "Decade", 'count_all': "Count"})
+
+# Loans per year and category, with the average days a loan is (or has been)
+# out and the share of loans returned, or still out, past their due date
+def loan_trends(path=None, now=None):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    loans = table('loans', path).select(['book_id', 'loan_date', 'due_date', 'return_date'])
+    books = table('books', path).select(['book_id', 'category'])
+    joined = loans.join(books, 'book_id', join_type='left outer')
+    now = pa.scalar((now or datetime.now()).replace(microsecond=0), pa.timestamp('s'))
+    end = pc.coalesce(joined['return_date'], now)
+    # Parquet keeps second timestamps as milliseconds
+    seconds = pc.cast(pc.cast(pc.subtract(end, joined['loan_date']), pa.duration('s')), pa.int64())
+    facts = pa.table({
+        'year': pc.year(joined['loan_date']),
+        'category': pc.fill_null(joined['category'], 'Uncategorized'),
+        'days': pc.divide(pc.cast(seconds, pa.float64()), 86400.0),
+        'late': pc.cast(pc.greater(end, joined['due_date']), pa.float64()),
+    })
+    trends = facts.group_by(['year', 'category']).aggregate([([], 'count_all'), ('days', 'mean'), ('late', 'mean')])
+    trends = trends.sort_by([('year', 'ascending'), ('category', 'ascending')])
+    return to_frame(trends, {'year': "Year", 'category': "Category", 'count_all': "Loans",
+                             'days_mean': "Average Days Out", 'late_mean': "Late Share"})
+
+# Run SQL over the snapshot with DuckDB (optional); each table is a view
+def query(sql, path=None):
+    import duckdb
+    db = duckdb.connect()
+    for name in TABLES:
+        file = os.path.join(snapshot_dir(path), f"{name}.parquet").replace("'", "''")
+        db.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{file}')")
+    return to_frame(db.execute(sql).fetch_arrow_table())
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'snapshot'
+    if command == 'snapshot':
+        print(f"Snapshot of {take_snapshot()} rows written to {snapshot_dir()}")
+    elif command == 'query' and len(argv) == 3:
+        print(query(argv[2]).to_string())
+    else:
+        print('usage: python library_analytics.py [snapshot | query "SQL"]')
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
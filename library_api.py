@@ -0,0 +1,423 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import library_db
+from library_circulation import LOAN_DAYS, checkout_batch, checkout_loan, return_batch
+from library_fines import compute_fines
+from library_holds import place_hold
+from library_services import BookRepository, MemberRepository, LoanService, ReservationService, ReportService, minute_ceiling
+
+# Headless JSON API over the library database, for kiosks, the ILS and apps.
+# A small HTTP/1.1 server on asyncio streams (keep-alive, JSON bodies).
+# Reads go through library_services, the repositories and services the app's
+# pages use, so both answer from the same queries; handlers only serialise
+# the rows. Reads run on a thread pool, each worker thread reusing its pooled
+# connection; writes are the services' write jobs, submitted straight to the
+# shared writer queue, whose group commit batches concurrent checkouts into
+# one transaction. Concurrent lookups of single books or members are
+# gathered for a moment and answered with one json_each query. At most
+# MAX_CONCURRENCY requests are handled at once; past MAX_PENDING queued
+# requests the server answers 503 right away.
+
+HOST = os.environ.get('LIBRARY_API_HOST', '127.0.0.1')
+PORT = int(os.environ.get('LIBRARY_API_PORT', '8080'))
+WORKERS = int(os.environ.get('LIBRARY_API_WORKERS', str(min(8, (os.cpu_count() or 1) * 2))))
+MAX_CONCURRENCY = 64
+MAX_PENDING = 1024
+MAX_BODY = 1024 * 1024
+IDLE_TIMEOUT = 30
+# How long single lookups wait for company before their batch is queried
+BATCH_WINDOW = 0.001
+MAX_BATCH = 500
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_LOAN_DAYS = 365
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = unquote(url.path)
+        self.query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+        self.params = {}
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'{}')
+        except ValueError:
+            raise ApiError(400, "body is not valid JSON")
+
+    def int_arg(self, name, default=None):
+        value = self.params.get(name, self.query.get(name))
+        if value is None:
+            if default is None:
+                raise ApiError(400, f"{name} is required")
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ApiError(400, f"{name} must be an integer")
+
+def _field(body, name, kind=int):
+    try:
+        return kind(body[name])
+    except KeyError:
+        raise ApiError(400, f"{name} is required")
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{name} is not a valid {kind.__name__}")
+
+def _loan_days(body):
+    loan_days = _field(body, 'loan_days') if 'loan_days' in body else LOAN_DAYS
+    if not 1 <= loan_days <= MAX_LOAN_DAYS:
+        raise ApiError(400, f"loan_days must be between 1 and {MAX_LOAN_DAYS}")
+    return loan_days
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+# Service rows (namedtuples) as JSON objects
+def records(rows):
+    return [row._asdict() for row in rows]
+
+# Gathers single-key lookups made within BATCH_WINDOW into one query.
+# fetch(keys) returns {key: row} for the keys that exist.
+class Lookup:
+    def __init__(self, api, fetch):
+        self.api = api
+        self.fetch = fetch
+        self._waiting = {}
+        self._scheduled = False
+        self.batches = 0
+        self.lookups = 0
+
+    async def get(self, key):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(key, []).append(future)
+        self.lookups += 1
+        if len(self._waiting) >= MAX_BATCH:
+            self._flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_later(BATCH_WINDOW, self._flush)
+        return await future
+
+    def _flush(self):
+        self._scheduled = False
+        waiting, self._waiting = self._waiting, {}
+        if waiting:
+            self.batches += 1
+            asyncio.ensure_future(self._resolve(waiting))
+
+    async def _resolve(self, waiting):
+        try:
+            found = await self.api.call(self.fetch, list(waiting))
+        except Exception as e:
+            for futures in waiting.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in waiting.items():
+            row = found.get(key)
+            for future in futures:
+                if not future.done():
+                    future.set_result(row._asdict() if row is not None else None)
+
+class LibraryApi:
+    def __init__(self, path=None, workers=WORKERS, max_concurrency=MAX_CONCURRENCY, max_pending=MAX_PENDING):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='library-api')
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.requests = 0
+        self.rejected = 0
+        self.book_repo = BookRepository(path)
+        self.member_repo = MemberRepository(path)
+        self.loan_service = LoanService(path)
+        self.hold_service = ReservationService(path)
+        self.report_service = ReportService(path)
+        self.books = Lookup(self, self.book_repo.get_many)
+        self.members = Lookup(self, self.member_repo.get_many)
+        self.routes = [
+            ('GET', '/health', self.health),
+            ('GET', '/stats', self.stats),
+            ('GET', '/books', self.list_books),
+            ('GET', '/books/search', self.find_books),
+            ('GET', '/books/{book_id}', self.get_book),
+            ('GET', '/books/{book_id}/queue', self.get_queue),
+            ('GET', '/members/search', self.find_members),
+            ('GET', '/members/{member_id}', self.get_member),
+            ('GET', '/members/{member_id}/loans', self.member_loans),
+            ('GET', '/loans/{loan_id}', self.get_loan),
+            ('POST', '/loans', self.create_loan),
+            ('POST', '/loans/batch', self.create_loans),
+            ('POST', '/returns', self.create_returns),
+            ('GET', '/reservations', self.list_reservations),
+            ('POST', '/reservations', self.create_reservation),
+            ('GET', '/reports/overdue', self.overdue_report),
+            ('GET', '/reports/popular', self.popular_report),
+            ('GET', '/reports/fines', self.fines_report),
+        ]
+        self._compiled = [
+            (method, re.compile('^' + re.sub(r'\{(\w+)\}', r'(?P<\1>\\d+)', pattern) + '$'), handler)
+            for method, pattern, handler in self.routes
+        ]
+
+    # Run a read, func(*args), on a worker thread; the services use that
+    # thread's pooled connection
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # Run a write job on the shared writer without tying up a worker thread
+    async def write(self, func, *args):
+        return await asyncio.wrap_future(library_db.get_writer(self.path).submit(func, *args))
+
+    async def dispatch(self, request):
+        allowed = False
+        for method, pattern, handler in self._compiled:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            request.params = match.groupdict()
+            return await handler(request)
+        if allowed:
+            raise ApiError(405, f"{request.method} is not allowed on {request.path}")
+        raise ApiError(404, f"no route for {request.path}")
+
+    # Handle one request within the concurrency limit: (status, payload)
+    async def respond(self, request):
+        self.requests += 1
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, {'error': "server busy, try again"}
+        self.pending += 1
+        try:
+            async with self.slots:
+                return await self.dispatch(request)
+        except ApiError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f"{type(e).__name__}: {e}"}
+        finally:
+            self.pending -= 1
+
+    async def health(self, request):
+        return 200, {'ok': True}
+
+    async def stats(self, request):
+        def counts():
+            return {
+                'books': self.report_service.total('books'),
+                'books_by_status': self.report_service.counters('books_status'),
+                'members': self.report_service.total('members'),
+                'loans_by_status': self.report_service.counters('loans_status'),
+            }
+        result = await self.call(counts)
+        result['api'] = {'requests': self.requests, 'rejected': self.rejected, 'pending': self.pending,
+                         'book_lookups': self.books.lookups, 'book_batches': self.books.batches,
+                         'member_lookups': self.members.lookups, 'member_batches': self.members.batches}
+        return 200, result
+
+    # Books in book_id order, after= the last book_id of the previous page
+    async def list_books(self, request):
+        limit = min(request.int_arg('limit', PAGE_SIZE), MAX_PAGE_SIZE)
+        after = request.int_arg('after', 0)
+        filters = {'Status': request.query.get('status'), 'Category': request.query.get('category')}
+        rows, next_cursor = await self.call(self.book_repo.page, 'Book ID', False, filters, limit, (None, after) if after else None)
+        return 200, {'books': records(rows), 'next': next_cursor[1] if next_cursor else None}
+
+    async def find_books(self, request):
+        rows = await self.call(self.book_repo.search, request.query.get('q', ''), request.query.get('field'))
+        return 200, {'books': records(rows)}
+
+    async def get_book(self, request):
+        book = await self.books.get(request.int_arg('book_id'))
+        if book is None:
+            raise ApiError(404, "book not found")
+        return 200, book
+
+    async def get_queue(self, request):
+        rows = await self.call(self.hold_service.queue, request.int_arg('book_id'))
+        return 200, {'queue': [dict(row._asdict(), place=place) for place, row in enumerate(rows, start=1)]}
+
+    async def find_members(self, request):
+        rows = await self.call(self.member_repo.search, request.query.get('q', ''), request.query.get('field'))
+        return 200, {'members': records(rows)}
+
+    async def get_member(self, request):
+        member = await self.members.get(request.int_arg('member_id'))
+        if member is None:
+            raise ApiError(404, "member not found")
+        return 200, member
+
+    async def member_loans(self, request):
+        limit = min(request.int_arg('limit', PAGE_SIZE), MAX_PAGE_SIZE)
+        rows = await self.call(self.member_repo.loans, request.int_arg('member_id'), request.query.get('status'), limit)
+        return 200, {'loans': records(rows)}
+
+    async def get_loan(self, request):
+        loan = await self.call(self.loan_service.details, request.int_arg('loan_id'))
+        if loan is None:
+            raise ApiError(404, "loan not found")
+        return 200, loan._asdict()
+
+    async def create_loan(self, request):
+        body = request.json()
+        loan_days = _loan_days(body)
+        result = await self.write(checkout_loan, _field(body, 'book_id'), _field(body, 'member_id'), loan_days)
+        return (201 if result['ok'] else 409), result
+
+    async def create_loans(self, request):
+        body = request.json()
+        items = body.get('items')
+        if not isinstance(items, list) or not all(isinstance(item, list) and len(item) == 2 for item in items):
+            raise ApiError(400, "items must be a list of [book_id, member_id] pairs")
+        loan_days = _loan_days(body)
+        results = await self.write(checkout_batch, items, loan_days)
+        return 200, {'results': results}
+
+    async def create_returns(self, request):
+        loan_ids = request.json().get('loan_ids')
+        if not isinstance(loan_ids, list):
+            raise ApiError(400, "loan_ids must be a list")
+        return 200, {'results': await self.write(return_batch, loan_ids)}
+
+    async def list_reservations(self, request):
+        book_id, member_id = (request.int_arg(name) if name in request.query else None for name in ('book_id', 'member_id'))
+        limit = min(request.int_arg('limit', PAGE_SIZE), MAX_PAGE_SIZE)
+        rows = await self.call(self.hold_service.all, book_id, member_id, request.query.get('status'), limit)
+        return 200, {'reservations': records(rows)}
+
+    async def create_reservation(self, request):
+        body = request.json()
+        expiry_date = _field(body, 'expiry_date', datetime.fromisoformat) if body.get('expiry_date') else None
+        result = await self.write(place_hold, _field(body, 'book_id'), _field(body, 'member_id'), expiry_date)
+        return (201 if result['ok'] else 409), result
+
+    async def overdue_report(self, request):
+        now = minute_ceiling(datetime.now())
+        rows = records(await self.call(self.report_service.overdue, now))
+        if rows:
+            days, fines = compute_fines([row['due_date'] for row in rows], categories=[row['category'] for row in rows], now=now)
+            for row, day_count, fine in zip(rows, days.tolist(), fines.tolist()):
+                row.update(days_overdue=day_count, fine=fine)
+        return 200, {'overdue': rows}
+
+    async def popular_report(self, request):
+        limit = min(request.int_arg('limit', 10), MAX_PAGE_SIZE)
+        rows = await self.call(self.report_service.popular_books, request.int_arg('days', 0) or None, limit)
+        return 200, {'books': records(rows)}
+
+    async def fines_report(self, request):
+        members, totals = await self.call(self.report_service.fine_collection, request.int_arg('days', 0) or None)
+        return 200, {'assessed': totals.assessed, 'paid': totals.paid, 'members': records(members)}
+
+    # Serve requests on one client connection until it closes or goes idle
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                except ApiError as e:
+                    await send(writer, e.status, {'error': str(e)}, False)
+                    break
+                if request is None:
+                    break
+                status, payload = await self.respond(request)
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+# Read one HTTP/1.1 request, or None when the client closed the connection
+async def read_request(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise ApiError(400, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    # Digits only: int() would also take signs, spaces and underscores
+    length = headers.get('content-length') or '0'
+    if not re.fullmatch(r'[0-9]+', length):
+        raise ApiError(400, "invalid Content-Length")
+    length = int(length)
+    if length > MAX_BODY:
+        raise ApiError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return Request(method.upper(), target, headers, body)
+
+async def send(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, default=_json_default).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='library_api.py', description='Serve the library over a JSON HTTP API.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS, help='database worker threads')
+    parser.add_argument('--max-concurrency', type=int, default=MAX_CONCURRENCY, help='requests handled at once')
+    args = parser.parse_args(argv[1:])
+
+    library_db.bootstrap()
+    api = LibraryApi(workers=args.workers, max_concurrency=args.max_concurrency)
+    print(f"Serving the library API on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,466 @@
+import argparse
+import fnmatch
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Benchmarks for the library app.
+#
+# imports: cold-start import cost. Each module is imported in a fresh
+# interpreter under `python -X importtime`, a few times over, and the median
+# cumulative time is reported along with the heaviest modules it loaded.
+# STARTUP names, for the modules the app and the workers start from, the
+# heavy libraries they must not load on import; any that shows up fails the
+# run (exit status 1), so a stray top-level `import plotly.express` is caught
+# before it reaches the desk. --budget-ms adds a time limit as well.
+#
+# generate: build a synthetic library (see library_synth) to run against.
+#
+# run: time every query shape the pages issue against a database, through
+# the same services the pages call. Micro benchmarks time one call each
+# (searches, listing pages, lookups, each report, checkout and return);
+# macro benchmarks time the reads of a whole page and a mixed desk workload
+# on several threads. The query cache is cleared before every call, so each
+# one reaches SQLite. Arguments (ids, search terms) are sampled from the
+# database with a fixed seed, so two runs against the same file issue the
+# same calls. Write benchmarks check a book out and return it again; they
+# leave loans and ledger rows behind, so use --no-writes on a database you
+# care about.
+#
+# compare: match two `run --json` results by benchmark and report the
+# median's change; exits 1 when any got slower by more than --threshold.
+
+# module -> heavy modules (and their submodules) it must not import
+STARTUP = {
+    'library_app': ['pandas', 'numpy', 'pyarrow', 'plotly.express'],
+    'library_services': ['streamlit', 'pandas', 'numpy', 'pyarrow', 'plotly'],
+    'library_jobs': ['streamlit', 'pandas', 'numpy', 'pyarrow', 'plotly'],
+    'library_pages.loans': ['pandas', 'numpy', 'pyarrow', 'plotly.express'],
+}
+
+# The modules are imported from the directory this file is in
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+# {module: (self us, cumulative us)} for one import of `module` in a fresh interpreter
+def import_profile(module):
+    done = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                          cwd=HERE, capture_output=True, text=True)
+    if done.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{done.stderr.strip().splitlines()[-1]}")
+    profile = {}
+    for line in done.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            profile[name] = (int(own), int(cumulative))
+    return profile
+
+def _loaded(profile, heavy):
+    return sorted(name for name in heavy if any(loaded == name or loaded.startswith(name + '.') for loaded in profile))
+
+# Median cold import time of each module, the heaviest modules it loads and
+# any forbidden ones it pulled in
+def bench_imports(modules, repeat=5, top=5):
+    results = []
+    for module in modules:
+        profiles = [import_profile(module) for _ in range(repeat)]
+        total = statistics.median(profile[module][1] for profile in profiles)
+        last = profiles[-1]
+        # Top-level packages only, so a package is not listed with its submodules
+        packages = sorted(((cumulative, name) for name, (own, cumulative) in last.items() if '.' not in name and name != module), reverse=True)
+        results.append({
+            'module': module,
+            'import_ms': round(total / 1000, 1),
+            'modules_loaded': len(last),
+            'heaviest': [{'module': name, 'ms': round(cumulative / 1000, 1)} for cumulative, name in packages[:top]],
+            'forbidden': _loaded(last, STARTUP.get(module, [])),
+        })
+    return results
+
+SEED = 7
+MICRO_REPEAT = 7
+DESK_THREADS = 4
+DESK_SECONDS = 5.0
+COMPARE_THRESHOLD = 0.2
+# Changes smaller than this many milliseconds are noise, whatever the ratio
+COMPARE_FLOOR_MS = 0.2
+
+# Arguments for the benchmarks, sampled from the database under test.
+# Each list has one entry per repeat, so repeats spread over different rows.
+class Workload:
+    def __init__(self, conn, repeat, seed=SEED):
+        rng = random.Random(seed)
+        self.repeat = repeat
+        top = {table: conn.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM {table}").fetchone()[0] for table in ('books', 'members', 'loans')}
+        if not all(top.values()):
+            raise SystemExit("the database needs books, members and loans; see `library_bench.py generate`")
+
+        def sample(table, columns, where='1'):
+            rows = []
+            for _ in range(repeat * 50):
+                row = conn.execute(f"SELECT {columns} FROM {table} WHERE rowid >= ? AND {where} ORDER BY rowid LIMIT 1",
+                                   (rng.randint(1, top[table]),)).fetchone()
+                if row is not None:
+                    rows.append(row)
+                if len(rows) == repeat:
+                    break
+            return rows or [conn.execute(f"SELECT {columns} FROM {table} LIMIT 1").fetchone()]
+
+        books = sample('books', "book_id, title, author, isbn")
+        members = sample('members', "member_id, last_name, email, phone")
+        self.book_ids = [row[0] for row in books]
+        self.member_ids = [row[0] for row in members]
+        self.loan_ids = [row[0] for row in sample('loans', "loan_id")]
+        self.book_batches = [[rng.randint(1, top['books']) for _ in range(100)] for _ in range(repeat)]
+        words = [word for row in books for word in row[1].split() if len(word) >= 4] or [books[0][1]]
+        self.title_words = [rng.choice(words) for _ in range(repeat)]
+        self.prefixes = [word[:3] for word in self.title_words]
+        self.phrases = [f'"{row[1]}"' for row in books]
+        self.authors = [f"author:{row[2].split()[-1]}" for row in books]
+        self.isbns = [row[3][-7:] for row in books if row[3]] or ['0000000']
+        self.member_names = [row[1] for row in members]
+        self.emails = [row[2].split('@')[0] for row in members if row[2]] or ['example']
+        self.phones = [row[3][-4:] for row in members if row[3]] or ['555']
+        # Keyset cursors halfway down the listings
+        self.book_cursor = conn.execute("SELECT title, book_id FROM books WHERE book_id >= ? ORDER BY book_id LIMIT 1", (top['books'] // 2,)).fetchone()
+        self.member_cursor = conn.execute("SELECT last_name, member_id FROM members WHERE member_id >= ? ORDER BY member_id LIMIT 1", (top['members'] // 2,)).fetchone()
+        loan_cursor = conn.execute("SELECT loan_date, loan_id FROM loans WHERE loan_id >= ? ORDER BY loan_id LIMIT 1", (top['loans'] // 2,)).fetchone()
+        self.loan_cursor = (int(loan_cursor[0]), loan_cursor[1])
+        self.queued_book = (conn.execute("""
+        SELECT book_id FROM reservations WHERE status = 'pending' GROUP BY book_id ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone() or (self.book_ids[0],))[0]
+        # Pairs that can be lent: books on the shelf and active members
+        self.lendable = conn.execute("""
+        SELECT b.book_id, m.member_id
+        FROM (SELECT book_id, ROW_NUMBER() OVER () AS n FROM books WHERE status = 'available' AND book_id >= ? LIMIT 2000) b
+        JOIN (SELECT member_id, ROW_NUMBER() OVER () AS n FROM members WHERE membership_status = 'active' AND member_id >= ? LIMIT 2000) m USING (n)
+        """, (rng.randint(1, top['books']), rng.randint(1, top['members']))).fetchall()
+        self.now = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # The latest year with loans, for a database generated some time ago
+        latest = conn.execute("SELECT MAX(loan_date) FROM loans").fetchone()[0]
+        self.year = datetime.fromtimestamp(latest).year if latest else self.now.year
+
+# The reads of each page, as a full render issues them (Streamlit runs every
+# tab of a page on every rerun)
+def page_reads(books, members, loans, holds, reports, workload, path):
+    from library_jobs import last_runs
+    return {
+        'dashboard': lambda: (reports.counters('books_status'), reports.total('books'), reports.total('members'),
+                              reports.counters('loans_status'), loans.recent(), reports.counters('books_category')),
+        'books': lambda: (books.page()[0], books.count()[0]),
+        'members': lambda: (members.page()[0], members.count()[0]),
+        'loans': lambda: (loans.page()[0], loans.count()[0], last_runs(loans.conn), books.lendable(), members.active(),
+                          loans.open_loans(), members.active()),
+        'reservations': lambda: (holds.all(), books.reservable(), members.active(), holds.queued_books(), holds.queue(workload.queued_book)),
+        'reports': lambda: (reports.overdue(workload.now), reports.popular_books(), reports.popular_categories(), reports.active_members(),
+                            reports.fine_collection(), reports.books_by_status(), reports.books_by_category(),
+                            reports.publication_decades(), reports.monthly_loans(workload.year), reports.loan_trends(workload.now)),
+    }
+
+# name -> function of the repeat index; every function returns what it read
+def micro_benchmarks(path, workload, writes=True):
+    from library_services import BookRepository, MemberRepository, LoanService, ReservationService, ReportService
+    books, members, loans = BookRepository(path), MemberRepository(path), LoanService(path)
+    holds, reports = ReservationService(path), ReportService(path)
+    w = workload
+    benchmarks = {
+        'search.books.word': lambda i: books.search(w.title_words[i % len(w.title_words)]),
+        'search.books.prefix': lambda i: books.search(w.prefixes[i % len(w.prefixes)]),
+        'search.books.phrase': lambda i: books.search(w.phrases[i % len(w.phrases)]),
+        'search.books.author': lambda i: books.search(w.authors[i % len(w.authors)]),
+        'search.books.isbn': lambda i: books.search(w.isbns[i % len(w.isbns)]),
+        'search.members.name': lambda i: members.search(w.member_names[i % len(w.member_names)]),
+        'search.members.email': lambda i: members.search(w.emails[i % len(w.emails)], 'Email'),
+        'search.members.phone': lambda i: members.search(w.phones[i % len(w.phones)], 'Phone'),
+        'listing.books.first': lambda i: books.page()[0],
+        'listing.books.deep': lambda i: books.page('Title', cursor=w.book_cursor)[0],
+        'listing.books.filtered': lambda i: books.page('Added Date', True, {'Status': 'available', 'Category': 'Fiction'})[0],
+        'listing.books.count': lambda i: books.count({'Status': 'available'})[0],
+        'listing.members.first': lambda i: members.page()[0],
+        'listing.members.deep': lambda i: members.page('Last Name', cursor=w.member_cursor)[0],
+        'listing.members.count': lambda i: members.count({'Membership Status': 'active'})[0],
+        'listing.loans.first': lambda i: loans.page()[0],
+        'listing.loans.deep': lambda i: loans.page(cursor=w.loan_cursor)[0],
+        'listing.loans.filtered': lambda i: loans.page(filters={'Status': 'overdue'})[0],
+        'listing.loans.count': lambda i: loans.count({'Status': 'returned'})[0],
+        'lookup.book': lambda i: books.get(w.book_ids[i % len(w.book_ids)]),
+        'lookup.books.100': lambda i: books.get_many(w.book_batches[i % len(w.book_batches)]),
+        'lookup.member.loans': lambda i: members.loans(w.member_ids[i % len(w.member_ids)]),
+        'lookup.loan': lambda i: loans.details(w.loan_ids[i % len(w.loan_ids)]),
+        'desk.lendable': lambda i: books.lendable(),
+        'desk.active_members': lambda i: members.active(),
+        'desk.open_loans': lambda i: loans.open_loans(),
+        'holds.all': lambda i: holds.all(),
+        'holds.queued_books': lambda i: holds.queued_books(),
+        'holds.queue': lambda i: holds.queue(w.queued_book),
+        'dashboard.counters': lambda i: reports.counters('books_status'),
+        'dashboard.recent': lambda i: loans.recent(),
+        'reports.overdue': lambda i: reports.overdue(w.now),
+        'reports.popular_books': lambda i: reports.popular_books(),
+        'reports.popular_books.30d': lambda i: reports.popular_books(30),
+        'reports.popular_categories': lambda i: reports.popular_categories(),
+        'reports.active_members': lambda i: reports.active_members(),
+        'reports.fine_collection': lambda i: reports.fine_collection(),
+        'reports.books_by_status': lambda i: reports.books_by_status(),
+        'reports.books_by_category': lambda i: reports.books_by_category(),
+        'reports.publication_decades': lambda i: reports.publication_decades(),
+        'reports.monthly_loans': lambda i: reports.monthly_loans(w.year),
+        'reports.loan_trends': lambda i: reports.loan_trends(w.now),
+    }
+    for page, read in page_reads(books, members, loans, holds, reports, w, path).items():
+        benchmarks[f"page.{page}"] = lambda i, read=read: read()
+    if writes and w.lendable:
+        def round_trip(i):
+            book_id, member_id = w.lendable[i % len(w.lendable)]
+            result = loans.checkout(book_id, member_id)
+            if result['ok']:
+                loans.return_loan(result['loan_id'])
+            return [result]
+
+        def batch_round_trip(i):
+            items = w.lendable[(i * 50) % len(w.lendable):][:50]
+            lent = [result['loan_id'] for result in loans.checkout_many(items) if result['ok']]
+            return loans.return_many(lent)
+        benchmarks['write.checkout_return'] = round_trip
+        benchmarks['write.batch50'] = batch_round_trip
+    return benchmarks
+
+# Rows a benchmark read: list lengths, one per row or scalar, summed over tuples of results
+def _rows(result):
+    if result is None:
+        return 0
+    if hasattr(result, '_fields') or not isinstance(result, (list, tuple, dict)):
+        return 1
+    if isinstance(result, tuple):
+        return sum(_rows(item) for item in result)
+    return len(result)
+
+def _summary(name, times, rows):
+    times = sorted(times)
+    return {
+        'name': name,
+        'runs': len(times),
+        'min_ms': round(times[0] * 1000, 3),
+        'median_ms': round(statistics.median(times) * 1000, 3),
+        'p95_ms': round(times[max(math.ceil(len(times) * 0.95) - 1, 0)] * 1000, 3),
+        'max_ms': round(times[-1] * 1000, 3),
+        'rows': rows,
+    }
+
+# Time each benchmark `repeat` times, each call against a cold query cache.
+# One untimed call first starts the writer and fills SQLite's page cache, as
+# a running app would have.
+def run_micro(benchmarks, repeat):
+    from library_cache import clear_cache
+    results = []
+    for name, func in benchmarks.items():
+        func(repeat)
+        times = []
+        for i in range(repeat):
+            clear_cache()
+            started = time.perf_counter()
+            result = func(i)
+            times.append(time.perf_counter() - started)
+        results.append(_summary(name, times, _rows(result)))
+        yield results[-1]
+
+# Desk traffic on several threads at once: searches, member and loan
+# lookups, and a checkout and return in every few operations. Reports the
+# throughput and the latency of each operation.
+def run_desk(path, workload, threads=DESK_THREADS, seconds=DESK_SECONDS, writes=True):
+    from library_services import BookRepository, MemberRepository, LoanService
+    books, members, loans = BookRepository(path), MemberRepository(path), LoanService(path)
+    w = workload
+    pairs = [w.lendable[t::threads] for t in range(threads)]
+    times = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(t):
+        rng = random.Random(SEED + t)
+        mine = []
+        n = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            kind = n % 5
+            if kind == 0:
+                books.search(rng.choice(w.title_words))
+            elif kind == 1:
+                members.search(rng.choice(w.member_names))
+            elif kind == 2:
+                members.loans(rng.choice(w.member_ids))
+            elif kind == 3:
+                loans.details(rng.choice(w.loan_ids))
+            elif writes and pairs[t]:
+                result = loans.checkout(*pairs[t][n // 5 % len(pairs[t])])
+                if result['ok']:
+                    loans.return_loan(result['loan_id'])
+            else:
+                books.get(rng.choice(w.book_ids))
+            mine.append(time.perf_counter() - started)
+            n += 1
+        with lock:
+            times.extend(mine)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    result = _summary(f"desk.concurrent.{threads}", times, len(times))
+    result['ops_per_s'] = round(len(times) / elapsed, 1)
+    return result
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+    return f"{commit}+dirty" if commit and dirty else commit or None
+
+def bench_run(path, repeat=MICRO_REPEAT, only=None, writes=True, threads=DESK_THREADS, seconds=DESK_SECONDS, progress=None):
+    import library_db
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ('books', 'members', 'loans', 'reservations')}
+        workload = Workload(conn, repeat)
+    finally:
+        conn.close()
+    meta = {
+        'commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'database': os.path.abspath(path),
+        'size_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+        'rows': counts,
+        'repeat': repeat,
+        'writes': writes,
+        'started': datetime.now().isoformat(timespec='seconds'),
+    }
+    benchmarks = micro_benchmarks(path, workload, writes)
+    if only:
+        benchmarks = {name: func for name, func in benchmarks.items() if any(fnmatch.fnmatch(name, pattern) for pattern in only)}
+    results = []
+    try:
+        for result in run_micro(benchmarks, repeat):
+            results.append(result)
+            if progress:
+                progress(result)
+        if threads and (not only or any(fnmatch.fnmatch(f"desk.concurrent.{threads}", pattern) for pattern in only)):
+            results.append(run_desk(path, workload, threads, seconds, writes))
+            if progress:
+                progress(results[-1])
+    finally:
+        library_db.close_pools()
+    return {'meta': meta, 'results': results}
+
+# Rows of (name, base median, new median, ratio, flag) for the benchmarks in
+# both result sets; flag is 'slower' or 'faster' past the threshold
+def compare_runs(base, new, threshold=COMPARE_THRESHOLD, floor_ms=COMPARE_FLOOR_MS):
+    before = {result['name']: result for result in base['results']}
+    rows = []
+    for result in new['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        a, b = old['median_ms'], result['median_ms']
+        ratio = b / a if a else float('inf')
+        flag = ''
+        if abs(b - a) >= floor_ms:
+            if ratio > 1 + threshold:
+                flag = 'slower'
+            elif ratio < 1 / (1 + threshold):
+                flag = 'faster'
+        rows.append((result['name'], a, b, ratio, flag))
+    return rows
+
+def _print_result(result):
+    extra = f"  {result['ops_per_s']:.0f} ops/s" if 'ops_per_s' in result else ''
+    print(f"{result['name']:<32} {result['median_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f}  min {result['min_ms']:>10.2f}  {result['rows']:>8} rows{extra}", flush=True)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='library_bench.py', description='Benchmarks for the library app.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    imports = commands.add_parser('imports', help='cold-start import time of the startup modules')
+    imports.add_argument('modules', nargs='*', help=f"modules to measure (default: {', '.join(STARTUP)})")
+    imports.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module (the median is reported)')
+    imports.add_argument('--budget-ms', type=float, help='fail when a module takes longer than this to import')
+    imports.add_argument('--json', dest='json_out', help='also write the results to this file')
+    # generate hands its arguments to library_synth unparsed
+    commands.add_parser('generate', help='build a synthetic library database (see library_synth.py --help)')
+    run = commands.add_parser('run', help='time the queries the pages issue against a database')
+    run.add_argument('database')
+    run.add_argument('--repeat', type=int, default=MICRO_REPEAT, help='calls per benchmark')
+    run.add_argument('--only', action='append', help='run only benchmarks matching this pattern (e.g. "reports.*"); may be repeated')
+    run.add_argument('--no-writes', dest='writes', action='store_false', help='skip checkouts and returns, leaving the database as it is')
+    run.add_argument('--threads', type=int, default=DESK_THREADS, help='threads in the concurrent desk benchmark (0 to skip it)')
+    run.add_argument('--seconds', type=float, default=DESK_SECONDS, help='length of the concurrent desk benchmark')
+    run.add_argument('--json', dest='json_out', help='also write the results to this file')
+    compare = commands.add_parser('compare', help='compare two `run --json` results')
+    compare.add_argument('base')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=COMPARE_THRESHOLD, help='relative change in the median that counts (default 0.2, i.e. 20%%)')
+    compare.add_argument('--floor-ms', type=float, default=COMPARE_FLOOR_MS, help='ignore changes smaller than this')
+    if argv[1:2] == ['generate']:
+        from library_synth import main as synth_main
+        return synth_main(['library_synth.py'] + argv[2:])
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'run':
+        if not os.path.exists(args.database):
+            parser.error(f"no database at {args.database}")
+        results = bench_run(args.database, args.repeat, args.only, args.writes, args.threads, args.seconds, progress=_print_result)
+        if args.json_out:
+            with open(args.json_out, 'w') as f:
+                json.dump(results, f, indent=2)
+        return 0
+
+    if args.command == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print(f"base {base['meta'].get('commit')}  new {new['meta'].get('commit')}")
+        # Loans grow with every write benchmark; the catalogue does not
+        if any(base['meta']['rows'].get(table) != new['meta']['rows'].get(table) for table in ('books', 'members')):
+            print("  the two runs used databases of different sizes")
+        rows = compare_runs(base, new, args.threshold, args.floor_ms)
+        for name, a, b, ratio, flag in rows:
+            print(f"{name:<32} {a:>10.2f} -> {b:>10.2f} ms  x{ratio:5.2f}  {flag}")
+        slower = [row for row in rows if row[4] == 'slower']
+        if slower:
+            print(f"{len(slower)} benchmarks slower by more than {args.threshold:.0%}")
+        return 1 if slower else 0
+
+    results = bench_imports(args.modules or list(STARTUP), args.repeat)
+    failed = False
+    for result in results:
+        heaviest = ', '.join(f"{item['module']} {item['ms']:.0f}" for item in result['heaviest'])
+        print(f"{result['module']:<24} {result['import_ms']:>8.1f} ms  {result['modules_loaded']:>5} modules  [{heaviest}]")
+        if result['forbidden']:
+            print(f"  imports {', '.join(result['forbidden'])} at startup")
+            failed = True
+        if args.budget_ms is not None and result['import_ms'] > args.budget_ms:
+            print(f"  over the {args.budget_ms:.0f} ms budget")
+            failed = True
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'imports': results}, f, indent=2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
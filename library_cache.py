@@ -0,0 +1,157 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import library_db
+
+DEFAULT_TTL = 300
+MAX_BYTES = int(os.environ.get('LIBRARY_CACHE_MB', '64')) * 1024 * 1024
+
+_SPACES = re.compile(r"\s+")
+_READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+
+# Collapse whitespace so formatting differences share a cache entry
+def normalize(sql):
+    return _SPACES.sub(' ', sql).strip()
+
+# Tables a query reads from
+def read_tables(sql):
+    return {name.lower() for name in _READ_TABLES.findall(sql)}
+
+# Approximate memory held by a result set
+def result_size(rows):
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+# Query result cache keyed by normalized SQL plus parameters.
+# Entries expire after their TTL, the least recently used ones are evicted to
+# stay under max_bytes, and writes to a table drop every entry that read it.
+# This process's writes are heard from its write queue; writes from other
+# processes (the API, imports, the jobs worker) show up in the tables' write
+# counters (library_db.read_versions), which every lookup checks, so an
+# entry is never served after its tables changed anywhere.
+class QueryCache:
+    def __init__(self, max_bytes=MAX_BYTES, default_ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._generations = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Return cached rows for (sql, params), running the query on a miss.
+    # With with_names, returns (column names, rows).
+    def query(self, conn, sql, params=(), ttl=None, path=None, with_names=False):
+        key = (path or library_db.DB_PATH, normalize(sql), tuple(params))
+        tables = read_tables(sql)
+        versions = library_db.read_versions(conn, tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now and entry[5] == versions:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return (entry[4], list(entry[0])) if with_names else list(entry[0])
+                self._remove(key)
+                if entry[1] > now:
+                    self.invalidations += 1
+                else:
+                    self.expirations += 1
+            self.misses += 1
+            generation = self._generation(key[0], tables)
+
+        cursor = conn.execute(sql, params)
+        rows = cursor.fetchall()
+        names = [column[0] for column in cursor.description or ()]
+        self._store(key, rows, names, tables, now + (self.default_ttl if ttl is None else ttl), generation, versions)
+        return (names, list(rows)) if with_names else list(rows)
+
+    def _generation(self, path, tables):
+        return tuple(self._generations.get((path, table), 0) for table in sorted(tables))
+
+    def _store(self, key, rows, names, tables, expires, generation, versions):
+        size = result_size(rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # A write landed while the query ran; the rows may already be stale
+            if self._generation(key[0], tables) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, expires, tables, size, names, versions)
+            self.bytes += size
+            for table in tables:
+                self._by_table.setdefault((key[0], table), set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        rows, expires, tables, size, names, versions = self._entries.pop(key)
+        self.bytes -= size
+        for table in tables:
+            keys = self._by_table.get((key[0], table))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[(key[0], table)]
+
+    # Drop every entry that reads one of the tables
+    def invalidate(self, path, tables):
+        with self._lock:
+            for table in tables:
+                table = table.lower()
+                self._generations[(path, table)] = self._generations.get((path, table), 0) + 1
+                for key in list(self._by_table.get((path, table), ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+_cache = QueryCache()
+library_db.WRITE_LISTENERS.append(_cache.invalidate)
+
+# Run a read query through the process-wide cache
+def cached_query(conn, sql, params=(), ttl=None, path=None, with_names=False):
+    return _cache.query(conn, sql, params, ttl, path, with_names)
+
+def invalidate(*tables, path=None):
+    _cache.invalidate(path or library_db.DB_PATH, tables)
+
+def cache_stats():
+    return _cache.stats()
+
+def clear_cache():
+    _cache.clear()
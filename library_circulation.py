@@ -0,0 +1,160 @@
+import json
+from datetime import datetime, timedelta
+
+import library_db
+from library_holds import release_books, fulfil_hold
+
+# Batch circulation for busy desks.
+# A batch is validated with one set-based query and written as one writer
+# job, so all of its loans, book status changes and fines commit together.
+# Every item gets a result dict with 'ok' and either the loan or a 'message'.
+
+LOAN_DAYS = 14
+
+def _items_json(items):
+    return json.dumps([list(item) for item in items])
+
+# Write job: lend each (book_id, member_id) pair for loan_days
+def checkout_batch(conn, items, loan_days=LOAN_DAYS, now=None):
+    now = (now or datetime.now()).replace(microsecond=0)
+    due = now + timedelta(days=loan_days)
+    rows = conn.execute("""
+    SELECT r.key, json_extract(r.value, '$[0]'), json_extract(r.value, '$[1]'), b.book_id, b.status, m.member_id, m.membership_status,
+           EXISTS (SELECT 1 FROM reservations h WHERE h.book_id = b.book_id AND h.member_id = m.member_id AND h.status = 'ready')
+    FROM json_each(?) r
+    LEFT JOIN books b ON b.book_id = json_extract(r.value, '$[0]')
+    LEFT JOIN members m ON m.member_id = json_extract(r.value, '$[1]')
+    ORDER BY r.key
+    """, (_items_json(items),)).fetchall()
+
+    results = []
+    lending = {}
+    for pos, book_id, member_id, found_book, book_status, found_member, member_status, held_for_member in rows:
+        result = {'book_id': book_id, 'member_id': member_id, 'ok': False}
+        if found_book is None:
+            result['message'] = "book not found"
+        elif found_member is None:
+            result['message'] = "member not found"
+        elif member_status != 'active':
+            result['message'] = f"member is {member_status}"
+        elif book_status == 'reserved' and not held_for_member:
+            result['message'] = "book is held for another member"
+        elif book_status not in ('available', 'reserved'):
+            result['message'] = f"book is {book_status}"
+        elif book_id in lending:
+            result['message'] = "book is already in this batch"
+        else:
+            result.update(ok=True, loan_date=now, due_date=due)
+            lending[book_id] = result
+        results.append(result)
+
+    if lending:
+        pairs = _items_json((book_id, result['member_id']) for book_id, result in lending.items())
+        created = conn.execute("""
+        INSERT INTO loans (book_id, member_id, loan_date, due_date, status)
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), ?, ?, 'borrowed' FROM json_each(?)
+        RETURNING loan_id, book_id
+        """, (now, due, pairs)).fetchall()
+        for loan_id, book_id in created:
+            lending[book_id]['loan_id'] = loan_id
+        conn.execute("""
+        UPDATE books SET status = 'borrowed'
+        WHERE book_id IN (SELECT json_extract(value, '$[0]') FROM json_each(?))
+        """, (pairs,))
+        conn.execute("""
+        UPDATE reservations SET status = 'fulfilled'
+        WHERE status = 'ready'
+          AND (book_id, member_id) IN (SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))
+        """, (pairs,))
+    return results
+
+# Write job: return each open loan, charging fines as of now
+def return_batch(conn, loan_ids, now=None):
+    now = (now or datetime.now()).replace(microsecond=0)
+    rows = conn.execute("""
+    SELECT r.key, r.value, l.loan_id, l.book_id, l.status, l.due_date, b.category
+    FROM json_each(?) r
+    LEFT JOIN loans l ON l.loan_id = r.value
+    LEFT JOIN books b ON b.book_id = l.book_id
+    ORDER BY r.key
+    """, (json.dumps(list(loan_ids)),)).fetchall()
+
+    results = []
+    closing = {}
+    for pos, loan_id, found, book_id, status, due_date, category in rows:
+        result = {'loan_id': loan_id, 'ok': False}
+        if found is None:
+            result['message'] = "loan not found"
+        elif status not in ('borrowed', 'overdue'):
+            result['message'] = f"loan is {status}"
+        elif loan_id in closing:
+            result['message'] = "loan is already in this batch"
+        else:
+            result.update(ok=True, book_id=book_id, return_date=now, due_date=due_date, category=category)
+            closing[loan_id] = result
+        results.append(result)
+
+    if closing:
+        # The fine engine (numpy and pandas) is only loaded once something is returned
+        from library_fines import compute_fines
+        batch = list(closing.values())
+        days, fines = compute_fines([r['due_date'] for r in batch], categories=[r['category'] for r in batch], now=now)
+        for result, fine in zip(batch, fines.tolist()):
+            result['fine'] = fine
+        conn.executemany("""
+        UPDATE loans SET status = 'returned', return_date = ?, fine_amount = ?
+        WHERE loan_id = ?
+        """, [(now, r['fine'], r['loan_id']) for r in batch])
+        # Returned copies go to the next member in line, if any
+        release_books(conn, [r['book_id'] for r in batch], now)
+    return results
+
+# Write job: lend one book, atomically.
+# The availability check and the status change are one conditional UPDATE,
+# so a copy that another desk (or process) lent first is never lent twice;
+# the loan is only created when that UPDATE claimed the book. A book on the
+# hold shelf can only be lent to the member it is held for.
+def checkout_loan(conn, book_id, member_id, loan_days=LOAN_DAYS, now=None):
+    now = (now or datetime.now()).replace(microsecond=0)
+    due = now + timedelta(days=loan_days)
+    claimed = conn.execute("""
+    UPDATE books SET status = 'borrowed'
+    WHERE book_id = ?
+      AND (status = 'available' OR status = 'reserved' AND EXISTS (
+          SELECT 1 FROM reservations WHERE book_id = books.book_id AND member_id = ? AND status = 'ready'))
+      AND EXISTS (SELECT 1 FROM members WHERE member_id = ? AND membership_status = 'active')
+    RETURNING book_id
+    """, (book_id, member_id, member_id)).fetchone()
+    result = {'book_id': book_id, 'member_id': member_id, 'ok': False}
+    if claimed is None:
+        # Only the failure path pays for finding out why
+        book = conn.execute("SELECT status FROM books WHERE book_id = ?", (book_id,)).fetchone()
+        member = conn.execute("SELECT membership_status FROM members WHERE member_id = ?", (member_id,)).fetchone()
+        if book is None:
+            result['message'] = "book not found"
+        elif member is None:
+            result['message'] = "member not found"
+        elif member[0] != 'active':
+            result['message'] = f"member is {member[0]}"
+        elif book[0] == 'reserved':
+            result['message'] = "book is held for another member"
+        else:
+            result['message'] = f"book is {book[0]}"
+        return result
+    loan_id = conn.execute("""
+    INSERT INTO loans (book_id, member_id, loan_date, due_date, status)
+    VALUES (?, ?, ?, ?, 'borrowed')
+    RETURNING loan_id
+    """, (book_id, member_id, now, due)).fetchone()[0]
+    fulfil_hold(conn, book_id, member_id)
+    result.update(ok=True, loan_id=loan_id, loan_date=now, due_date=due)
+    return result
+
+def checkout(book_id, member_id, loan_days=LOAN_DAYS, path=None):
+    return library_db.run_write(checkout_loan, book_id, member_id, loan_days, path=path)
+
+def checkout_books(items, loan_days=LOAN_DAYS, path=None):
+    return library_db.run_write(checkout_batch, list(items), loan_days, path=path)
+
+def return_books(loan_ids, path=None):
+    return library_db.run_write(return_batch, list(loan_ids), path=path)
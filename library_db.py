@@ -0,0 +1,900 @@
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from library_holds import create_hold_queue
+from library_ledger import create_fine_ledger
+from library_rollups import create_loan_rollups, rebuild_rollups
+from library_stats import create_stats_schema, rebuild_stats
+
+DB_PATH = os.environ.get('LIBRARY_DB', 'library.db')
+
+# Per-connection storage engine settings.
+# journal_mode is persistent in the file and is set once during bootstrap.
+PRAGMAS = {
+    'synchronous': 'NORMAL',      # durable across app crashes in WAL mode, fsync only at checkpoints
+    'cache_size': -32000,         # 32 MB page cache per connection
+    'mmap_size': 268435456,       # map up to 256 MB of the file for reads
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,         # wait up to 5 s for a lock instead of failing immediately
+}
+
+# Compiled statements kept per connection by sqlite3, keyed by SQL text.
+# The services' statements plus the listing pages' sort and filter variants
+# fit without evicting each other.
+STATEMENT_CACHE = 256
+
+# Callables run on every new connection (used by diagnostics such as the index advisor)
+CONNECT_HOOKS = []
+
+# Class of new connections; query tracing swaps in a subclass (see library_trace)
+CONNECTION_FACTORY = sqlite3.Connection
+
+# Callables run as listener(path, tables) after each write commit (used by caches)
+WRITE_LISTENERS = []
+
+# Timestamps are stored as integer epoch seconds in columns declared EPOCH.
+# datetime parameters bind as epoch seconds, and EPOCH columns read back as
+# naive local datetimes.
+def to_epoch(moment):
+    return int(moment.timestamp())
+
+def from_epoch(value):
+    return datetime.fromtimestamp(int(value))
+
+sqlite3.register_adapter(datetime, to_epoch)
+sqlite3.register_converter('EPOCH', from_epoch)
+
+# Create tables if they don't exist
+def init_db(conn):
+    c = conn.cursor()
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS books (
+        book_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        isbn TEXT UNIQUE,
+        publication_year INTEGER,
+        category TEXT,
+        status TEXT DEFAULT 'available',
+        shelf_location TEXT,
+        added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS members (
+        member_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        phone TEXT,
+        address TEXT,
+        membership_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        membership_status TEXT DEFAULT 'active'
+    )
+    ''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS loans (
+        loan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER,
+        member_id INTEGER,
+        loan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        due_date TIMESTAMP NOT NULL,
+        return_date TIMESTAMP,
+        status TEXT DEFAULT 'borrowed',
+        fine_amount REAL DEFAULT 0.00,
+        FOREIGN KEY (book_id) REFERENCES books (book_id),
+        FOREIGN KEY (member_id) REFERENCES members (member_id)
+    )
+    ''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS reservations (
+        reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER,
+        member_id INTEGER,
+        reservation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expiry_date TIMESTAMP,
+        status TEXT DEFAULT 'pending',
+        FOREIGN KEY (book_id) REFERENCES books (book_id),
+        FOREIGN KEY (member_id) REFERENCES members (member_id)
+    )
+    ''')
+
+    conn.commit()
+    return conn
+
+# Add sample data if database is empty
+def add_sample_data(conn):
+    c = conn.cursor()
+
+    # Check if books table is empty
+    c.execute("SELECT COUNT(*) FROM books")
+    if c.fetchone()[0] == 0:
+        # Add sample books
+        books = [
+            ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 1960, 'Fiction', 'available', 'A1'),
+            ('1984', 'George Orwell', '9780451524935', 1949, 'Fiction', 'available', 'A2'),
+            ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 1925, 'Fiction', 'available', 'A3'),
+            ('Pride and Prejudice', 'Jane Austen', '9780141439518', 1813, 'Romance', 'available', 'B1'),
+            ('The Hobbit', 'J.R.R. Tolkien', '9780547928227', 1937, 'Fantasy', 'available', 'B2'),
+            ('Harry Potter and the Sorcerer\'s Stone', 'J.K. Rowling', '9780590353427', 1997, 'Fantasy', 'available', 'B3'),
+            ('The Catcher in the Rye', 'J.D. Salinger', '9780316769488', 1951, 'Fiction', 'available', 'C1'),
+            ('The Lord of the Rings', 'J.R.R. Tolkien', '9780618640157', 1954, 'Fantasy', 'available', 'C2'),
+            ('Animal Farm', 'George Orwell', '9780451526342', 1945, 'Fiction', 'available', 'C3'),
+            ('The Da Vinci Code', 'Dan Brown', '9780307474278', 2003, 'Mystery', 'available', 'D1')
+        ]
+        c.executemany("INSERT INTO books (title, author, isbn, publication_year, category, status, shelf_location) VALUES (?, ?, ?, ?, ?, ?, ?)", books)
+
+    # Check if members table is empty
+    c.execute("SELECT COUNT(*) FROM members")
+    if c.fetchone()[0] == 0:
+        # Add sample members
+        members = [
+            ('John', 'Doe', 'john.doe@example.com', '555-1234', '123 Main St', datetime.now(), 'active'),
+            ('Jane', 'Smith', 'jane.smith@example.com', '555-5678', '456 Oak Ave', datetime.now(), 'active'),
+            ('Bob', 'Johnson', 'bob.johnson@example.com', '555-9012', '789 Pine Rd', datetime.now(), 'active'),
+            ('Alice', 'Williams', 'alice.williams@example.com', '555-3456', '321 Elm St', datetime.now(), 'active'),
+            ('Charlie', 'Brown', 'charlie.brown@example.com', '555-7890', '654 Maple Dr', datetime.now(), 'active')
+        ]
+        c.executemany("INSERT INTO members (first_name, last_name, email, phone, address, membership_date, membership_status) VALUES (?, ?, ?, ?, ?, ?, ?)", members)
+
+    conn.commit()
+
+# Migration 1: secondary indexes for the access paths the pages use
+def create_indexes(c):
+    # Open loans by due date (Return Book list, overdue reports)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_open_due ON loans (status, due_date) WHERE status IN ('borrowed', 'overdue')")
+    # Borrowed loans past due (overdue sweep)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_borrowed_due ON loans (due_date) WHERE status = 'borrowed'")
+    # Loan listings, newest first, optionally filtered by status
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_loan_date ON loans (loan_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_status_loan_date ON loans (status, loan_date)")
+    # Loans of a book / of a member
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_book_status ON loans (book_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_member_loan_date ON loans (member_id, loan_date)")
+    # Fine collection by return date, covering the columns the report sums
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_fines ON loans (return_date, member_id, fine_amount) WHERE fine_amount > 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_books_status ON books (status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_books_category ON books (category)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_book_status ON reservations (book_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_date ON reservations (reservation_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_members_status ON members (membership_status)")
+
+# External-content FTS5 tables and the triggers that keep them in sync
+SEARCH_TABLES = {
+    'books_fts': ('books', 'book_id', ['title', 'author', 'category', 'isbn'], "unicode61 remove_diacritics 2"),
+    'members_fts': ('members', 'member_id', ['first_name', 'last_name', 'email', 'phone'], "unicode61 remove_diacritics 2"),
+    # Trigram indexes answer substring lookups on identifiers
+    'books_isbn_tri': ('books', 'book_id', ['isbn'], "trigram"),
+    'members_contact_tri': ('members', 'member_id', ['email', 'phone'], "trigram"),
+}
+
+def fts5_available(c):
+    return c.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0] == 1
+
+# Migration 2: full-text search tables for the Search tabs
+def create_search_index(c):
+    if not fts5_available(c):
+        # Search falls back to LIKE queries without FTS5
+        return
+    for name, (table, key, columns, tokenizer) in SEARCH_TABLES.items():
+        cols = ', '.join(columns)
+        new_cols = ', '.join(f"new.{col}" for col in columns)
+        old_cols = ', '.join(f"old.{col}" for col in columns)
+        prefix = ", prefix='2 3'" if tokenizer != 'trigram' else ''
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5({cols}, content='{table}', content_rowid='{key}', tokenize='{tokenizer}'{prefix})")
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {name} (rowid, {cols}) VALUES (new.{key}, {new_cols});
+        END
+        ''')
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {name} ({name}, rowid, {cols}) VALUES ('delete', old.{key}, {old_cols});
+        END
+        ''')
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {name} ({name}, rowid, {cols}) VALUES ('delete', old.{key}, {old_cols});
+            INSERT INTO {name} (rowid, {cols}) VALUES (new.{key}, {new_cols});
+        END
+        ''')
+        c.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+
+# Migration 3: indexes behind the sortable columns of the paged listings
+def create_sort_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_books_author ON books (author)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_books_added_date ON books (added_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_members_last_name ON members (last_name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_members_membership_date ON members (membership_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_loans_due_date ON loans (due_date)")
+
+# Migration 5: last-run bookkeeping for background jobs
+def create_job_runs(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS job_runs (
+        job TEXT PRIMARY KEY,
+        last_run TIMESTAMP,
+        duration REAL,
+        rows_affected INTEGER,
+        error TEXT,
+        runs INTEGER DEFAULT 0
+    )
+    ''')
+
+# Epoch-second default for timestamp columns (CURRENT_TIMESTAMP would store text)
+EPOCH_NOW = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+def _epoch_column(name, default=True, not_null=False):
+    return (f"{name} EPOCH" + (" NOT NULL" if not_null else "") + (f" DEFAULT {EPOCH_NOW}" if default else "")
+            + f" CHECK (typeof({name}) IN ('integer', 'null'))")
+
+# Tables rebuilt by migration 6: table -> (timestamp columns, new column definitions)
+EPOCH_TABLES = {
+    'books': (['added_date'], f'''
+        book_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        isbn TEXT UNIQUE,
+        publication_year INTEGER,
+        category TEXT,
+        status TEXT DEFAULT 'available',
+        shelf_location TEXT,
+        {_epoch_column('added_date')}
+    '''),
+    'members': (['membership_date'], f'''
+        member_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        phone TEXT,
+        address TEXT,
+        {_epoch_column('membership_date')},
+        membership_status TEXT DEFAULT 'active'
+    '''),
+    'loans': (['loan_date', 'due_date', 'return_date'], f'''
+        loan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER,
+        member_id INTEGER,
+        {_epoch_column('loan_date')},
+        {_epoch_column('due_date', default=False, not_null=True)},
+        {_epoch_column('return_date', default=False)},
+        status TEXT DEFAULT 'borrowed',
+        fine_amount REAL DEFAULT 0.00,
+        FOREIGN KEY (book_id) REFERENCES books (book_id),
+        FOREIGN KEY (member_id) REFERENCES members (member_id)
+    '''),
+    'reservations': (['reservation_date', 'expiry_date'], f'''
+        reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER,
+        member_id INTEGER,
+        {_epoch_column('reservation_date')},
+        {_epoch_column('expiry_date', default=False)},
+        status TEXT DEFAULT 'pending',
+        FOREIGN KEY (book_id) REFERENCES books (book_id),
+        FOREIGN KEY (member_id) REFERENCES members (member_id)
+    '''),
+    'job_runs': (['last_run'], f'''
+        job TEXT PRIMARY KEY,
+        {_epoch_column('last_run', default=False)},
+        duration REAL,
+        rows_affected INTEGER,
+        error TEXT,
+        runs INTEGER DEFAULT 0
+    '''),
+}
+
+# Legacy text timestamps that were filled in by DEFAULT CURRENT_TIMESTAMP,
+# which SQLite writes in UTC: (table, column) -> the rows that hold for. The
+# app never set added_date, and set membership_date only for the sample
+# members it seeded. Everything else was written by the app with
+# datetime.now(), in local time.
+UTC_TEXT_COLUMNS = {
+    ('books', 'added_date'): "1",
+    ('members', 'membership_date'): "email NOT IN ('john.doe@example.com', 'jane.smith@example.com', "
+                                    "'bob.johnson@example.com', 'alice.williams@example.com', 'charlie.brown@example.com')",
+}
+
+# Epoch seconds of a legacy text timestamp in the given column
+def _text_to_epoch(table, name):
+    epoch = f"CAST(strftime('%s', {name}, 'utc') AS INTEGER)"
+    if (table, name) in UTC_TEXT_COLUMNS:
+        epoch = f"CASE WHEN {UTC_TEXT_COLUMNS[table, name]} THEN CAST(strftime('%s', {name}) AS INTEGER) ELSE {epoch} END"
+    return f"CASE WHEN typeof({name}) = 'text' THEN {epoch} ELSE {name} END"
+
+# Migration 6: store timestamps as integer epoch seconds instead of
+# '%Y-%m-%d %H:%M:%S' text. SQLite cannot change a column's type or default
+# in place, so each table is copied into a new one and swapped in, and the
+# indexes and triggers dropped with the old tables are recreated. Existing
+# text is read as UTC or local time depending on who wrote the column (see
+# UTC_TEXT_COLUMNS). The <table>_text views keep the old format for ad-hoc
+# queries and external tools.
+def convert_timestamps(c):
+    for table, (date_columns, columns) in EPOCH_TABLES.items():
+        names = [row[1] for row in c.execute(f"PRAGMA table_info({table})")]
+        converted = ', '.join(
+            _text_to_epoch(table, name) if name in date_columns else name
+            for name in names
+        )
+        seq = c.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        c.execute(f"CREATE TABLE {table}_new ({columns})")
+        c.execute(f"INSERT INTO {table}_new ({', '.join(names)}) SELECT {converted} FROM {table}")
+        c.execute(f"DROP TABLE {table}")
+        c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        if seq is not None:
+            # Don't let AUTOINCREMENT hand out the ids of deleted rows again
+            c.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq[0], table))
+        shown = ', '.join(
+            f"datetime({name}, 'unixepoch', 'localtime') AS {name}" if name in date_columns else name
+            for name in names
+        )
+        c.execute(f"CREATE VIEW IF NOT EXISTS {table}_text AS SELECT {shown} FROM {table}")
+    create_indexes(c)
+    create_search_index(c)
+    create_sort_indexes(c)
+    create_stats_schema(c)
+
+# Migration 10: indexes and triggers dropped for a bulk load (see
+# drop_schema). Their definitions are kept in the database, so a load that
+# dies half way cannot lose them.
+def create_dropped_schema(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS dropped_schema (
+        name TEXT PRIMARY KEY,
+        type TEXT NOT NULL,
+        tbl_name TEXT NOT NULL,
+        sql TEXT NOT NULL
+    )
+    ''')
+
+# Drop a table's secondary indexes and triggers for a bulk load, saving
+# them in dropped_schema in the same transaction. Indexes behind UNIQUE
+# constraints have no SQL and stay. Returns the names dropped.
+def drop_schema(c, table):
+    dropped = c.execute("""
+    SELECT type, name, sql FROM sqlite_master
+    WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """, (table,)).fetchall()
+    for kind, name, sql in dropped:
+        c.execute("INSERT OR REPLACE INTO dropped_schema (name, type, tbl_name, sql) VALUES (?, ?, ?, ?)", (name, kind, table, sql))
+        c.execute(f"DROP {kind.upper()} {name}")
+    return [name for kind, name, sql in dropped]
+
+# Recreate whatever drop_schema dropped, then rebuild only what the dropped
+# triggers maintain (search indexes, the tables' counters, category
+# rollups) from the tables, so rows written while they were gone, by the
+# load or by anyone else, are counted. Returns the names restored.
+def restore_schema(c):
+    dropped = c.execute("SELECT type, name, tbl_name, sql FROM dropped_schema").fetchall()
+    existing = {name for (name,) in c.execute("SELECT name FROM sqlite_master")}
+    for kind, name, table, sql in dropped:
+        if name not in existing:
+            c.execute(sql)
+    triggers = {name for kind, name, table, sql in dropped if kind == 'trigger'}
+    tables = {table for kind, name, table, sql in dropped}
+    for name in SEARCH_TABLES:
+        if f"{name}_ai" in triggers:
+            c.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+    stats_tables = {table for table in tables if f"{table}_stats_ai" in triggers}
+    if stats_tables:
+        rebuild_stats(c, stats_tables)
+    if 'books_rollups_au' in triggers:
+        rebuild_rollups(c, ['category'])
+    c.execute("DELETE FROM dropped_schema")
+    for table in sorted(tables):
+        c.execute(f"ANALYZE {table}")
+    return [name for kind, name, table, sql in dropped]
+
+# Migration 11: a write counter per table, bumped by every write queue's
+# commits, so caches in other processes can tell their results went stale
+def create_table_versions(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+
+# Bump the write counters of the tables, inside the writing transaction
+def bump_versions(conn, tables):
+    conn.execute("""
+    INSERT INTO table_versions (name, version) SELECT value, 1 FROM json_each(?) WHERE 1
+    ON CONFLICT (name) DO UPDATE SET version = version + 1
+    """, (json.dumps(sorted(tables)),))
+
+# The tables' write counters, in sorted table order
+def read_versions(conn, tables):
+    versions = dict(conn.execute("SELECT name, version FROM table_versions WHERE name IN (SELECT value FROM json_each(?))",
+                                 (json.dumps(sorted(tables)),)))
+    return tuple(versions.get(table, 0) for table in sorted(tables))
+
+# Schema migrations, applied in order and tracked in PRAGMA user_version
+MIGRATIONS = [
+    (1, create_indexes),
+    (2, create_search_index),
+    (3, create_sort_indexes),
+    (4, create_stats_schema),
+    (5, create_job_runs),
+    (6, convert_timestamps),
+    (7, create_hold_queue),
+    (8, create_loan_rollups),
+    (9, create_fine_ledger),
+    (10, create_dropped_schema),
+    (11, create_table_versions),
+]
+
+# Bring the database up to the latest schema version
+def migrate(conn):
+    c = conn.cursor()
+    applied = False
+    for version, migration in MIGRATIONS:
+        if c.execute("PRAGMA user_version").fetchone()[0] >= version:
+            continue
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the lock
+            if c.execute("PRAGMA user_version").fetchone()[0] < version:
+                migration(c)
+                c.execute(f"PRAGMA user_version = {version}")
+                applied = True
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    # Refresh planner statistics for the new indexes
+    if applied:
+        c.execute("ANALYZE")
+        conn.commit()
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Apply the storage engine settings to a connection
+def configure_connection(conn):
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    for hook in CONNECT_HOOKS:
+        hook(conn)
+    return conn
+
+# Open a raw connection to the library database
+def connect(path=None, isolation_level=''):
+    # Pooled connections may be handed from a finished thread to a new one,
+    # so the same-thread check is enforced by the pool instead of sqlite3.
+    # PARSE_DECLTYPES turns EPOCH columns back into datetimes.
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False, isolation_level=isolation_level,
+                           detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=STATEMENT_CACHE,
+                           factory=CONNECTION_FACTORY)
+    return configure_connection(conn)
+
+# Process-wide pool of thread-bound connections.
+# Each thread keeps its connection for as long as it lives; connections of
+# finished threads (e.g. completed Streamlit reruns) go back to the idle list
+# and are rebound to the next thread that asks, so reruns stop paying for
+# connect/close.
+class ConnectionPool:
+    def __init__(self, path=None, max_size=32):
+        self.path = path or DB_PATH
+        self.max_size = max_size
+        self._lock = threading.Condition()
+        self._local = threading.local()
+        self._bound = {}
+        self._idle = []
+        self._closed = False
+        self.hits = 0
+        self.reuses = 0
+        self.opens = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    # Return the calling thread's connection, binding one if needed
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                self.hits += 1
+            return conn
+
+        thread = threading.current_thread()
+        start = time.perf_counter()
+        with self._lock:
+            waited = False
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                self._reap()
+                if self._idle or len(self._bound) < self.max_size:
+                    break
+                waited = True
+                self._lock.wait(0.05)
+
+            if self._idle:
+                conn = self._idle.pop()
+                self.reuses += 1
+            else:
+                conn = None
+            # Reserve the slot before opening so concurrent callers respect max_size
+            self._bound[thread] = conn
+            if waited:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - start
+
+        if conn is None:
+            try:
+                conn = connect(self.path)
+            except Exception:
+                with self._lock:
+                    del self._bound[thread]
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._bound[thread] = conn
+                self.opens += 1
+
+        self._local.conn = conn
+        return conn
+
+    # Hand the calling thread's connection back to the idle list
+    def release(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._bound.pop(threading.current_thread(), None)
+            self._return(conn)
+            self._lock.notify()
+
+    # Move connections owned by finished threads back to the idle list
+    def _reap(self):
+        dead = [t for t in self._bound if not t.is_alive()]
+        for thread in dead:
+            conn = self._bound.pop(thread)
+            if conn is not None:
+                self._return(conn)
+
+    def _return(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.append(conn)
+
+    def stats(self):
+        with self._lock:
+            self._reap()
+            return {
+                'hits': self.hits,
+                'opens': self.opens,
+                'reuses': self.reuses,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'in_use': len(self._bound),
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            conns = [conn for conn in self._bound.values() if conn is not None] + self._idle
+            self._bound.clear()
+            self._idle = []
+            self._lock.notify_all()
+        for conn in conns:
+            conn.close()
+
+_WRITE_TARGET = re.compile(r"\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+
+# Tables a statement writes to
+def written_tables(sql):
+    return {name.lower() for name in _WRITE_TARGET.findall(sql) if name.upper() != 'SET'}
+
+# Map each table to the tables its triggers write to (transitively)
+def trigger_targets(conn):
+    direct = {}
+    for table, sql in conn.execute("SELECT tbl_name, sql FROM sqlite_master WHERE type = 'trigger'"):
+        body = sql[sql.upper().find(' BEGIN '):]
+        direct.setdefault(table.lower(), set()).update(written_tables(body))
+    targets = {}
+    for table in direct:
+        seen = set()
+        pending = [table]
+        while pending:
+            for target in direct.get(pending.pop(), ()):
+                if target not in seen:
+                    seen.add(target)
+                    pending.append(target)
+        targets[table] = seen
+    return targets
+
+# Tell write listeners that tables changed outside the write queue
+def notify_write(tables, path=None, conn=None):
+    tables = set(tables)
+    if conn is not None:
+        derived = trigger_targets(conn)
+        for table in list(tables):
+            tables |= derived.get(table, set())
+    for listener in WRITE_LISTENERS:
+        listener(path or DB_PATH, tables)
+
+# Connection and cursor wrappers handed to write jobs; they record which
+# tables the job's statements write to so caches can be invalidated
+class TrackedCursor:
+    def __init__(self, cursor, tables):
+        self._cursor = cursor
+        self._tables = tables
+
+    def execute(self, sql, params=()):
+        self._tables |= written_tables(sql)
+        self._cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._tables |= written_tables(sql)
+        self._cursor.executemany(sql, seq_of_params)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TrackedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+        self.tables = set()
+
+    def cursor(self):
+        return TrackedCursor(self._conn.cursor(), self.tables)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+# Retries of BEGIN IMMEDIATE when another process holds the write lock,
+# with exponential backoff starting at BUSY_BACKOFF seconds
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+# Single writer that serializes all writes through one connection.
+# Jobs are callables taking the writer connection; every job queued while the
+# previous commit was in flight is applied in one transaction (group commit),
+# each inside its own savepoint so a failing job does not take the batch down.
+# Jobs must not call commit() or rollback() themselves.
+class WriteQueue:
+    def __init__(self, path=None, max_batch=128):
+        self.path = path or DB_PATH
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self.jobs = 0
+        self.failed = 0
+        self.commits = 0
+        self.largest_batch = 0
+        self.busy_retries = 0
+        # Open the connection before starting the thread: a database that
+        # cannot be opened fails the caller here instead of leaving every
+        # queued job waiting on a writer that never ran
+        conn = connect(self.path, isolation_level=None)
+        try:
+            self._derived = trigger_targets(conn)
+        except Exception:
+            conn.close()
+            raise
+        self._thread = threading.Thread(target=self._run, args=(TrackedConnection(conn),), name='library-writer', daemon=True)
+        self._thread.start()
+
+    # Queue a write job and return a Future for its result
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    # Queue a write job and wait until it has been committed
+    def execute(self, func, *args, **kwargs):
+        return self.submit(func, *args, **kwargs).result()
+
+    def _run(self, conn):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._apply(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _apply(self, conn, batch):
+        batch = [job for job in batch if job[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        conn.tables.clear()
+        outcomes = []
+        try:
+            self._begin(conn)
+            for future, func, args, kwargs in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = func(conn, *args, **kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+                conn.execute("RELEASE job")
+            tables = set(conn.tables)
+            for table in conn.tables:
+                tables |= self._derived.get(table, set())
+            if tables:
+                # Not through the tracked connection: the counters are not data
+                bump_versions(conn._conn, tables)
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for future, func, args, kwargs in batch:
+                future.set_exception(e)
+            self.failed += len(batch)
+            return
+
+        # Invalidate before waking the callers so their next read sees the write
+        for listener in WRITE_LISTENERS:
+            listener(self.path, tables)
+
+        self.commits += 1
+        self.jobs += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                self.failed += 1
+                future.set_exception(error)
+
+    # Take the write lock up front. Another process holding it past
+    # busy_timeout makes BEGIN fail with "database is locked"; back off and
+    # retry rather than failing the whole batch.
+    def _begin(self, conn):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == BUSY_RETRIES or 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                self.busy_retries += 1
+                time.sleep(BUSY_BACKOFF * 2 ** attempt * (1 + random.random()))
+
+    def stats(self):
+        return {
+            'jobs': self.jobs,
+            'failed': self.failed,
+            'commits': self.commits,
+            'avg_batch': self.jobs / self.commits if self.commits else 0.0,
+            'largest_batch': self.largest_batch,
+            'busy_retries': self.busy_retries,
+            'queued': self._queue.qsize(),
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+# Restore indexes and triggers a bulk load dropped and never put back
+# (it crashed or was killed). A load still running in another process
+# carries on with them in place, just more slowly.
+def recover_dropped_schema(conn):
+    if not conn.execute("SELECT 1 FROM dropped_schema LIMIT 1").fetchone():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        restore_schema(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+_pools = {}
+_writers = {}
+_bootstrapped = set()
+_pools_lock = threading.Lock()
+
+# Create the schema and seed data once per process and database file
+def bootstrap(path=None):
+    path = path or DB_PATH
+    if path in _bootstrapped:
+        return
+    with _pools_lock:
+        if path in _bootstrapped:
+            return
+        conn = connect(path)
+        try:
+            # WAL lets readers keep running while the writer commits
+            conn.execute("PRAGMA journal_mode = WAL")
+            init_db(conn)
+            migrate(conn)
+            recover_dropped_schema(conn)
+            add_sample_data(conn)
+        finally:
+            conn.close()
+        _bootstrapped.add(path)
+
+# Return the shared pool for a database file
+def get_pool(path=None):
+    path = path or DB_PATH
+    pool = _pools.get(path)
+    if pool is None:
+        bootstrap(path)
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = ConnectionPool(path)
+    return pool
+
+# Return the calling thread's pooled connection
+def get_connection(path=None):
+    return get_pool(path).connection()
+
+def pool_stats(path=None):
+    return get_pool(path).stats()
+
+# Return the shared writer for a database file
+def get_writer(path=None):
+    path = path or DB_PATH
+    writer = _writers.get(path)
+    if writer is None:
+        bootstrap(path)
+        with _pools_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = _writers[path] = WriteQueue(path)
+    return writer
+
+# Run func(conn, *args) on the writer connection and wait for its commit
+def run_write(func, *args, path=None, **kwargs):
+    return get_writer(path).execute(func, *args, **kwargs)
+
+# Run a single write statement through the writer, returning its row count
+def execute_write(sql, params=(), path=None):
+    return run_write(lambda conn: conn.execute(sql, params).rowcount, path=path)
+
+def writer_stats(path=None):
+    return get_writer(path).stats()
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        writers = list(_writers.values())
+        _pools.clear()
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,365 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import library_db
+
+# Streaming export of the library tables.
+# Rows are pulled with fetchmany and handed out as chunks of encoded bytes as
+# they arrive, so memory stays flat however large the table is. Large tables
+# are cut into key ranges: the first range streams straight out while the
+# others are exported in parallel into part files, each on its own connection,
+# and follow it in order. All ranges read the same snapshot of the database.
+
+FETCH_SIZE = 2000
+# Bytes per chunk when copying a finished part file out
+COPY_SIZE = 1024 * 1024
+# Key span per partition; smaller tables are exported in one pass
+PARTITION_ROWS = 100000
+WORKERS = min(4, os.cpu_count() or 1)
+
+# An exportable dataset: SELECT list and FROM clause, the integer key it is
+# ordered and partitioned by, and (column, type) pairs for typed formats
+class Export:
+    def __init__(self, name, select, source, key, columns):
+        self.name = name
+        self.select = select
+        self.source = source
+        self.key = key
+        self.columns = columns
+        self.table = source.split()[0]
+        self.key_column = key.split('.')[-1]
+
+    def query(self):
+        return f"SELECT {self.select} FROM {self.source} WHERE {self.key} BETWEEN ? AND ? ORDER BY {self.key}"
+
+EXPORTS = {export.name: export for export in [
+    Export(
+        'books',
+        "book_id, title, author, isbn, publication_year, category, status, shelf_location, added_date",
+        "books", "book_id",
+        [('book_id', 'int'), ('title', 'text'), ('author', 'text'), ('isbn', 'text'), ('publication_year', 'int'),
+         ('category', 'text'), ('status', 'text'), ('shelf_location', 'text'), ('added_date', 'timestamp')],
+    ),
+    Export(
+        'members',
+        "member_id, first_name, last_name, email, phone, address, membership_date, membership_status",
+        "members", "member_id",
+        [('member_id', 'int'), ('first_name', 'text'), ('last_name', 'text'), ('email', 'text'), ('phone', 'text'),
+         ('address', 'text'), ('membership_date', 'timestamp'), ('membership_status', 'text')],
+    ),
+    # Full loan history with the book and member it refers to
+    Export(
+        'loans',
+        """l.loan_id, l.book_id, b.title, l.member_id, m.first_name || ' ' || m.last_name,
+           l.loan_date, l.due_date, l.return_date, l.status, l.fine_amount""",
+        """loans l
+        LEFT JOIN books b ON l.book_id = b.book_id
+        LEFT JOIN members m ON l.member_id = m.member_id""",
+        "l.loan_id",
+        [('loan_id', 'int'), ('book_id', 'int'), ('title', 'text'), ('member_id', 'int'), ('member_name', 'text'),
+         ('loan_date', 'timestamp'), ('due_date', 'timestamp'), ('return_date', 'timestamp'), ('status', 'text'),
+         ('fine_amount', 'float')],
+    ),
+    Export(
+        'reservations',
+        "reservation_id, book_id, member_id, reservation_date, expiry_date, status, queue_position",
+        "reservations", "reservation_id",
+        [('reservation_id', 'int'), ('book_id', 'int'), ('member_id', 'int'), ('reservation_date', 'timestamp'),
+         ('expiry_date', 'timestamp'), ('status', 'text'), ('queue_position', 'int')],
+    ),
+]}
+
+def _text_value(value):
+    return '' if value is None else str(value)
+
+# Copy a part file written without a header onto f, a block at a time
+def _copy_part(f, part):
+    with open(part, 'rb') as src:
+        for block in iter(lambda: src.read(COPY_SIZE), b''):
+            f.write(block)
+            yield
+
+# Writers encode batches of rows onto a binary file object. append(part)
+# adds a part file of the same format, yielding after every piece it writes.
+class CsvWriter:
+    def __init__(self, f, columns, header=True):
+        self._f = f
+        self._text = io.TextIOWrapper(f, encoding='utf-8', newline='', write_through=True)
+        self._writer = csv.writer(self._text)
+        if header:
+            self._writer.writerow([name for name, kind in columns])
+
+    def write(self, rows):
+        self._writer.writerows([_text_value(value) for value in row] for row in rows)
+
+    def append(self, part):
+        return _copy_part(self._f, part)
+
+    def close(self):
+        self._text.detach()
+
+class JsonlWriter:
+    def __init__(self, f, columns, header=True):
+        self._f = f
+        self._names = [name for name, kind in columns]
+
+    def write(self, rows):
+        self._f.write(''.join(json.dumps(dict(zip(self._names, row)), default=str) + '\n' for row in rows).encode())
+
+    def append(self, part):
+        return _copy_part(self._f, part)
+
+    def close(self):
+        pass
+
+# Parquet needs pyarrow, which is optional
+class ParquetWriter:
+    def __init__(self, f, columns, header=True):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = {'int': pa.int64(), 'float': pa.float64(), 'text': pa.string(), 'timestamp': pa.timestamp('s')}
+        self._pa = pa
+        self._schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self._writer = pq.ParquetWriter(f, self._schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        arrays = [self._pa.array(values, type=field.type) for values, field in zip(columns, self._schema)]
+        self._writer.write_batch(self._pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+    def append(self, part):
+        import pyarrow.parquet as pq
+        source = pq.ParquetFile(part)
+        for group in range(source.num_row_groups):
+            # Parquet files store second timestamps as milliseconds
+            self._writer.write_table(source.read_row_group(group).cast(self._schema))
+            yield
+
+    def close(self):
+        self._writer.close()
+
+# File object the writers write into; take() hands out what was written since
+class _Chunks(io.RawIOBase):
+    def __init__(self):
+        self._pieces = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._pieces.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def take(self):
+        data = b''.join(self._pieces)
+        self._pieces = []
+        return data
+
+# Readable file object over a chunk iterator, so a consumer that wants a
+# file pulls the export as it reads instead of it being written out first
+class ChunkReader(io.RawIOBase):
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    # Only rewinding an unread stream is allowed
+    def seek(self, offset, whence=io.SEEK_SET):
+        if (offset, whence) == (0, io.SEEK_SET) and self._pos == 0:
+            return 0
+        raise io.UnsupportedOperation("export streams can only be read once")
+
+    def readinto(self, b):
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b''
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        self._pos += n
+        return n
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close:
+            close()
+        super().close()
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'parquet': ParquetWriter}
+
+MIME_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson', 'parquet': 'application/vnd.apache.parquet'}
+
+# Guess the format from a file name
+def detect_format(name):
+    ext = os.path.splitext(name.lower())[1]
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'csv'
+
+# Key ranges covering the dataset, about PARTITION_ROWS keys each
+def partitions(conn, export, workers=WORKERS):
+    low, high = conn.execute(f"SELECT MIN({export.key_column}), MAX({export.key_column}) FROM {export.table}").fetchone()
+    if low is None:
+        return []
+    parts = max(1, min(workers, -(-(high - low + 1) // PARTITION_ROWS)))
+    step = -(-(high - low + 1) // parts)
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+# Statement that makes a read transaction take its snapshot
+PIN_SNAPSHOT = "SELECT COUNT(*) FROM sqlite_master"
+
+# Open read transactions on one snapshot of the database for exporting a
+# dataset, one connection per key range. Yields (ranges, connections).
+# The connections of a partitioned export begin their reads while the write
+# lock is held, so no commit can land between them and every range sees the
+# same rows.
+@contextmanager
+def read_snapshot(export, path=None, workers=WORKERS):
+    library_db.bootstrap(path)
+    conns = [library_db.connect(path)]
+    try:
+        conns[0].execute("BEGIN")
+        ranges = partitions(conns[0], export, workers)
+        if len(ranges) > 1:
+            lock = library_db.connect(path)
+            try:
+                lock.execute("BEGIN IMMEDIATE")
+                # Start the first read again under the lock
+                conns[0].rollback()
+                conns[0].execute("BEGIN")
+                ranges = partitions(conns[0], export, workers)
+                for _ in ranges[1:]:
+                    conn = library_db.connect(path)
+                    conns.append(conn)
+                    conn.execute("BEGIN")
+                    conn.execute(PIN_SNAPSHOT).fetchone()
+            finally:
+                lock.rollback()
+                lock.close()
+        yield ranges or [(0, -1)], conns
+    finally:
+        for conn in conns:
+            conn.rollback()
+            conn.close()
+
+# Rows of one key range of a dataset, in batches
+def _batches(export, conn, key_range, batch_size=FETCH_SIZE, progress=None):
+    cursor = conn.execute(export.query(), key_range)
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                return
+            yield batch
+            if progress:
+                progress(len(batch))
+    finally:
+        cursor.close()
+
+# Write one key range of a dataset into an open binary file
+def export_range(export, fmt, f, conn, key_range, header=True, batch_size=FETCH_SIZE, progress=None):
+    writer = WRITERS[fmt](f, export.columns, header)
+    rows = 0
+    try:
+        for batch in _batches(export, conn, key_range, batch_size, progress):
+            writer.write(batch)
+            rows += len(batch)
+    finally:
+        writer.close()
+    return rows
+
+# Export a dataset as an iterator of byte chunks, one per batch of rows.
+# progress, if given, is called with the number of rows in every batch
+# written (from several threads when the export is partitioned, while the
+# batch's read is still open, so it must not use the export's connections).
+def export_chunks(name, fmt='csv', path=None, workers=WORKERS, batch_size=FETCH_SIZE, progress=None):
+    export = EXPORTS[name]
+    sink = _Chunks()
+    with read_snapshot(export, path, workers) as (ranges, conns):
+        with tempfile.TemporaryDirectory(prefix=f'library-export-{name}-') as tmp:
+            part_files = [os.path.join(tmp, f"part-{i:04d}") for i in range(1, len(ranges))]
+
+            def run(i):
+                with open(part_files[i], 'wb') as part:
+                    return export_range(export, fmt, part, conns[i + 1], ranges[i + 1], False, batch_size, progress)
+
+            with ThreadPoolExecutor(max_workers=max(1, len(part_files)), thread_name_prefix='library-export') as pool:
+                parts = [pool.submit(run, i) for i in range(len(part_files))]
+                writer = WRITERS[fmt](sink, export.columns)
+                for batch in _batches(export, conns[0], ranges[0], batch_size, progress):
+                    writer.write(batch)
+                    yield sink.take()
+                for future, part in zip(parts, part_files):
+                    future.result()
+                    for _ in writer.append(part):
+                        yield sink.take()
+                writer.close()
+                yield sink.take()
+
+# Export a dataset to a binary file object, returning the number of rows.
+# progress is called under a lock, one batch at a time, so it may keep a
+# running total without locking of its own.
+def export_to(name, f, fmt='csv', path=None, workers=WORKERS, batch_size=FETCH_SIZE, progress=None):
+    rows = [0]
+    lock = threading.Lock()
+
+    def count(n):
+        with lock:
+            rows[0] += n
+            if progress:
+                progress(n)
+
+    for chunk in export_chunks(name, fmt, path, workers, batch_size, count):
+        f.write(chunk)
+    return rows[0]
+
+# Export a dataset to a file path
+def export_file(name, out, fmt=None, path=None, workers=WORKERS, progress=None):
+    with open(out, 'wb') as f:
+        return export_to(name, f, fmt or detect_format(out), path, workers, progress=progress)
+
+# A dataset as a readable file object that exports as it is read, for
+# handing to a download button
+def export_stream(name, fmt='csv', path=None):
+    return ChunkReader(export_chunks(name, fmt, path))
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='library_export.py', description='Export a library table to CSV, JSON Lines or Parquet.')
+    parser.add_argument('dataset', choices=sorted(EXPORTS))
+    parser.add_argument('out')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='output format (default: from the file extension)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='parallel partitions for large tables')
+    args = parser.parse_args(argv[1:])
+
+    written = [0]
+
+    def report(rows):
+        written[0] += rows
+        print(f"\r{written[0]} rows", end='', flush=True)
+
+    rows = export_file(args.dataset, args.out, args.format, workers=args.workers, progress=report)
+    print(f"\r{rows} rows written to {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
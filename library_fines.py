@@ -0,0 +1,94 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+LOCAL_TZ = tzlocal()
+DAY = np.timedelta64(1, 'D')
+
+# How overdue loans are charged.
+# daily_rate applies to every category not listed in category_rates; the first
+# grace_days overdue days are free, and max_fine (if set) caps a single loan.
+class FinePolicy:
+    def __init__(self, daily_rate=0.50, category_rates=None, grace_days=0, max_fine=None):
+        self.daily_rate = daily_rate
+        self.category_rates = dict(category_rates or {})
+        self.grace_days = grace_days
+        self.max_fine = max_fine
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        return cls(
+            daily_rate=config.get('daily_rate', 0.50),
+            category_rates=config.get('category_rates'),
+            grace_days=config.get('grace_days', 0),
+            max_fine=config.get('max_fine'),
+        )
+
+    # Daily rate for each category in an array-like
+    def rates(self, categories, size):
+        if categories is None or not self.category_rates:
+            return np.full(size, self.daily_rate, dtype=float)
+        return pd.Series(categories, dtype=object).map(self.category_rates).fillna(self.daily_rate).to_numpy(dtype=float)
+
+# Policy from the JSON file named by LIBRARY_FINE_POLICY, else $0.50/day flat
+def load_policy():
+    path = os.environ.get('LIBRARY_FINE_POLICY')
+    return FinePolicy.from_json(path) if path else FinePolicy()
+
+DEFAULT_POLICY = load_policy()
+
+# Parse stored timestamps into local datetime64; None becomes NaT.
+# Accepts epoch seconds (as stored), datetimes (as read back through the
+# EPOCH converter) and legacy '%Y-%m-%d %H:%M:%S' strings.
+def to_datetimes(values):
+    if isinstance(values, (str, datetime, int, float)) or values is None:
+        values = [values]
+    series = pd.Series(values, dtype=object).infer_objects()
+    if pd.api.types.is_numeric_dtype(series):
+        local = pd.to_datetime(series, unit='s', utc=True).dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+        return local.to_numpy(dtype='datetime64[s]')
+    if series.isna().all():
+        return np.full(len(series), np.datetime64('NaT'), dtype='datetime64[s]')
+    return pd.to_datetime(series).to_numpy(dtype='datetime64[s]')
+
+# Compute whole days overdue and fines for a batch of loans at once.
+# due_dates and returned_at are array-likes of timestamps; a missing return
+# (None) or no returned_at at all means "as of now". Returns two numpy arrays:
+# days overdue (int) and fines (float).
+def compute_fines(due_dates, returned_at=None, categories=None, policy=None, now=None):
+    policy = policy or DEFAULT_POLICY
+    due = to_datetimes(due_dates)
+    as_of = np.datetime64((now or datetime.now()).replace(microsecond=0), 's')
+    if returned_at is None:
+        end = np.full(due.shape, as_of)
+    else:
+        end = to_datetimes(returned_at)
+        end = np.where(np.isnat(end), as_of, end)
+
+    late = np.where(np.isnat(due), np.timedelta64(0, 's'), end - due)
+    days = np.maximum(late // DAY, 0).astype(np.int64)
+    chargeable = np.maximum(days - policy.grace_days, 0)
+    fines = chargeable * policy.rates(categories, len(due))
+    if policy.max_fine is not None:
+        fines = np.minimum(fines, policy.max_fine)
+    return days, np.round(fines, 2)
+
+# Add "days overdue" and "fine" columns to a DataFrame of loans
+def add_fine_columns(df, due_col, return_col=None, category_col=None, policy=None, now=None,
+                     days_col='Days Overdue', fine_col='Fine Amount'):
+    days, fines = compute_fines(
+        df[due_col],
+        df[return_col] if return_col else None,
+        df[category_col] if category_col else None,
+        policy,
+        now,
+    )
+    df[days_col] = days
+    df[fine_col] = fines
+    return df
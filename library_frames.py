@@ -0,0 +1,115 @@
+import pandas as pd
+
+import library_cache
+from library_profile import phase
+
+# Cursor-to-DataFrame helpers for the app's listings and reports.
+# Column names come from cursor.description, so queries name their columns
+# with SQL aliases (SELECT b.title AS "Book Title") instead of the caller
+# keeping a parallel list of labels; rows from the service layer are
+# namedtuples and their field names become the labels. Rows are fetched in batches and
+# transposed into columns as they arrive, and each column becomes one typed
+# Series; status and category columns are categorical. With arrow=True the
+# batches are built into Arrow arrays and the frame is Arrow-backed.
+
+FETCH_SIZE = 2000
+
+# Column names ending in one of these are low-cardinality labels
+CATEGORICAL = ('status', 'category')
+
+# How field names are spelled in column labels
+ACRONYMS = {'id': 'ID', 'isbn': 'ISBN'}
+SMALL_WORDS = {'of', 'in', 'by', 'for'}
+
+def column_names(cursor):
+    return [column[0] for column in cursor.description]
+
+def is_categorical(name):
+    return name.lower().endswith(CATEGORICAL)
+
+def _series(name, values, categorical):
+    series = pd.Series(values, name=name)
+    if categorical and is_categorical(name):
+        series = series.astype('category')
+    return series
+
+# DataFrame from column value lists, one typed Series per column
+def columns_frame(names, columns, categorical=True):
+    if not names:
+        return pd.DataFrame()
+    return pd.concat([_series(name, values, categorical) for name, values in zip(names, columns)], axis=1)
+
+# DataFrame from rows that were already fetched (e.g. from the query cache)
+def rows_frame(rows, names, categorical=True):
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    return columns_frame(names, columns, categorical)
+
+# Column label for a field name: loan_id -> "Loan ID", place_in_line -> "Place in Line"
+def label(field):
+    words = field.split('_')
+    return ' '.join(ACRONYMS.get(word) or (word if i and word in SMALL_WORDS else word.capitalize())
+                    for i, word in enumerate(words))
+
+# DataFrame from namedtuple rows (the service layer's), with labelled columns
+def named_frame(rows, row_type, categorical=True):
+    with phase('frame', f"named_frame({row_type.__name__})"):
+        return rows_frame(rows, [label(field) for field in row_type._fields], categorical)
+
+def _arrow_table(batches, names):
+    import pyarrow as pa
+    tables = [pa.Table.from_arrays([pa.array(values) for values in zip(*batch)], names=names) for batch in batches]
+    if not tables:
+        return pa.Table.from_arrays([pa.array([], pa.null()) for _ in names], names=names)
+    # A column that is all NULL in one batch is typed null there
+    return pa.concat_tables(tables, promote_options='permissive')
+
+def _arrow_frame(table, categorical):
+    import pyarrow.compute as pc
+    if categorical:
+        for i, name in enumerate(table.column_names):
+            if is_categorical(name):
+                table = table.set_column(i, name, pc.dictionary_encode(table.column(i)))
+    # Dictionary columns become pandas categoricals, the rest stay Arrow-backed
+    return table.to_pandas(types_mapper=lambda dtype: None if hasattr(dtype, 'index_type') else pd.ArrowDtype(dtype))
+
+def _batches(cursor, batch_size):
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+# Read everything a cursor returns into one DataFrame
+def cursor_frame(cursor, batch_size=FETCH_SIZE, categorical=True, arrow=False):
+    names = column_names(cursor)
+    try:
+        if arrow:
+            return _arrow_frame(_arrow_table(_batches(cursor, batch_size), names), categorical)
+        columns = [[] for _ in names]
+        for batch in _batches(cursor, batch_size):
+            for column, values in zip(columns, zip(*batch)):
+                column.extend(values)
+        return columns_frame(names, columns, categorical)
+    finally:
+        cursor.close()
+
+def query_frame(conn, sql, params=(), **options):
+    return cursor_frame(conn.execute(sql, params), **options)
+
+# Yield a large result as DataFrames of at most chunk_size rows
+def iter_frames(conn, sql, params=(), chunk_size=50000, categorical=True, arrow=False):
+    cursor = conn.execute(sql, params)
+    names = column_names(cursor)
+    try:
+        for batch in _batches(cursor, chunk_size):
+            if arrow:
+                yield _arrow_frame(_arrow_table([batch], names), categorical)
+            else:
+                yield rows_frame(batch, names, categorical)
+    finally:
+        cursor.close()
+
+# query_frame through the query cache
+def cached_frame(conn, sql, params=(), ttl=None, categorical=True):
+    names, rows = library_cache.cached_query(conn, sql, params, ttl, with_names=True)
+    return rows_frame(rows, names, categorical)
@@ -0,0 +1,195 @@
+import json
+from datetime import datetime, timedelta
+
+# Hold queue for books that are out.
+# Each book has an ordered queue of pending holds (queue_position, served by
+# the partial index idx_reservations_queue). When a copy comes back, the first
+# pending hold in line becomes 'ready' and the book is kept 'reserved' for
+# that member until they check it out or the pickup window lapses.
+#
+# Hold statuses: pending (in the queue), ready (book held for pickup),
+# fulfilled (checked out), cancelled, expired.
+
+HOLD_STATUSES = ["pending", "ready", "fulfilled", "cancelled", "expired"]
+
+# Days a member has to collect a book held for them
+PICKUP_DAYS = 3
+EXPIRY_BATCH = 500
+
+# Migration 7: queue positions for reservations
+def create_hold_queue(c):
+    c.execute("ALTER TABLE reservations ADD COLUMN queue_position INTEGER")
+    # Existing holds queue up in the order they were made
+    c.execute("""
+    UPDATE reservations SET queue_position = (
+        SELECT COUNT(*) FROM reservations r
+        WHERE r.book_id = reservations.book_id AND r.reservation_id <= reservations.reservation_id
+    )
+    """)
+    # 'fulfilled' used to mean "book held for the member"
+    c.execute("""
+    UPDATE reservations SET status = 'ready'
+    WHERE status = 'fulfilled' AND book_id IN (SELECT book_id FROM books WHERE status = 'reserved')
+    """)
+    # Next in line for a book
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_queue ON reservations (book_id, queue_position) WHERE status = 'pending'")
+    # Holds that can still lapse (expiry sweep)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_expiry ON reservations (expiry_date) WHERE status IN ('pending', 'ready')")
+
+# Write job: add a member to the back of a book's queue.
+# Only books that are out (on loan or held for someone) can be queued for,
+# and only by active members; the checks run in the same transaction as the
+# insert. Returns the hold as a dict with its place in line, or with
+# 'message' when the hold was refused.
+def place_hold(conn, book_id, member_id, expiry_date, now=None):
+    now = (now or datetime.now()).replace(microsecond=0)
+    result = {'book_id': book_id, 'member_id': member_id, 'ok': False}
+    book = conn.execute("SELECT status FROM books WHERE book_id = ?", (book_id,)).fetchone()
+    member = conn.execute("SELECT membership_status FROM members WHERE member_id = ?", (member_id,)).fetchone()
+    if book is None:
+        result['message'] = "book not found"
+        return result
+    if member is None:
+        result['message'] = "member not found"
+        return result
+    if member[0] != 'active':
+        result['message'] = f"member is {member[0]}"
+        return result
+    if book[0] not in ('borrowed', 'reserved'):
+        result['message'] = f"book is {book[0]}"
+        return result
+    held = conn.execute("""
+    SELECT status FROM reservations
+    WHERE book_id = ? AND member_id = ? AND status IN ('pending', 'ready')
+    """, (book_id, member_id)).fetchone()
+    if held is not None:
+        result['message'] = f"member already has a {held[0]} hold on this book"
+        return result
+    reservation_id, position = conn.execute("""
+    INSERT INTO reservations (book_id, member_id, reservation_date, expiry_date, status, queue_position)
+    SELECT ?, ?, ?, ?, 'pending', IFNULL(MAX(queue_position), 0) + 1
+    FROM reservations WHERE book_id = ? AND status = 'pending'
+    RETURNING reservation_id, queue_position
+    """, (book_id, member_id, now, expiry_date, book_id)).fetchone()
+    result.update(ok=True, reservation_id=reservation_id, place=queue_place(conn, reservation_id))
+    return result
+
+# 1-based place in line of a pending hold, or None
+def queue_place(conn, reservation_id):
+    row = conn.execute("""
+    SELECT COUNT(*) FROM reservations r
+    JOIN reservations me ON me.reservation_id = ? AND me.status = 'pending'
+    WHERE r.book_id = me.book_id AND r.status = 'pending' AND r.queue_position <= me.queue_position
+    """, (reservation_id,)).fetchone()
+    return row[0] or None
+
+# Pending holds of a book in queue order
+def hold_queue(conn, book_id):
+    return conn.execute("""
+    SELECT r.reservation_id, m.first_name || ' ' || m.last_name, r.reservation_date, r.expiry_date
+    FROM reservations r
+    JOIN members m ON r.member_id = m.member_id
+    WHERE r.book_id = ? AND r.status = 'pending'
+    ORDER BY r.queue_position
+    """, (book_id,)).fetchall()
+
+# Write job: hand returned books to the next member in line.
+# For each book the first live pending hold becomes 'ready' and the book
+# 'reserved'; books nobody is waiting for become 'available'. Returns the set
+# of book_ids that were held for someone.
+def release_books(conn, book_ids, now=None):
+    now = (now or datetime.now()).replace(microsecond=0)
+    books = json.dumps(sorted(set(book_ids)))
+    promoted = {book_id for (book_id,) in conn.execute("""
+    UPDATE reservations SET status = 'ready', expiry_date = ?
+    WHERE reservation_id IN (
+        SELECT (
+            SELECT r.reservation_id FROM reservations r
+            WHERE r.book_id = j.value AND r.status = 'pending'
+              AND (r.expiry_date IS NULL OR r.expiry_date >= ?)
+            ORDER BY r.queue_position
+            LIMIT 1
+        )
+        FROM json_each(?) j
+    )
+    RETURNING book_id
+    """, (now + timedelta(days=PICKUP_DAYS), now, books))}
+    conn.execute("""
+    UPDATE books
+    SET status = CASE WHEN book_id IN (SELECT value FROM json_each(?)) THEN 'reserved' ELSE 'available' END
+    WHERE book_id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(sorted(promoted)), books))
+    return promoted
+
+# Write job: mark a member's ready hold on a book as collected
+def fulfil_hold(conn, book_id, member_id):
+    conn.execute("""
+    UPDATE reservations SET status = 'fulfilled'
+    WHERE book_id = ? AND member_id = ? AND status = 'ready'
+    """, (book_id, member_id))
+
+# Write job: change a hold's status by hand. A ready hold that is dropped
+# passes the book on to the next in line. Marking a hold ready holds the
+# book only if it is on the shelf; while it is out on loan (or held for
+# someone else) the hold stays queued until the return promotes it. A hold
+# put back in the queue joins the back of it. Returns the status the hold
+# ended up with, or None when there is no such hold.
+def set_hold_status(conn, reservation_id, new_status):
+    row = conn.execute("SELECT book_id, status FROM reservations WHERE reservation_id = ?", (reservation_id,)).fetchone()
+    if row is None:
+        return None
+    book_id, old_status = row
+    if new_status == old_status:
+        return old_status
+    if new_status == 'ready':
+        held = conn.execute("UPDATE books SET status = 'reserved' WHERE book_id = ? AND status = 'available'", (book_id,)).rowcount
+        if not held:
+            new_status = 'pending'
+    if new_status == 'pending' and old_status != 'pending':
+        conn.execute("""
+        UPDATE reservations SET status = 'pending', queue_position = (
+            SELECT IFNULL(MAX(queue_position), 0) + 1 FROM reservations WHERE book_id = ? AND status = 'pending'
+        )
+        WHERE reservation_id = ?
+        """, (book_id, reservation_id))
+    else:
+        conn.execute("UPDATE reservations SET status = ? WHERE reservation_id = ?", (new_status, reservation_id))
+    if old_status == 'ready' and new_status != 'fulfilled':
+        release_books(conn, [book_id])
+    return new_status
+
+# Write job: delete a hold, passing its book on if it was being held
+def delete_hold(conn, reservation_id):
+    set_hold_status(conn, reservation_id, 'cancelled')
+    conn.execute("DELETE FROM reservations WHERE reservation_id = ?", (reservation_id,))
+
+# Write job: expire one batch of lapsed holds in one set-based UPDATE.
+# Books whose ready hold lapsed go to the next member in line.
+def expire_holds_batch(conn, now, batch_size):
+    lapsed = conn.execute("""
+    SELECT reservation_id, book_id, status
+    FROM reservations INDEXED BY idx_reservations_expiry
+    WHERE status IN ('pending', 'ready') AND expiry_date < ?
+    LIMIT ?
+    """, (now, batch_size)).fetchall()
+    if not lapsed:
+        return 0
+    conn.execute("""
+    UPDATE reservations SET status = 'expired'
+    WHERE reservation_id IN (SELECT value FROM json_each(?))
+    """, (json.dumps([reservation_id for reservation_id, book_id, status in lapsed]),))
+    held = [book_id for reservation_id, book_id, status in lapsed if status == 'ready']
+    if held:
+        release_books(conn, held, now)
+    return len(lapsed)
+
+# Expire lapsed holds in small write batches
+def sweep_holds(path=None, batch_size=EXPIRY_BATCH):
+    import library_db
+    now = datetime.now().replace(microsecond=0)
+    total = 0
+    while True:
+        expired = library_db.run_write(expire_holds_batch, now, batch_size, path=path)
+        total += expired
+        if expired < batch_size:
+            return total
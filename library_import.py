@@ -0,0 +1,306 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+import library_db
+
+# Streaming catalog import.
+# Readers turn CSV, JSON Lines or MARC 21 files into dicts one record at a
+# time, rows are validated and written in batches through the writer, and
+# books that already exist (same ISBN) are updated instead of duplicated.
+
+BATCH_SIZE = 5000
+# Inputs larger than this are loaded with the books indexes dropped
+BULK_BYTES = 5 * 1024 * 1024
+# Rejected rows kept for the report
+MAX_ERRORS = 100
+
+# Statuses a book may be imported with (the app's BOOK_STATUSES)
+STATUSES = ('available', 'borrowed', 'reserved', 'lost')
+
+# Accepted column names -> books column
+FIELDS = {
+    'title': 'title',
+    'author': 'author',
+    'authors': 'author',
+    'isbn': 'isbn',
+    'isbn13': 'isbn',
+    'isbn10': 'isbn',
+    'publication_year': 'publication_year',
+    'year': 'publication_year',
+    'published': 'publication_year',
+    'category': 'category',
+    'genre': 'category',
+    'subject': 'category',
+    'status': 'status',
+    'shelf_location': 'shelf_location',
+    'shelf': 'shelf_location',
+    'location': 'shelf_location',
+}
+
+COLUMNS = ['title', 'author', 'isbn', 'publication_year', 'category', 'status', 'shelf_location']
+
+_ISBN = re.compile(r"^(?:\d{9}[\dX]|\d{13})$")
+_YEAR = re.compile(r"\d{4}")
+
+# Raised for a row that cannot be imported
+class RowError(ValueError):
+    pass
+
+def _text(stream):
+    # Uploaded files are binary; the readers below want text
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+def read_csv(stream):
+    for record in csv.DictReader(_text(stream)):
+        yield record
+
+# Readers yield a RowError in place of a record they cannot decode, so one
+# bad record is rejected instead of ending the import
+def read_jsonl(stream):
+    for line in _text(stream):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield RowError(f"invalid JSON: {e}")
+
+def _subfields(data):
+    # Data fields: two indicator bytes, then \x1f-prefixed subfields
+    codes = {}
+    for part in data[2:].split(b'\x1f')[1:]:
+        if part:
+            codes.setdefault(chr(part[0]), part[1:].decode('utf-8', 'replace').strip())
+    return codes
+
+# Map one ISO 2709 (MARC 21) record to book fields
+def parse_marc(record):
+    base = int(record[12:17])
+    directory = record[24:base - 1]
+    fields = {}
+    for i in range(0, len(directory) - 11, 12):
+        tag = directory[i:i + 3].decode('ascii', 'replace')
+        length = int(directory[i + 3:i + 7])
+        start = int(directory[i + 7:i + 12])
+        data = record[base + start:base + start + length].rstrip(b'\x1e')
+        if tag >= '010':
+            fields.setdefault(tag, _subfields(data))
+
+    def first(*paths):
+        for tag, code in paths:
+            value = fields.get(tag, {}).get(code)
+            if value:
+                return value
+        return None
+
+    title = first(('245', 'a'))
+    subtitle = first(('245', 'b'))
+    if title and subtitle:
+        title = f"{title.rstrip(' :;/')}: {subtitle}"
+    year = first(('264', 'c'), ('260', 'c'))
+    isbn = first(('020', 'a'))
+    return {
+        'title': title.rstrip(' /:;,.') if title else None,
+        'author': (first(('100', 'a'), ('110', 'a'), ('700', 'a')) or '').rstrip(' ,.') or None,
+        'isbn': isbn.split()[0] if isbn else None,
+        'publication_year': _YEAR.search(year).group() if year and _YEAR.search(year) else None,
+        'category': (first(('650', 'a'), ('655', 'a')) or '').rstrip(' .') or None,
+        'shelf_location': first(('852', 'h')),
+    }
+
+def read_marc(stream):
+    buffer = b''
+    while True:
+        chunk = stream.read(65536)
+        if not chunk:
+            break
+        buffer += chunk
+        *records, buffer = buffer.split(b'\x1d')
+        for record in records:
+            if record.strip():
+                yield _parse_marc(record.lstrip())
+    if buffer.strip():
+        yield _parse_marc(buffer.lstrip())
+
+def _parse_marc(record):
+    try:
+        return parse_marc(record)
+    except ValueError as e:
+        return RowError(f"invalid MARC record: {e}")
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'marc': read_marc}
+
+# Guess the format from a file name
+def detect_format(name):
+    ext = os.path.splitext(name.lower())[1]
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if ext in ('.mrc', '.marc'):
+        return 'marc'
+    return 'csv'
+
+# Validate one input record and return the books row as a tuple
+def clean_row(record):
+    if isinstance(record, RowError):
+        raise record
+    if not isinstance(record, dict):
+        raise RowError("record is not an object")
+    row = {}
+    for name, value in record.items():
+        column = FIELDS.get(str(name).strip().lower().replace(' ', '_'))
+        if column and column not in row:
+            value = str(value).strip() if value is not None else ''
+            row[column] = value or None
+    if not row.get('title'):
+        raise RowError("title is required")
+    if not row.get('author'):
+        raise RowError("author is required")
+
+    if row.get('isbn'):
+        isbn = re.sub(r"[\s-]", '', row['isbn']).upper()
+        if not _ISBN.match(isbn):
+            raise RowError(f"invalid ISBN {row['isbn']!r}")
+        row['isbn'] = isbn
+
+    if row.get('publication_year'):
+        try:
+            year = int(float(row['publication_year']))
+        except ValueError:
+            raise RowError(f"invalid publication year {row['publication_year']!r}")
+        if not 0 < year <= datetime.now().year + 1:
+            raise RowError(f"publication year {year} out of range")
+        row['publication_year'] = year
+
+    status = (row.get('status') or 'available').lower()
+    if status not in STATUSES:
+        raise RowError(f"invalid status {row['status']!r}")
+    row['status'] = status
+    return tuple(row.get(column) for column in COLUMNS)
+
+# Outcome of an import
+class ImportResult:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, number, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((number, message))
+
+    def as_dict(self):
+        return {'read': self.read, 'inserted': self.inserted, 'updated': self.updated, 'rejected': self.rejected}
+
+# Write job: upsert one batch of rows, returning (inserted, updated).
+# Books are matched on ISBN; an existing book keeps its status and any field
+# the import leaves empty.
+def upsert_books(conn, rows):
+    isbns = [row[2] for row in rows if row[2]]
+    existing = {isbn for (isbn,) in conn.execute(
+        "SELECT isbn FROM books WHERE isbn IN (SELECT value FROM json_each(?))", (json.dumps(isbns),))}
+    conn.executemany("""
+    INSERT INTO books (title, author, isbn, publication_year, category, status, shelf_location)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (isbn) DO UPDATE SET
+        title = excluded.title,
+        author = excluded.author,
+        publication_year = IFNULL(excluded.publication_year, publication_year),
+        category = IFNULL(excluded.category, category),
+        shelf_location = IFNULL(excluded.shelf_location, shelf_location)
+    """, rows)
+    # Repeats of an ISBN within the batch update the row inserted first
+    seen = set(existing)
+    updated = 0
+    for isbn in isbns:
+        if isbn in seen:
+            updated += 1
+        seen.add(isbn)
+    return len(rows) - updated, updated
+
+# Write job: drop the secondary indexes and triggers on books. The ISBN
+# unique index stays; the upserts need it. The definitions are saved in the
+# database (see library_db.drop_schema), and the next bootstrap puts them
+# back if the import never gets to.
+def drop_book_indexes(conn):
+    return library_db.drop_schema(conn, 'books')
+
+# Write job: recreate what drop_book_indexes dropped and rebuild the search
+# indexes, counters and rollups the dropped triggers would have maintained
+def restore_book_indexes(conn):
+    return library_db.restore_schema(conn)
+
+# Import books from a file-like object.
+# Rows are written BATCH_SIZE at a time through the writer; progress, if
+# given, is called with the running ImportResult after every batch. With
+# drop_indexes the books indexes and triggers are dropped for the load and
+# rebuilt once at the end, which is much faster for large files.
+def import_books(stream, fmt='csv', path=None, batch_size=BATCH_SIZE, drop_indexes=False, progress=None):
+    result = ImportResult()
+    records = enumerate(READERS[fmt](stream), start=1)
+    dropped = library_db.run_write(drop_book_indexes, path=path) if drop_indexes else None
+    try:
+        while True:
+            chunk = list(itertools.islice(records, batch_size))
+            if not chunk:
+                break
+            batch = []
+            for number, record in chunk:
+                result.read += 1
+                try:
+                    batch.append(clean_row(record))
+                except RowError as e:
+                    result.reject(number, str(e))
+            if batch:
+                inserted, updated = library_db.run_write(upsert_books, batch, path=path)
+                result.inserted += inserted
+                result.updated += updated
+            if progress:
+                progress(result)
+    finally:
+        if dropped is not None:
+            library_db.run_write(restore_book_indexes, path=path)
+    return result
+
+# Whether a load of this many bytes should drop the indexes first
+def is_bulk(size):
+    return size is not None and size >= BULK_BYTES
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='library_import.py', description='Import books from CSV, JSON Lines or MARC 21 files.')
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=sorted(READERS), help='input format (default: from the file extension)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--drop-indexes', choices=['auto', 'yes', 'no'], default='auto',
+                        help=f'drop the books indexes during the load (auto: files over {BULK_BYTES // (1024 * 1024)} MB)')
+    args = parser.parse_args(argv[1:])
+
+    fmt = args.format or detect_format(args.file)
+    drop = args.drop_indexes == 'yes' or (args.drop_indexes == 'auto' and is_bulk(os.path.getsize(args.file)))
+
+    def report(result):
+        print(f"\r{result.read} read, {result.inserted} inserted, {result.updated} updated, {result.rejected} rejected", end='', flush=True)
+
+    with open(args.file, 'rb') as f:
+        result = import_books(f, fmt, batch_size=args.batch_size, drop_indexes=drop, progress=report)
+    report(result)
+    print()
+    for number, message in result.errors:
+        print(f"record {number}: {message}")
+    if result.rejected > len(result.errors):
+        print(f"... and {result.rejected - len(result.errors)} more rejected")
+    return 1 if result.rejected else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
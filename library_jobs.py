@@ -0,0 +1,225 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import library_db
+from library_analytics import take_snapshot, enabled as analytics_enabled, SNAPSHOT_INTERVAL
+from library_holds import sweep_holds
+
+SWEEP_BATCH = 500
+
+# numpy and the fine engine (pandas) are imported by the sweep itself, so
+# importing this module to start the scheduler stays cheap
+
+# Registered background jobs: name -> (func(path), interval in seconds)
+JOBS = {}
+
+def register_job(name, func, interval):
+    JOBS[name] = (func, interval)
+
+def _check_job(name):
+    if name not in JOBS:
+        raise KeyError(f"no job named {name!r}")
+
+# Write job: mark one batch of borrowed loans past due as overdue, accruing their fines
+def mark_overdue_batch(conn, now, batch_size):
+    rows = conn.execute("""
+    SELECT l.loan_id, l.due_date, b.category
+    FROM loans l INDEXED BY idx_loans_borrowed_due
+    LEFT JOIN books b ON l.book_id = b.book_id
+    WHERE l.status = 'borrowed' AND l.due_date < ?
+    LIMIT ?
+    """, (now, batch_size)).fetchall()
+    if not rows:
+        return 0
+    from library_fines import compute_fines
+    loan_ids, due_dates, categories = zip(*rows)
+    days, fines = compute_fines(due_dates, categories=categories, now=now)
+    conn.executemany("UPDATE loans SET status = 'overdue', fine_amount = ? WHERE loan_id = ?",
+                     zip(fines.tolist(), loan_ids))
+    return len(rows)
+
+# Write job: bring the fines of one batch of overdue loans up to date.
+# Walks idx_loans_open_due in (due_date, loan_id) order starting after `after`;
+# returns (rows updated, key to continue from or None when done). The
+# redundant IN term lets the partial index's WHERE clause match.
+def accrue_fines_batch(conn, now, after, batch_size):
+    rows = conn.execute("""
+    SELECT l.due_date, l.loan_id, l.fine_amount, b.category
+    FROM loans l INDEXED BY idx_loans_open_due
+    LEFT JOIN books b ON l.book_id = b.book_id
+    WHERE l.status IN ('borrowed', 'overdue') AND l.status = 'overdue'
+      AND (l.due_date, l.loan_id) > (?, ?)
+    ORDER BY l.due_date, l.loan_id
+    LIMIT ?
+    """, (after[0], after[1], batch_size)).fetchall()
+    if not rows:
+        return 0, None
+    import numpy as np
+    from library_fines import compute_fines
+    due_dates, loan_ids, current, categories = zip(*rows)
+    days, fines = compute_fines(due_dates, categories=categories, now=now)
+    changed = np.flatnonzero(np.asarray(current, dtype=float) != fines)
+    conn.executemany("UPDATE loans SET fine_amount = ? WHERE loan_id = ?",
+                     [(float(fines[i]), loan_ids[i]) for i in changed])
+    last = (due_dates[-1], loan_ids[-1])
+    return len(changed), last if len(rows) == batch_size else None
+
+# Mark overdue loans and accrue fines in small write batches, so checkouts
+# queued on the writer are never stuck behind one long UPDATE
+def sweep_overdue(path=None, batch_size=SWEEP_BATCH):
+    now = datetime.now().replace(microsecond=0)
+    total = 0
+    while True:
+        marked = library_db.run_write(mark_overdue_batch, now, batch_size, path=path)
+        total += marked
+        if marked < batch_size:
+            break
+    after = (0, 0)
+    while after is not None:
+        updated, after = library_db.run_write(accrue_fines_batch, now, after, batch_size, path=path)
+        total += updated
+    return total
+
+register_job('overdue_sweep', sweep_overdue, 300)
+register_job('hold_expiry', sweep_holds, 300)
+if analytics_enabled():
+    register_job('analytics_snapshot', take_snapshot, SNAPSHOT_INTERVAL)
+
+# Write job: record the outcome of a job run
+def record_run(conn, job, started_at, duration, rows_affected, error):
+    conn.execute("""
+    INSERT INTO job_runs (job, last_run, duration, rows_affected, error, runs)
+    VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT (job) DO UPDATE SET
+        last_run = excluded.last_run, duration = excluded.duration,
+        rows_affected = excluded.rows_affected, error = excluded.error, runs = runs + 1
+    """, (job, started_at, duration, rows_affected, error))
+
+# Run one job now and record its run
+def run_job(name, path=None):
+    func, interval = JOBS[name]
+    started_at = datetime.now()
+    start = time.perf_counter()
+    rows, error = 0, None
+    try:
+        rows = func(path)
+    except Exception as e:
+        error = str(e)
+    library_db.run_write(record_run, name, started_at, time.perf_counter() - start, rows, error, path=path)
+    if error is not None:
+        raise RuntimeError(f"Job {name} failed: {error}")
+    return rows
+
+def last_runs(conn):
+    return conn.execute("SELECT job, last_run, duration, rows_affected, error, runs FROM job_runs ORDER BY job").fetchall()
+
+# Background thread that runs every registered job on its interval.
+# trigger(name) runs a job on demand without waiting for its next slot and
+# returns a Future for the rows it affects.
+class Scheduler:
+    def __init__(self, path=None):
+        self.path = path
+        self._wake = threading.Event()
+        self._stop = False
+        self._lock = threading.Lock()
+        self._requested = {}
+        self._next_run = {name: 0.0 for name in JOBS}
+        self._thread = threading.Thread(target=self._run, name='library-jobs', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def trigger(self, name):
+        _check_job(name)
+        future = Future()
+        with self._lock:
+            self._requested.setdefault(name, []).append(future)
+        self._wake.set()
+        return future
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop:
+            now = time.monotonic()
+            with self._lock:
+                requested = self._requested
+                self._requested = {}
+            due = set(requested)
+            for name in JOBS:
+                self._next_run.setdefault(name, 0.0)
+                if self._next_run[name] <= now:
+                    due.add(name)
+            for name in sorted(due):
+                waiting = requested.get(name, [])
+                try:
+                    rows = run_job(name, self.path)
+                except Exception as e:
+                    # The failure is recorded in job_runs; keep the other jobs going
+                    for future in waiting:
+                        future.set_exception(e)
+                else:
+                    for future in waiting:
+                        future.set_result(rows)
+                finally:
+                    # Failed runs wait for their next slot too; a job
+                    # unregistered meanwhile is not rescheduled
+                    if name in JOBS:
+                        self._next_run[name] = time.monotonic() + JOBS[name][1]
+                    else:
+                        self._next_run.pop(name, None)
+            timeout = max(0.0, min(self._next_run.values()) - time.monotonic()) if self._next_run else None
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# Start the process-wide scheduler unless LIBRARY_JOBS=off (e.g. when a
+# separate `python library_jobs.py worker` process runs the jobs)
+def start_scheduler():
+    global _scheduler
+    if os.environ.get('LIBRARY_JOBS', 'on') == 'off':
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler().start()
+    return _scheduler
+
+# Run a job on demand: through the scheduler when one runs in this process,
+# otherwise inline. Returns a Future for the rows the job affects.
+def trigger_job(name):
+    _check_job(name)
+    if _scheduler is not None:
+        return _scheduler.trigger(name)
+    future = Future()
+    try:
+        future.set_result(run_job(name))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def main(argv):
+    if len(argv) >= 3 and argv[1] == 'run':
+        print(f"{argv[2]}: {run_job(argv[2])} rows")
+        return 0
+    if len(argv) == 2 and argv[1] == 'worker':
+        Scheduler().start().join()
+        return 0
+    print("usage: python library_jobs.py run <job> | worker")
+    print("jobs: " + ', '.join(sorted(JOBS)))
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,192 @@
+import sys
+from datetime import datetime
+
+# Fine ledger behind the Fine Collection report.
+# fine_ledger is append-only: every fine assessed on a returned loan and every
+# payment is an entry, in integer cents. Corrections are new entries (a loan
+# whose fine or return date changes gets a reversal and a new assessment), so
+# the ledger always sums to the fines on the loans.
+#
+# fine_daily keeps, per member and per local day (an integer like 20240131),
+# the day's totals and the running totals up to and including that day.
+# member_id 0 holds the library-wide totals. The totals of any window are
+# then the difference of two running totals, each one index seek away.
+# Triggers on loans and on the ledger keep both tables current.
+
+KINDS = ['assessment', 'payment']
+
+# member_id of the library-wide rows in fine_daily
+ALL_MEMBERS = 0
+
+def _cents(amount):
+    return f"CAST(ROUND(IFNULL({amount}, 0) * 100) AS INTEGER)"
+
+def _day(moment):
+    return f"CAST(strftime('%Y%m%d', {moment}, 'unixepoch', 'localtime') AS INTEGER)"
+
+# A loan's fine counts once it has been returned, on its return date
+def _assess(row, sign):
+    return f"""
+            INSERT INTO fine_ledger (entry_date, member_id, loan_id, kind, amount_cents)
+            SELECT {row}.return_date, IFNULL({row}.member_id, -1), {row}.loan_id, 'assessment', {sign}{_cents(f'{row}.fine_amount')}
+            WHERE {row}.return_date IS NOT NULL AND {_cents(f'{row}.fine_amount')} != 0;"""
+
+# Add a ledger entry to one member's (or the library's) daily running totals
+def _post(member):
+    assessed = "CASE WHEN new.kind = 'assessment' THEN new.amount_cents ELSE 0 END"
+    paid = "CASE WHEN new.kind = 'payment' THEN new.amount_cents ELSE 0 END"
+    day = _day('new.entry_date')
+    before = f"FROM fine_daily WHERE member_id = {member} AND day < {day} ORDER BY day DESC LIMIT 1"
+    return f"""
+            INSERT INTO fine_daily (member_id, day, assessed, paid, cum_assessed, cum_paid)
+            VALUES ({member}, {day}, {assessed}, {paid},
+                    IFNULL((SELECT cum_assessed {before}), 0) + {assessed},
+                    IFNULL((SELECT cum_paid {before}), 0) + {paid})
+            ON CONFLICT (member_id, day) DO UPDATE SET
+                assessed = assessed + excluded.assessed, paid = paid + excluded.paid,
+                cum_assessed = cum_assessed + excluded.assessed, cum_paid = cum_paid + excluded.paid;
+            UPDATE fine_daily SET cum_assessed = cum_assessed + {assessed}, cum_paid = cum_paid + {paid}
+            WHERE member_id = {member} AND day > {day};"""
+
+# Migration 9: the fine ledger, backfilled from the fines on returned loans
+def create_fine_ledger(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS fine_ledger (
+        entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entry_date EPOCH NOT NULL CHECK (typeof(entry_date) = 'integer'),
+        member_id INTEGER NOT NULL,
+        loan_id INTEGER,
+        kind TEXT NOT NULL CHECK (kind IN ('assessment', 'payment')),
+        amount_cents INTEGER NOT NULL
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS fine_daily (
+        member_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        assessed INTEGER NOT NULL DEFAULT 0,
+        paid INTEGER NOT NULL DEFAULT 0,
+        cum_assessed INTEGER NOT NULL DEFAULT 0,
+        cum_paid INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (member_id, day)
+    ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fine_ledger_loan ON fine_ledger (loan_id)")
+    backfill_ledger(c)
+    changed = "old.return_date IS NOT new.return_date OR old.member_id IS NOT new.member_id OR new.return_date IS NOT NULL AND old.fine_amount IS NOT new.fine_amount"
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_ledger_ai AFTER INSERT ON loans BEGIN {_assess('new', '')} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_ledger_ad AFTER DELETE ON loans BEGIN {_assess('old', '-')} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_ledger_au AFTER UPDATE OF return_date, fine_amount, member_id ON loans WHEN {changed} BEGIN {_assess('old', '-')}{_assess('new', '')} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS fine_ledger_ai AFTER INSERT ON fine_ledger BEGIN {_post('new.member_id')}{_post(ALL_MEMBERS)} END")
+    # Entries are never changed or removed
+    c.execute("CREATE TRIGGER IF NOT EXISTS fine_ledger_au BEFORE UPDATE ON fine_ledger BEGIN SELECT RAISE(ABORT, 'fine_ledger is append-only'); END")
+    c.execute("CREATE TRIGGER IF NOT EXISTS fine_ledger_ad BEFORE DELETE ON fine_ledger BEGIN SELECT RAISE(ABORT, 'fine_ledger is append-only'); END")
+
+# Assess the fines of every returned loan, for a ledger started on existing
+# loans (the loans triggers take over from there), and total them by day
+def backfill_ledger(c):
+    c.execute("""
+    INSERT INTO fine_ledger (entry_date, member_id, loan_id, kind, amount_cents)
+    SELECT return_date, IFNULL(member_id, -1), loan_id, 'assessment', {cents}
+    FROM loans WHERE return_date IS NOT NULL AND {cents} != 0
+    ORDER BY return_date, loan_id
+    """.format(cents=_cents('fine_amount')))
+    rebuild_fine_daily(c)
+
+# Daily and running totals recomputed from the ledger
+DAILY_TOTALS = f"""
+    WITH days AS (
+        SELECT member_id, day,
+               SUM(CASE WHEN kind = 'assessment' THEN amount_cents ELSE 0 END) AS assessed,
+               SUM(CASE WHEN kind = 'payment' THEN amount_cents ELSE 0 END) AS paid
+        FROM (
+            SELECT member_id, {_day('entry_date')} AS day, kind, amount_cents FROM fine_ledger
+            UNION ALL
+            SELECT {ALL_MEMBERS}, {_day('entry_date')}, kind, amount_cents FROM fine_ledger
+        )
+        GROUP BY member_id, day
+    )
+    SELECT member_id, day, assessed, paid,
+           SUM(assessed) OVER (PARTITION BY member_id ORDER BY day),
+           SUM(paid) OVER (PARTITION BY member_id ORDER BY day)
+    FROM days
+    ORDER BY member_id, day
+    """
+
+def actual_daily(c):
+    return c.execute(DAILY_TOTALS).fetchall()
+
+def rebuild_fine_daily(c):
+    c.execute("DELETE FROM fine_daily")
+    return c.execute(f"INSERT INTO fine_daily (member_id, day, assessed, paid, cum_assessed, cum_paid) {DAILY_TOTALS}").rowcount
+
+# Check the ledger against the loans and the daily totals against the ledger.
+# Returns a list of problems, empty when everything adds up.
+def verify_ledger(conn):
+    problems = [
+        f"loan {loan_id}: ledger {ledger} cents, loan {fine} cents"
+        for loan_id, ledger, fine in conn.execute(f"""
+        SELECT loan_id, SUM(ledger), SUM(fine) FROM (
+            SELECT loan_id, amount_cents AS ledger, 0 AS fine FROM fine_ledger WHERE kind = 'assessment'
+            UNION ALL
+            SELECT loan_id, 0, {_cents('fine_amount')} FROM loans WHERE return_date IS NOT NULL
+        )
+        GROUP BY loan_id
+        HAVING SUM(ledger) != SUM(fine)
+        """)
+    ]
+    stored = {row[:2]: row[2:] for row in conn.execute("SELECT member_id, day, assessed, paid, cum_assessed, cum_paid FROM fine_daily")}
+    actual = {row[:2]: row[2:] for row in actual_daily(conn)}
+    for member_id, day in sorted(set(stored) | set(actual)):
+        if stored.get((member_id, day)) != actual.get((member_id, day)):
+            problems.append(f"member {member_id} day {day}: stored {stored.get((member_id, day))}, actual {actual.get((member_id, day))}")
+    return problems
+
+# Running totals at the end of day ?2 minus those before day ?1, in cents
+def _window(member):
+    def total(column):
+        at = f"SELECT {column} FROM fine_daily WHERE member_id = {member} AND day {{}} ORDER BY day DESC LIMIT 1"
+        return f"IFNULL(({at.format('<= ?2')}), 0) - IFNULL(({at.format('< ?1')}), 0)"
+    return f"{total('cum_assessed')} AS assessed, {total('cum_paid')} AS paid"
+
+# (member_id, assessed, paid) for every member with fines or payments in the
+# window; member_id ALL_MEMBERS is the library total
+WINDOW_TOTALS = f"""
+SELECT member_id, assessed, paid FROM (
+    SELECT m.member_id, {_window('m.member_id')}
+    FROM (SELECT DISTINCT member_id FROM fine_daily) m
+)
+WHERE assessed != 0 OR paid != 0
+"""
+
+# Library-wide (assessed, paid) cents between two days, inclusive
+def window_totals(conn, start, end):
+    return conn.execute(f"SELECT {_window(ALL_MEMBERS)}", (start, end)).fetchone()
+
+# Write job: record a fine payment by a member, in dollars
+def record_payment(conn, member_id, amount, now=None):
+    now = (now or datetime.now()).replace(microsecond=0)
+    return conn.execute("""
+    INSERT INTO fine_ledger (entry_date, member_id, loan_id, kind, amount_cents)
+    VALUES (?, ?, NULL, 'payment', ?)
+    RETURNING entry_id
+    """, (now, member_id, round(amount * 100))).fetchone()[0]
+
+def main(argv):
+    import library_db
+    command = argv[1] if len(argv) > 1 else 'verify'
+    if command == 'rebuild':
+        print(f"Rebuilt {library_db.run_write(rebuild_fine_daily)} daily rows")
+    elif command == 'verify':
+        problems = verify_ledger(library_db.get_connection())
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} problems")
+        return 1 if problems else 0
+    else:
+        print("usage: python library_ledger.py [verify|rebuild]")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,22 @@
+import importlib
+
+# Pages of the Streamlit app, in sidebar order: title -> module.
+# Each page is a module with a show() function and is imported the first
+# time it is shown, so the app starts without loading what other pages need.
+
+PAGES = {
+    "Dashboard": "dashboard",
+    "Books": "books",
+    "Members": "members",
+    "Loans": "loans",
+    "Reservations": "reservations",
+    "Reports": "reports",
+}
+
+# Pages listed only when asked for (see library_app)
+HIDDEN_PAGES = {
+    "Diagnostics": "diagnostics",
+}
+
+def load(title):
+    return importlib.import_module(f"{__name__}.{PAGES.get(title) or HIDDEN_PAGES[title]}")
@@ -0,0 +1,119 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+
+from library_import import import_books, detect_format, is_bulk
+from library_frames import named_frame
+from library_services import Book
+from library_pages.common import BOOK_STATUSES, BOOK_CATEGORIES, book_repo, show_paged_listing
+
+def show():
+    st.title("Books Management")
+    
+    # Create tabs
+    tab1, tab2, tab3, tab4 = st.tabs(["View Books", "Add Book", "Search Books", "Import Books"])
+    
+    with tab1:
+        st.subheader("All Books")
+        books = show_paged_listing(book_repo, {"Status": BOOK_STATUSES, "Category": BOOK_CATEGORIES})
+        
+        if books:
+            # Book actions
+            st.subheader("Book Actions")
+            book_id = st.number_input("Enter Book ID", min_value=1, step=1)
+            action = st.selectbox("Select Action", ["Update Status", "Edit Book", "Delete Book"])
+            
+            if action == "Update Status":
+                new_status = st.selectbox("New Status", BOOK_STATUSES)
+                if st.button("Update Status"):
+                    book_repo.set_status(book_id, new_status)
+                    st.success(f"Book status updated to {new_status}")
+                    st.rerun()
+            
+            elif action == "Edit Book":
+                # Get current book details
+                book = book_repo.get(book_id)
+                
+                if book:
+                    title = st.text_input("Title", book.title)
+                    author = st.text_input("Author", book.author)
+                    isbn = st.text_input("ISBN", book.isbn)
+                    pub_year = st.number_input("Publication Year", value=book.publication_year, min_value=1000, max_value=datetime.now().year)
+                    category = st.text_input("Category", book.category)
+                    shelf = st.text_input("Shelf Location", book.shelf_location)
+                    
+                    if st.button("Update Book"):
+                        book_repo.update(book_id, title, author, isbn, pub_year, category, shelf)
+                        st.success("Book updated successfully!")
+                        st.rerun()
+                else:
+                    st.error("Book not found!")
+            
+            elif action == "Delete Book":
+                if st.button("Delete Book"):
+                    # Refused if the book is currently borrowed
+                    if book_repo.delete(book_id):
+                        st.success("Book deleted successfully!")
+                        st.rerun()
+                    else:
+                        st.error("Cannot delete book that is currently borrowed!")
+        else:
+            st.info("No books in the database. Add some books!")
+    
+    with tab2:
+        st.subheader("Add New Book")
+        
+        title = st.text_input("Title")
+        author = st.text_input("Author")
+        isbn = st.text_input("ISBN")
+        pub_year = st.number_input("Publication Year", min_value=1000, max_value=datetime.now().year, value=2023)
+        category = st.selectbox("Category", BOOK_CATEGORIES)
+        status = st.selectbox("Status", BOOK_STATUSES)
+        shelf = st.text_input("Shelf Location")
+        
+        if st.button("Add Book"):
+            if title and author:
+                book_repo.add(title, author, isbn, pub_year, category, status, shelf)
+                st.success("Book added successfully!")
+                st.rerun()
+            else:
+                st.error("Title and Author are required!")
+    
+    with tab3:
+        st.subheader("Search Books")
+        
+        search_option = st.selectbox("Search by", ["All Fields", "Title", "Author", "ISBN", "Category"])
+        search_term = st.text_input("Enter search term", help='Words match as prefixes. Use "quotes" for phrases and author:name to target a field.')
+        
+        if st.button("Search"):
+            if search_term:
+                field = None if search_option == "All Fields" else search_option
+                results = book_repo.search(search_term, field)
+                
+                if results:
+                    results_df = named_frame(results, Book)
+                    st.dataframe(results_df)
+                else:
+                    st.info("No books found matching your search criteria.")
+            else:
+                st.error("Please enter a search term!")
+
+    with tab4:
+        st.subheader("Import Books")
+        st.caption("CSV or JSON Lines with title, author, isbn, publication_year, category, status and shelf_location fields, or MARC 21 (.mrc). Books whose ISBN already exists are updated.")
+
+        uploaded = st.file_uploader("Catalog file", type=["csv", "jsonl", "ndjson", "json", "mrc", "marc"])
+
+        if uploaded is not None and st.button("Import"):
+            bar = st.progress(0.0, text="Importing...")
+
+            def show_progress(result):
+                bar.progress(min(uploaded.tell() / max(uploaded.size, 1), 1.0),
+                             text=f"{result.read} read, {result.inserted} inserted, {result.updated} updated, {result.rejected} rejected")
+
+            result = import_books(uploaded, detect_format(uploaded.name), drop_indexes=is_bulk(uploaded.size), progress=show_progress)
+            bar.progress(1.0, text="Done")
+            st.success(f"Imported {result.inserted} new and {result.updated} updated books from {result.read} records.")
+            if result.errors:
+                st.warning(f"{result.rejected} records were rejected.")
+                st.dataframe(pd.DataFrame(result.errors, columns=["Record", "Error"]))
@@ -0,0 +1,85 @@
+import streamlit as st
+
+from library_profile import Timed, phase
+from library_services import BookRepository, MemberRepository, LoanService, ReservationService, ReportService
+
+# Shared by the app's pages: choices, the services the pages read and write
+# through, and the widgets more than one page uses. Pages import pandas and
+# plotly only when they draw something, so opening a page costs what that
+# page renders.
+
+BOOK_STATUSES = ["available", "borrowed", "reserved", "lost"]
+BOOK_CATEGORIES = ["Fiction", "Non-Fiction", "Mystery", "Science Fiction", "Fantasy", "Biography", "History", "Romance", "Self-Help", "Other"]
+MEMBER_STATUSES = ["active", "expired", "suspended"]
+LOAN_STATUSES = ["borrowed", "returned", "overdue"]
+# Report periods, in days (None for all time)
+REPORT_PERIODS = {"Last 7 Days": 7, "Last 30 Days": 30, "Last 90 Days": 90, "Last 365 Days": 365, "All Time": None}
+
+# Data access for the pages; the SQL lives in library_services. Calls are
+# timed as SQL when the page is being profiled (see library_profile).
+book_repo = Timed(BookRepository(), 'sql')
+member_repo = Timed(MemberRepository(), 'sql')
+loan_service = Timed(LoanService(), 'sql')
+hold_service = Timed(ReservationService(), 'sql')
+report_service = Timed(ReportService(), 'sql')
+
+# Function to calculate fine for a single loan (uses the batch fine engine and policy)
+def calculate_fine(due_date, return_date=None, category=None):
+    from library_fines import compute_fines
+    days, fines = compute_fines([due_date], [return_date], [category])
+    return float(fines[0])
+
+# Draw a plotly express chart, e.g. plot("bar", df, x=..., y=...).
+# plotly is imported by the first chart a process draws.
+def plot(kind, *args, **kwargs):
+    with phase('plotly', f"px.{kind}"):
+        import plotly.express as px
+        figure = getattr(px, kind)(*args, **kwargs)
+    st.plotly_chart(figure)
+
+# CSV download of a report table (reports are small aggregates, built in memory)
+def download_report(df, name):
+    with phase('serialize', f"to_csv({name})"):
+        data = df.to_csv(index=False)
+    st.download_button("Download CSV", data, file_name=f"{name}.csv", mime="text/csv", on_click="ignore", key=f"download_{name}")
+
+# Render one page of a listing with sort, filter and paging controls
+def show_paged_listing(service, filter_options):
+    listing = service.listing
+    col1, col2, col3 = st.columns(3)
+    sorts = list(listing.sorts)
+    sort = col1.selectbox("Sort by", sorts, index=sorts.index(listing.default_sort), key=f"{listing.name}_sort")
+    order = col2.selectbox("Order", ["Ascending", "Descending"], index=1 if listing.default_descending else 0, key=f"{listing.name}_order")
+    page_size = col3.selectbox("Rows per page", [25, 50, 100, 250], index=1, key=f"{listing.name}_page_size")
+    descending = order == "Descending"
+    
+    filters = {}
+    for col, (label, options) in zip(st.columns(len(filter_options)), filter_options.items()):
+        choice = col.selectbox(f"Filter by {label}", ["All"] + options, key=f"{listing.name}_filter_{label}")
+        filters[label] = None if choice == "All" else choice
+    
+    # Start again from the first page whenever the query changes
+    pages_key = f"{listing.name}_pages"
+    query = (sort, descending, page_size, tuple(filters.items()))
+    if st.session_state.get(f"{pages_key}_query") != query:
+        st.session_state[f"{pages_key}_query"] = query
+        st.session_state[pages_key] = [None]
+    cursors = st.session_state[pages_key]
+    
+    from library_frames import named_frame
+    rows, next_cursor = service.page(sort, descending, filters, page_size, cursors[-1])
+    if rows:
+        st.dataframe(named_frame(rows, service.row_type))
+    
+    count, exact = service.count(filters)
+    pages = max(1, -(-count // page_size))
+    approx = "" if exact else "~"
+    nav1, nav2, nav3 = st.columns([1, 1, 4])
+    if nav1.button("Previous", disabled=len(cursors) == 1, key=f"{listing.name}_prev"):
+        cursors.pop()
+        st.rerun()
+    if nav2.button("Next", disabled=next_cursor is None, key=f"{listing.name}_next"):
+        cursors.append(next_cursor)
+        st.rerun()
+    nav3.caption(f"Page {len(cursors)} of {approx}{pages:,} · {approx}{count:,} rows")
+    return rows
@@ -0,0 +1,58 @@
+import streamlit as st
+import pandas as pd
+
+from library_stats import reconcile
+from library_frames import named_frame
+from library_services import RecentLoan
+from library_pages.common import loan_service, report_service, plot
+
+def show():
+    st.title("Library Management System - Dashboard")
+    
+    # Create columns for stats
+    col1, col2, col3, col4 = st.columns(4)
+    
+    # Get stats from the trigger-maintained counters
+    books_by_status = report_service.counters('books_status')
+    
+    col1.metric("Total Books", report_service.total('books'))
+    col2.metric("Available Books", books_by_status.get('available', 0))
+    col3.metric("Total Members", report_service.total('members'))
+    col4.metric("Active Loans", report_service.counters('loans_status').get('borrowed', 0))
+    
+    # Recent activities
+    st.subheader("Recent Activities")
+    
+    # Recent loans
+    recent = loan_service.recent()
+    if recent:
+        loans_df = named_frame(recent, RecentLoan)
+        st.write("Recent Loans")
+        st.dataframe(loans_df)
+    
+    # Books by category chart
+    category_data = sorted(report_service.counters('books_category').items(), key=lambda item: item[1], reverse=True)
+    if category_data:
+        category_df = pd.DataFrame(category_data, columns=["Category", "Count"])
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("Books by Category")
+            plot("pie", category_df, values='Count', names='Category', hole=0.4)
+        
+        # Books by status
+        status_df = pd.DataFrame(sorted(books_by_status.items()), columns=["Status", "Count"])
+        
+        with col2:
+            st.subheader("Books by Status")
+            plot("bar", status_df, x='Status', y='Count', color='Status')
+    
+    with st.expander("Counter maintenance"):
+        if st.button("Verify and repair counters"):
+            drift = reconcile()
+            if drift:
+                st.warning(f"Rebuilt counters after finding {len(drift)} out of date")
+                st.dataframe(pd.DataFrame(drift, columns=["Counter", "Key", "Stored", "Actual"]))
+            else:
+                st.success("All counters match the tables.")
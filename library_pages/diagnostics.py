@@ -0,0 +1,59 @@
+import streamlit as st
+
+from library_trace import SLOW_MS, get_tracer
+from library_pages.common import plot
+
+ORDERS = {
+    "Total time": "total_ms",
+    "Calls": "calls",
+    "Slowest call": "max_ms",
+    "95th percentile": "p95_ms",
+    "Lock wait": "lock_ms",
+    "Rows": "rows",
+}
+
+def show():
+    st.title("Diagnostics")
+
+    tracer = get_tracer()
+    if tracer is None:
+        st.info("Query tracing is off. Start the app with LIBRARY_QUERY_TRACE=1 to time every SQL statement "
+                f"and log the ones slower than LIBRARY_SLOW_MS ({SLOW_MS:.0f} ms).")
+        return
+
+    tab1, tab2 = st.tabs(["Statements", "Slow Queries"])
+
+    with tab1:
+        col1, col2 = st.columns(2)
+        order = col1.selectbox("Order by", list(ORDERS))
+        top_n = col2.selectbox("Show", [10, 20, 50, 100], index=1)
+
+        statements = tracer.top(top_n, ORDERS[order])
+        if statements:
+            ms = st.column_config.NumberColumn(format="%.2f")
+            st.dataframe(statements, column_config={
+                "statement": st.column_config.TextColumn("Statement", width="large"),
+                "total_ms": ms, "mean_ms": ms, "p50_ms": ms, "p95_ms": ms, "max_ms": ms, "lock_ms": ms,
+            })
+
+            selected = st.selectbox("Statement", [s["statement"] for s in statements], format_func=lambda s: s[:150])
+            histogram = tracer.histogram(selected)
+            plot("bar", x=[label for label, count in histogram], y=[count for label, count in histogram],
+                 labels={"x": "Latency", "y": "Calls"}, title="Latency Histogram")
+            st.write("Query plan")
+            st.code("\n".join(tracer.plan(selected)) or "No plan for this statement.")
+        else:
+            st.write("No statements recorded yet.")
+
+        if st.button("Reset statistics"):
+            tracer.reset()
+            st.rerun()
+
+    with tab2:
+        st.caption(f"Statements slower than {tracer.slow_ms:.0f} ms since the app started, newest first."
+                   + (f" All of them are also logged to {tracer.log_path}." if tracer.log_path else ""))
+        slow = tracer.slow_queries()
+        if slow:
+            st.dataframe([{**entry, "plan": " | ".join(entry["plan"]), "findings": "; ".join(entry["findings"])} for entry in slow])
+        else:
+            st.write("No slow statements so far.")
@@ -0,0 +1,196 @@
+import streamlit as st
+from datetime import datetime, timedelta
+
+from library_jobs import trigger_job, last_runs
+from library_pages.common import LOAN_STATUSES, book_repo, member_repo, loan_service, calculate_fine, show_paged_listing
+
+def show():
+    st.title("Loans Management")
+    
+    # Create tabs
+    tab1, tab2, tab3, tab4 = st.tabs(["View Loans", "Issue Loan", "Return Book", "Batch Desk"])
+    
+    with tab1:
+        st.subheader("All Loans")
+        
+        loans = show_paged_listing(loan_service, {"Status": LOAN_STATUSES})
+        
+        # Overdue loans are marked by the background sweep; show when it last ran
+        sweep = [run for run in last_runs(loan_service.conn) if run[0] == 'overdue_sweep']
+        col1, col2 = st.columns([3, 1])
+        if sweep:
+            col1.caption(f"Overdue sweep last ran {sweep[0][1]} ({sweep[0][3]} loans updated)")
+        if col2.button("Run overdue sweep now"):
+            try:
+                with st.spinner("Running overdue sweep..."):
+                    trigger_job('overdue_sweep').result()
+            except RuntimeError as e:
+                st.error(str(e))
+            else:
+                st.rerun()
+        
+        if loans:
+            # Loan actions
+            st.subheader("Loan Actions")
+            loan_id = st.number_input("Enter Loan ID", min_value=1, step=1)
+            action = st.selectbox("Select Action", ["View Details", "Update Status"])
+            
+            if action == "View Details":
+                loan = loan_service.details(loan_id)
+                
+                if loan:
+                    st.write(f"**Loan ID:** {loan.loan_id}")
+                    st.write(f"**Book:** {loan.title} by {loan.author}")
+                    st.write(f"**Member:** {loan.member}")
+                    st.write(f"**Loan Date:** {loan.loan_date}")
+                    st.write(f"**Due Date:** {loan.due_date}")
+                    st.write(f"**Return Date:** {loan.return_date if loan.return_date else 'Not returned yet'}")
+                    st.write(f"**Status:** {loan.status}")
+                    st.write(f"**Fine Amount:** ${loan.fine_amount:.2f}")
+                    
+                    # Calculate current fine if overdue
+                    if loan.status in ('borrowed', 'overdue') and loan.due_date < datetime.now():
+                        current_fine = calculate_fine(loan.due_date, category=loan.category)
+                        st.write(f"**Current Fine (if returned now):** ${current_fine:.2f}")
+                else:
+                    st.error("Loan not found!")
+            
+            elif action == "Update Status":
+                new_status = st.selectbox("New Status", LOAN_STATUSES)
+                if st.button("Update Status"):
+                    loan_service.set_status(loan_id, new_status)
+                    st.success(f"Loan status updated to {new_status}")
+                    st.rerun()
+        else:
+            st.info("No loans in the database.")
+    
+    with tab2:
+        st.subheader("Issue New Loan")
+        
+        # Get available books, and books on the hold shelf (checkout only lends
+        # those to the member they are held for)
+        available_books = book_repo.lendable()
+        
+        # Get active members
+        active_members = member_repo.active()
+        
+        if available_books and active_members:
+            book_options = {f"{book.book_id}: {book.title}" + (f" (held for {book.held_for})" if book.held_for else ""): book.book_id for book in available_books}
+            member_options = {f"{member.member_id}: {member.name}": member.member_id for member in active_members}
+            
+            selected_book = st.selectbox("Select Book", list(book_options.keys()))
+            selected_member = st.selectbox("Select Member", list(member_options.keys()))
+            
+            loan_days = st.number_input("Loan Period (days)", min_value=1, max_value=30, value=14)
+            loan_date = datetime.now()
+            due_date = loan_date + timedelta(days=loan_days)
+            
+            st.write(f"Loan Date: {loan_date.strftime('%Y-%m-%d')}")
+            st.write(f"Due Date: {due_date.strftime('%Y-%m-%d')}")
+            
+            if st.button("Issue Loan"):
+                book_id = book_options[selected_book]
+                member_id = member_options[selected_member]
+                
+                # The book may have been lent elsewhere since this page loaded
+                result = loan_service.checkout(book_id, member_id, loan_days)
+                if result['ok']:
+                    st.success("Loan issued successfully!")
+                    st.rerun()
+                else:
+                    st.error(f"Could not issue the loan: {result['message']}.")
+        else:
+            if not available_books:
+                st.error("No available books for loan!")
+            if not active_members:
+                st.error("No active members to issue loans to!")
+    
+    with tab3:
+        st.subheader("Return Book")
+        
+        # Get active loans
+        active_loans = loan_service.open_loans()
+        
+        if active_loans:
+            loan_options = {f"{loan.loan_id}: {loan.book_title} - {loan.member} (Due: {loan.due_date})": loan for loan in active_loans}
+            
+            selected_loan = st.selectbox("Select Loan to Return", list(loan_options.keys()))
+            loan = loan_options[selected_loan]
+            return_date = datetime.now()
+            
+            # Calculate fine if overdue
+            fine = calculate_fine(loan.due_date, category=loan.category)
+            
+            st.write(f"Return Date: {return_date.strftime('%Y-%m-%d')}")
+            if fine > 0:
+                st.warning(f"This book is overdue! Fine amount: ${fine:.2f}")
+            
+            if st.button("Return Book"):
+                # The fine is charged as of the moment the return is saved
+                result = loan_service.return_loan(loan.loan_id)
+                if result['ok']:
+                    st.success("Book returned successfully!")
+                    st.rerun()
+                else:
+                    st.error(f"Could not return the book: {result['message']}.")
+        else:
+            st.info("No active loans to return.")
+    
+    with tab4:
+        st.subheader("Batch Desk")
+        st.caption("Scan or paste one ID per line. Each batch is checked and saved in a single transaction.")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.write("**Batch Checkout**")
+            member_options = {f"{m.member_id}: {m.name}": m.member_id for m in member_repo.active()}
+            default_member = st.selectbox("Default Member", list(member_options.keys()), key="batch_member")
+            st.caption("Lines are book IDs, or book_id,member_id to lend to someone else.")
+            checkout_text = st.text_area("Books to lend", key="batch_checkout")
+            
+            if st.button("Check Out All"):
+                try:
+                    items = parse_batch(checkout_text, member_options.get(default_member))
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    results = loan_service.checkout_many(items)
+                    show_batch_results(results, ["book_id", "member_id", "loan_id", "due_date", "message"])
+        
+        with col2:
+            st.write("**Batch Return**")
+            return_text = st.text_area("Loan IDs to return", key="batch_return")
+            
+            if st.button("Return All"):
+                try:
+                    loan_ids = [loan_id for loan_id, member_id in parse_batch(return_text, None)]
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    results = loan_service.return_many(loan_ids)
+                    show_batch_results(results, ["loan_id", "book_id", "fine", "message"])
+
+# Parse "id" or "id,member_id" lines into (id, member_id) pairs
+def parse_batch(text, default_member):
+    items = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        parts = [part.strip() for part in line.replace(';', ',').split(',') if part.strip()]
+        if not parts:
+            continue
+        if not all(part.isdigit() for part in parts) or len(parts) > 2:
+            raise ValueError(f"Line {number}: expected an ID or ID,member ID, got {line!r}")
+        items.append((int(parts[0]), int(parts[1]) if len(parts) == 2 else default_member))
+    return items
+
+# Per-item report for a batch
+def show_batch_results(results, columns):
+    succeeded = sum(1 for result in results if result['ok'])
+    if succeeded:
+        st.success(f"{succeeded} of {len(results)} items processed.")
+    if succeeded < len(results):
+        st.warning(f"{len(results) - succeeded} items were rejected.")
+    if results:
+        import pandas as pd
+        df = pd.DataFrame(results).reindex(columns=["ok"] + columns)
+        st.dataframe(df)
@@ -0,0 +1,106 @@
+import streamlit as st
+
+from library_frames import named_frame
+from library_services import Member, MemberLoan
+from library_pages.common import MEMBER_STATUSES, member_repo, show_paged_listing
+
+def show():
+    st.title("Members Management")
+    
+    # Create tabs
+    tab1, tab2, tab3 = st.tabs(["View Members", "Add Member", "Search Members"])
+    
+    with tab1:
+        st.subheader("All Members")
+        members = show_paged_listing(member_repo, {"Membership Status": MEMBER_STATUSES})
+        
+        if members:
+            # Member actions
+            st.subheader("Member Actions")
+            member_id = st.number_input("Enter Member ID", min_value=1, step=1)
+            action = st.selectbox("Select Action", ["Update Status", "Edit Member", "Delete Member", "View Loans"])
+            
+            if action == "Update Status":
+                new_status = st.selectbox("New Status", MEMBER_STATUSES)
+                if st.button("Update Status"):
+                    member_repo.set_status(member_id, new_status)
+                    st.success(f"Member status updated to {new_status}")
+                    st.rerun()
+            
+            elif action == "Edit Member":
+                # Get current member details
+                member = member_repo.get(member_id)
+                
+                if member:
+                    first_name = st.text_input("First Name", member.first_name)
+                    last_name = st.text_input("Last Name", member.last_name)
+                    email = st.text_input("Email", member.email)
+                    phone = st.text_input("Phone", member.phone)
+                    address = st.text_area("Address", member.address)
+                    
+                    if st.button("Update Member"):
+                        member_repo.update(member_id, first_name, last_name, email, phone, address)
+                        st.success("Member updated successfully!")
+                        st.rerun()
+                else:
+                    st.error("Member not found!")
+            
+            elif action == "Delete Member":
+                if st.button("Delete Member"):
+                    # Refused if the member has active loans
+                    if member_repo.delete(member_id):
+                        st.success("Member deleted successfully!")
+                        st.rerun()
+                    else:
+                        st.error("Cannot delete member with active loans!")
+            
+            elif action == "View Loans":
+                member_loans = member_repo.loans(member_id)
+                
+                if member_loans:
+                    st.write(f"Loans for Member ID: {member_id}")
+                    st.dataframe(named_frame(member_loans, MemberLoan))
+                else:
+                    st.info("No loans found for this member.")
+        else:
+            st.info("No members in the database. Add some members!")
+    
+    with tab2:
+        st.subheader("Add New Member")
+        
+        first_name = st.text_input("First Name")
+        last_name = st.text_input("Last Name")
+        email = st.text_input("Email")
+        phone = st.text_input("Phone")
+        address = st.text_area("Address")
+        status = st.selectbox("Membership Status", MEMBER_STATUSES)
+        
+        if st.button("Add Member"):
+            if first_name and last_name and email:
+                # Refused if the email already exists
+                if member_repo.add(first_name, last_name, email, phone, address, status) is None:
+                    st.error("Email already exists!")
+                else:
+                    st.success("Member added successfully!")
+                    st.rerun()
+            else:
+                st.error("First Name, Last Name, and Email are required!")
+    
+    with tab3:
+        st.subheader("Search Members")
+        
+        search_option = st.selectbox("Search by", ["All Fields", "Name", "Email", "Phone"])
+        search_term = st.text_input("Enter search term", help='Words match as prefixes. Use "quotes" for phrases; email and phone match any part.')
+        
+        if st.button("Search"):
+            if search_term:
+                field = None if search_option == "All Fields" else search_option
+                results = member_repo.search(search_term, field)
+                
+                if results:
+                    results_df = named_frame(results, Member)
+                    st.dataframe(results_df)
+                else:
+                    st.info("No members found matching your search criteria.")
+            else:
+                st.error("Please enter a search term!")
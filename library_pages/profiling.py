@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+
+import streamlit as st
+
+from library_profile import OTHER, Capture, PageProfile, timed_call
+
+# Render profiling in the app (see library_profile for the phases).
+# Profiling is on for every render with LIBRARY_PROFILE set, or for one
+# session with ?profile=1 in the URL. ?profile=cprofile (or pyinstrument)
+# also captures a function-level profile of that one rerun, after which the
+# session carries on with timings only; the sidebar panel can ask for
+# another capture.
+
+PROFILE = os.environ.get('LIBRARY_PROFILE', 'off') not in ('', '0', 'off')
+TOOLS = ('cprofile', 'pyinstrument')
+
+# Streamlit elements that marshal their payload (Arrow tables, figure JSON)
+# inside the call
+SERIALIZING = ('dataframe', 'table', 'data_editor', 'json', 'plotly_chart')
+
+# Time the serializing elements as 'serialize' spans while a profiled run is
+# inside the block. The st functions are shared by every session, so they
+# are wrapped when the first profiled run enters and put back when the last
+# one leaves; sessions rendering meanwhile only pay the check for an active
+# profile on their thread.
+_instrumented = {'runs': 0, 'originals': {}}
+_instrument_lock = threading.Lock()
+
+@contextmanager
+def instrumented_streamlit():
+    with _instrument_lock:
+        if _instrumented['runs'] == 0:
+            for name in SERIALIZING:
+                element = getattr(st, name)
+                _instrumented['originals'][name] = element
+                setattr(st, name, timed_call(element, 'serialize', f"st.{name}"))
+        _instrumented['runs'] += 1
+    try:
+        yield
+    finally:
+        with _instrument_lock:
+            _instrumented['runs'] -= 1
+            if _instrumented['runs'] == 0:
+                for name, element in _instrumented['originals'].items():
+                    setattr(st, name, element)
+                _instrumented['originals'].clear()
+
+# (profiling on, capture tool or None) for this rerun
+def _mode():
+    param = st.query_params.get('profile')
+    tool = st.session_state.pop('profile_capture', None)
+    if param in TOOLS:
+        tool = tool or param
+        # One capture, then timings only
+        st.query_params['profile'] = '1'
+    enabled = PROFILE or tool is not None or param not in (None, '', '0', 'off')
+    return enabled, tool
+
+# Profile a page's render when profiling is on, then show the results in
+# the sidebar. A render cut short (st.rerun) shows nothing.
+@contextmanager
+def profiling(page):
+    enabled, tool = _mode()
+    if not enabled:
+        yield
+        return
+    profile = PageProfile(page)
+    capture = Capture(tool) if tool else None
+    with instrumented_streamlit(), profile.active(), (capture.running() if capture else nullcontext()):
+        yield
+    profile.save()
+    show_profile(profile, capture)
+
+def show_profile(profile, capture=None):
+    total = profile.total_ms
+    with st.sidebar.expander(f"Render Profile: {total:.0f} ms", expanded=True):
+        breakdown = profile.breakdown()
+        st.dataframe([
+            {"Phase": kind, "ms": ms, "Share": ms / total if total else 0.0, "Calls": count if kind != OTHER else None}
+            for kind, (ms, count) in sorted(breakdown.items(), key=lambda item: item[1][0], reverse=True)
+        ], column_config={
+            "ms": st.column_config.NumberColumn(format="%.1f"),
+            "Share": st.column_config.NumberColumn(format="percent"),
+        }, hide_index=True)
+
+        slowest = profile.slowest(8)
+        if slowest:
+            st.write("Slowest calls")
+            st.dataframe([{"Phase": kind, "Call": name, "ms": ms} for kind, name, ms in slowest], hide_index=True)
+
+        stem = f"{profile.page.lower().replace(' ', '_')}-render"
+        st.download_button("Download trace (Chrome format)", json.dumps(profile.chrome_trace()),
+                           file_name=f"{stem}.trace.json", mime="application/json", on_click="ignore", key="profile_trace")
+
+        if capture is not None:
+            st.write(f"Function profile ({capture.tool})")
+            st.text(capture.summary(20))
+            file_name, data, mime = capture.export(stem)
+            st.download_button(f"Download {file_name.split('.', 1)[1]}", data, file_name=file_name, mime=mime,
+                               on_click="ignore", key="profile_capture_download")
+
+        tool = st.selectbox("Function profiler", TOOLS, key="profile_tool")
+        if st.button("Profile next rerun", key="profile_next"):
+            st.session_state['profile_capture'] = tool
+            st.rerun()
@@ -0,0 +1,235 @@
+import streamlit as st
+import calendar
+from datetime import datetime
+
+from library_jobs import trigger_job
+from library_fines import add_fine_columns
+from library_export import EXPORTS, MIME_TYPES, export_stream
+from library_analytics import fresh_snapshot, snapshot_time, publication_decades, loan_trends, enabled as analytics_enabled
+from library_frames import named_frame
+from library_services import OverdueLoan, PopularBook, CategoryLoans, ActiveMember, MemberFines, StatusCount, CategoryCount, DecadeCount, MonthlyLoans, LoanTrend, minute_ceiling
+from library_pages.common import REPORT_PERIODS, member_repo, loan_service, report_service, download_report, plot
+
+def show():
+    st.title("Library Reports")
+    
+    report_type = st.selectbox("Select Report Type", [
+        "Overdue Books", 
+        "Popular Books", 
+        "Active Members",
+        "Fine Collection",
+        "Book Inventory",
+        "Monthly Loans",
+        "Loan Trends",
+        "Data Export"
+    ])
+    
+    if report_type == "Overdue Books":
+        st.subheader("Overdue Books Report")
+        
+        now = minute_ceiling(datetime.now())
+        overdue = report_service.overdue(now)
+        
+        if overdue:
+            overdue_df = named_frame(overdue, OverdueLoan)
+            # Days overdue and fines for every row at once, under the current fine policy
+            add_fine_columns(overdue_df, "Due Date", category_col="Category", now=now)
+            overdue_df = overdue_df.drop(columns="Category")
+            st.dataframe(overdue_df, column_config={"Fine Amount": st.column_config.NumberColumn(format="$%.2f")})
+            download_report(overdue_df, "overdue_books")
+            
+            # Visualization
+            plot("bar", overdue_df, x="Book Title", y="Days Overdue", color="Member", title="Overdue Books by Days")
+        else:
+            st.info("No overdue books at the moment.")
+    
+    elif report_type == "Popular Books":
+        st.subheader("Popular Books Report")
+        
+        period = st.selectbox("Select Period", list(REPORT_PERIODS), index=len(REPORT_PERIODS) - 1, key="popular_period")
+        
+        # Loan counts come from the rollups, per book (editions sharing a title stay apart)
+        popular = report_service.popular_books(REPORT_PERIODS[period])
+        
+        if popular:
+            popular_df = named_frame(popular, PopularBook)
+            st.dataframe(popular_df)
+            download_report(popular_df, "popular_books")
+            
+            # Visualization
+            popular_df["Book"] = popular_df["Book Title"] + " (#" + popular_df["Book ID"].astype(str) + ")"
+            plot("bar", popular_df, x="Book", y="Number of Loans", hover_data=["Author"], title="Most Popular Books")
+            
+            # Also show by category
+            categories = report_service.popular_categories(REPORT_PERIODS[period])
+            
+            if categories:
+                category_df = named_frame(categories, CategoryLoans)
+                plot("pie", category_df, values="Number of Loans", names="Category", title="Loans by Book Category")
+        else:
+            st.info("No loans in the selected period.")
+    
+    elif report_type == "Active Members":
+        st.subheader("Active Members Report")
+        
+        period = st.selectbox("Select Period", list(REPORT_PERIODS), index=len(REPORT_PERIODS) - 1, key="active_period")
+        active = report_service.active_members(REPORT_PERIODS[period])
+        
+        if active:
+            active_df = named_frame(active, ActiveMember)
+            st.dataframe(active_df)
+            download_report(active_df, "active_members")
+            
+            # Visualization
+            plot("bar", active_df, x="Member Name", y="Number of Loans", title="Most Active Members")
+        else:
+            st.info("No loans in the selected period.")
+    
+    elif report_type == "Fine Collection":
+        st.subheader("Fine Collection Report")
+        
+        period = st.selectbox("Select Period", list(REPORT_PERIODS), key="fine_period")
+        
+        # Window totals come from the ledger's daily running totals
+        fines, totals = report_service.fine_collection(REPORT_PERIODS[period])
+        
+        if fines:
+            fine_df = named_frame(fines, MemberFines)
+            money = st.column_config.NumberColumn(format="$%.2f")
+            st.dataframe(fine_df, column_config={"Fines Assessed": money, "Fines Paid": money})
+            download_report(fine_df, "fine_collection")
+            
+            col1, col2 = st.columns(2)
+            col1.metric("Total Fines Assessed", f"${totals.assessed:.2f}")
+            col2.metric("Total Fines Collected", f"${totals.paid:.2f}")
+            
+            # Visualization
+            plot("bar", fine_df, x="Member Name", y=["Fines Assessed", "Fines Paid"], barmode="group", title="Fine Collection by Member")
+        else:
+            st.info("No fine data available for the selected period.")
+        
+        with st.expander("Record Fine Payment"):
+            members = member_repo.by_name()
+            if members:
+                member_options = {f"{member.member_id}: {member.name}": member.member_id for member in members}
+                selected_member = st.selectbox("Member", list(member_options.keys()), key="payment_member")
+                amount = st.number_input("Amount ($)", min_value=0.01, value=1.00, step=0.50, format="%.2f")
+                if st.button("Record Payment"):
+                    loan_service.record_payment(member_options[selected_member], amount)
+                    st.success("Payment recorded!")
+                    st.rerun()
+    
+    elif report_type == "Book Inventory":
+        st.subheader("Book Inventory Report")
+        
+        # Status breakdown
+        status_counts = report_service.books_by_status()
+        
+        if status_counts:
+            status_df = named_frame(status_counts, StatusCount)
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.write("Books by Status")
+                st.dataframe(status_df)
+            
+            with col2:
+                plot("pie", status_df, values="Count", names="Status", title="Books by Status")
+        
+        # Category breakdown
+        category_counts = report_service.books_by_category()
+        
+        if category_counts:
+            category_df = named_frame(category_counts, CategoryCount)
+            st.write("Books by Category")
+            st.dataframe(category_df)
+            download_report(category_df, "books_by_category")
+            
+            plot("bar", category_df, x="Category", y="Count", title="Books by Category")
+            
+            # Publication year breakdown. It can be a little stale, so it comes
+            # from the analytics snapshot when there is a recent one
+            if fresh_snapshot():
+                decade_df = publication_decades()
+            else:
+                decade_df = named_frame(report_service.publication_decades(), DecadeCount)
+            
+            if not decade_df.empty:
+                plot("bar", decade_df, x="Decade", y="Count", title="Books by Publication Decade")
+        else:
+            st.info("No book data available.")
+    
+    elif report_type == "Monthly Loans":
+        st.subheader("Monthly Loans Report")
+        
+        # Get year for filtering
+        current_year = datetime.now().year
+        year_options = list(range(current_year - 5, current_year + 1))
+        selected_year = st.selectbox("Select Year", year_options, index=len(year_options) - 1)
+        
+        monthly = report_service.monthly_loans(selected_year)
+        
+        if monthly:
+            # Convert month numbers to names
+            monthly_df = named_frame([row._replace(month=calendar.month_name[row.month]) for row in monthly], MonthlyLoans)
+            
+            st.dataframe(monthly_df)
+            download_report(monthly_df, f"monthly_loans_{selected_year}")
+            
+            # Visualization
+            plot("line", monthly_df, x="Month", y="Loan Count", markers=True, title=f"Monthly Loans for {selected_year}")
+            
+            # Calculate total loans for the year
+            total_loans = monthly_df["Loan Count"].sum()
+            st.metric(f"Total Loans in {selected_year}", total_loans)
+        else:
+            st.info(f"No loan data available for {selected_year}.")
+    
+    elif report_type == "Loan Trends":
+        st.subheader("Loan Trends Report")
+        
+        # Full-history aggregates: from the analytics snapshot when there is a
+        # recent one, otherwise straight from SQLite
+        now = minute_ceiling(datetime.now())
+        taken_at = fresh_snapshot()
+        if taken_at:
+            trends_df = loan_trends(now=now)
+            st.caption(f"From the analytics snapshot taken {taken_at:%Y-%m-%d %H:%M}.")
+        else:
+            trends_df = named_frame(report_service.loan_trends(now), LoanTrend)
+        
+        if not trends_df.empty:
+            st.dataframe(trends_df, column_config={
+                "Average Days Out": st.column_config.NumberColumn(format="%.1f"),
+                "Late Share": st.column_config.NumberColumn(format="percent"),
+            })
+            download_report(trends_df, "loan_trends")
+            
+            plot("line", trends_df, x="Year", y="Loans", color="Category", markers=True, title="Loans per Year by Category")
+            
+            plot("line", trends_df, x="Year", y="Average Days Out", color="Category", markers=True, title="Average Loan Length")
+        else:
+            st.info("No loan data available yet.")
+        
+        if analytics_enabled():
+            with st.expander("Analytics snapshot"):
+                last = snapshot_time()
+                st.write(f"Last snapshot: {last:%Y-%m-%d %H:%M}" if last else "No snapshot has been taken yet.")
+                if st.button("Take snapshot now"):
+                    trigger_job('analytics_snapshot')
+                    st.success("Snapshot requested.")
+    
+    elif report_type == "Data Export":
+        st.subheader("Data Export")
+        st.caption("Full tables, read in batches from one snapshot of the database when you click download.")
+        
+        dataset = st.selectbox("Dataset", list(EXPORTS), format_func=str.title)
+        fmt = st.selectbox("Format", ["csv", "jsonl", "parquet"], format_func=str.upper)
+        
+        st.download_button(
+            f"Download {dataset}.{fmt}",
+            lambda: export_stream(dataset, fmt),
+            file_name=f"{dataset}.{fmt}",
+            mime=MIME_TYPES[fmt],
+            on_click="ignore",
+        )
@@ -0,0 +1,99 @@
+import streamlit as st
+from datetime import datetime, timedelta
+
+from library_holds import HOLD_STATUSES
+from library_frames import named_frame
+from library_services import Reservation, QueueEntry
+from library_pages.common import book_repo, member_repo, hold_service
+
+def show():
+    st.title("Reservations Management")
+    
+    # Create tabs
+    tab1, tab2, tab3 = st.tabs(["View Reservations", "Make Reservation", "Hold Queues"])
+    
+    with tab1:
+        st.subheader("All Reservations")
+        
+        reservations = hold_service.all()
+        
+        if reservations:
+            st.dataframe(named_frame(reservations, Reservation))
+            
+            # Reservation actions
+            st.subheader("Reservation Actions")
+            reservation_id = st.number_input("Enter Reservation ID", min_value=1, step=1)
+            action = st.selectbox("Select Action", ["Update Status", "Delete Reservation"])
+            
+            if action == "Update Status":
+                new_status = st.selectbox("New Status", HOLD_STATUSES)
+                if st.button("Update Status"):
+                    applied = hold_service.set_status(reservation_id, new_status)
+                    if applied is None:
+                        st.error("Reservation not found")
+                    elif applied != new_status:
+                        st.warning("The book is not on the shelf yet; the hold stays in the queue until it is returned")
+                    else:
+                        st.success(f"Reservation status updated to {new_status}")
+                        st.rerun()
+            
+            elif action == "Delete Reservation":
+                if st.button("Delete Reservation"):
+                    hold_service.delete(reservation_id)
+                    st.success("Reservation deleted successfully!")
+                    st.rerun()
+        else:
+            st.info("No reservations in the database.")
+    
+    with tab2:
+        st.subheader("Make New Reservation")
+        
+        # Get books that can be reserved (out on loan or on the hold shelf)
+        reservable_books = book_repo.reservable()
+        
+        # Get active members
+        active_members = member_repo.active()
+        
+        if reservable_books and active_members:
+            book_options = {f"{book.book_id}: {book.title}": book.book_id for book in reservable_books}
+            member_options = {f"{member.member_id}: {member.name}": member.member_id for member in active_members}
+            
+            selected_book = st.selectbox("Select Book", list(book_options.keys()))
+            selected_member = st.selectbox("Select Member", list(member_options.keys()))
+            
+            reservation_date = datetime.now()
+            expiry_days = st.number_input("Reservation Valid For (days)", min_value=1, max_value=30, value=7)
+            expiry_date = reservation_date + timedelta(days=expiry_days)
+            
+            st.write(f"Reservation Date: {reservation_date.strftime('%Y-%m-%d')}")
+            st.write(f"Expiry Date: {expiry_date.strftime('%Y-%m-%d')}")
+            
+            if st.button("Make Reservation"):
+                book_id = book_options[selected_book]
+                member_id = member_options[selected_member]
+                
+                # Joins the back of the book's hold queue
+                result = hold_service.place(book_id, member_id, expiry_date)
+                if result['ok']:
+                    st.success(f"Reservation made successfully! Place in line: {result['place']}")
+                else:
+                    st.error(f"Could not make the reservation: {result['message']}.")
+        else:
+            if not reservable_books:
+                st.error("No books available for reservation!")
+            if not active_members:
+                st.error("No active members to make reservations for!")
+    
+    with tab3:
+        st.subheader("Hold Queues")
+        
+        queued_books = hold_service.queued_books()
+        
+        if queued_books:
+            queue_options = {f"{book.book_id}: {book.title} ({book.waiting} waiting)": book.book_id for book in queued_books}
+            selected_queue = st.selectbox("Select Book", list(queue_options.keys()), key="hold_queue_book")
+            queue_df = named_frame(hold_service.queue(queue_options[selected_queue]), QueueEntry)
+            queue_df.index = range(1, len(queue_df) + 1)
+            st.dataframe(queue_df)
+        else:
+            st.info("Nobody is waiting for a book.")
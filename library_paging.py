@@ -0,0 +1,140 @@
+# Keyset (seek) pagination for the listing pages.
+# Pages are fetched with WHERE (sort, key) > (last sort, last key) instead of
+# OFFSET, so every page costs the same no matter how deep the user goes.
+
+# Counts above this are reported as estimates instead of being counted
+COUNT_CAP = 10000
+
+# A listing the UI can page through
+class Listing:
+    def __init__(self, name, select, source, key, columns, sorts, filters, default_sort, default_descending=False):
+        self.name = name
+        self.select = select
+        self.source = source
+        self.key = key
+        self.columns = columns
+        self.sorts = sorts
+        self.filters = filters
+        self.default_sort = default_sort
+        self.default_descending = default_descending
+        # Table whose size bounds the listing's size
+        self.table = source.split()[0]
+
+BOOKS = Listing(
+    'books',
+    "book_id, title, author, isbn, publication_year, category, status, shelf_location, added_date",
+    "books",
+    "book_id",
+    ["Book ID", "Title", "Author", "ISBN", "Publication Year", "Category", "Status", "Shelf Location", "Added Date"],
+    {'Book ID': 'book_id', 'Title': 'title', 'Author': 'author', 'Added Date': 'added_date'},
+    {'Status': 'status', 'Category': 'category'},
+    'Book ID',
+)
+
+MEMBERS = Listing(
+    'members',
+    "member_id, first_name, last_name, email, phone, address, membership_date, membership_status",
+    "members",
+    "member_id",
+    ["Member ID", "First Name", "Last Name", "Email", "Phone", "Address", "Membership Date", "Membership Status"],
+    {'Member ID': 'member_id', 'Last Name': 'last_name', 'Email': 'email', 'Membership Date': 'membership_date'},
+    {'Membership Status': 'membership_status'},
+    'Member ID',
+)
+
+LOANS = Listing(
+    'loans',
+    """l.loan_id, b.title, m.first_name || ' ' || m.last_name as member_name,
+       l.loan_date, l.due_date, l.return_date, l.status, l.fine_amount""",
+    """loans l
+    JOIN books b ON l.book_id = b.book_id
+    JOIN members m ON l.member_id = m.member_id""",
+    "l.loan_id",
+    ["Loan ID", "Book Title", "Member", "Loan Date", "Due Date", "Return Date", "Status", "Fine Amount"],
+    {'Loan Date': 'l.loan_date', 'Due Date': 'l.due_date', 'Loan ID': 'l.loan_id'},
+    {'Status': 'l.status'},
+    'Loan Date',
+    default_descending=True,
+)
+
+def _where(listing, filters):
+    clauses = []
+    params = []
+    for label, value in (filters or {}).items():
+        if value is None:
+            continue
+        clauses.append(f"{listing.filters[label]} = ?")
+        params.append(value)
+    return clauses, params
+
+# Fetch one page of a listing.
+# cursor is the (sort value, key) of the last row of the previous page, or None
+# for the first page. Returns (rows, next_cursor); next_cursor is None on the
+# last page.
+def fetch_page(conn, listing, sort=None, descending=None, filters=None, page_size=50, cursor=None):
+    sort_expr = listing.sorts[sort or listing.default_sort]
+    if descending is None:
+        descending = listing.default_descending
+    clauses, params = _where(listing, filters)
+
+    if cursor is not None:
+        op = '<' if descending else '>'
+        if sort_expr == listing.key:
+            clauses.append(f"{listing.key} {op} ?")
+            params.append(cursor[1])
+        else:
+            clauses.append(f"({sort_expr}, {listing.key}) {op} (?, ?)")
+            params.extend(cursor)
+
+    direction = 'DESC' if descending else 'ASC'
+    order = f"{sort_expr} {direction}" if sort_expr == listing.key else f"{sort_expr} {direction}, {listing.key} {direction}"
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    # One extra row tells us whether there is a next page
+    rows = conn.execute(f"""
+    SELECT {listing.select}, {sort_expr}, {listing.key}
+    FROM {listing.source}
+    {where}
+    ORDER BY {order}
+    LIMIT ?
+    """, params + [page_size + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = tuple(rows[-1][-2:])
+    return [row[:-2] for row in rows], next_cursor
+
+# Count the listing's rows, stopping at COUNT_CAP.
+# Returns (count, exact). Past the cap the count is estimated from the table's
+# highest rowid and the planner statistics instead of scanning further.
+def count_rows(conn, listing, filters=None):
+    clauses, params = _where(listing, filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    count = conn.execute(f"""
+    SELECT COUNT(*) FROM (SELECT 1 FROM {listing.source} {where} LIMIT ?)
+    """, params + [COUNT_CAP + 1]).fetchone()[0]
+    if count <= COUNT_CAP:
+        return count, True
+    columns = [listing.filters[label].split('.')[-1] for label, value in (filters or {}).items() if value is not None]
+    return max(estimate_rows(conn, listing.table, columns), COUNT_CAP), False
+
+# Estimate a table's size, narrowed by equality filters on columns, in O(log n)
+def estimate_rows(conn, table, columns=()):
+    total = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    if not columns:
+        return total
+    try:
+        stats = conn.execute("SELECT idx, stat FROM sqlite_stat1 WHERE tbl = ? AND idx IS NOT NULL", (table,)).fetchall()
+    except Exception:
+        return total
+    # sqlite_stat1 rows read "<rows> <rows per distinct value of the first column> ..."
+    per_column = {}
+    for idx, stat in stats:
+        info = conn.execute(f'PRAGMA index_info("{idx}")').fetchall()
+        parts = stat.split()
+        if info and len(parts) >= 2 and int(parts[0]) > 0:
+            per_column.setdefault(info[0][2], int(parts[1]) / int(parts[0]))
+    fraction = 1.0
+    for column in columns:
+        fraction *= per_column.get(column, 1.0)
+    return int(total * fraction)
@@ -0,0 +1,192 @@
+import io
+import json
+import os
+import threading
+import time
+import types
+from contextlib import contextmanager, nullcontext
+
+# Render profiling for the app's pages.
+# While a PageProfile is active on a thread, phase(kind, name) spans record
+# where a page's time goes. The kinds:
+#   sql        service calls (the pages' services are wrapped in Timed)
+#   frame      building DataFrames from rows
+#   plotly     building plotly figures
+#   serialize  Streamlit elements marshalling their payload (tables, charts)
+# Time outside every span is the page's own Python: widgets, loops, imports.
+# Spans nest; each phase is charged its exclusive time, so a chart's
+# serialization is not also counted as plotly.
+#
+# A profile exports its spans in the Chrome trace event format, which
+# Perfetto, chrome://tracing and speedscope open as a flame chart.
+# Function-level captures of one rerun (cProfile, or pyinstrument when it
+# is installed) are taken by Capture.
+
+PHASES = ('sql', 'frame', 'plotly', 'serialize')
+OTHER = 'python'
+# Directory each profiled render's trace is also written to, when set
+PROFILE_DIR = os.environ.get('LIBRARY_PROFILE_DIR')
+
+_local = threading.local()
+_idle = nullcontext()
+
+# Profile of one render of one page
+class PageProfile:
+    def __init__(self, page):
+        self.page = page
+        self.started_at = time.time()
+        self.spans = []
+        self._open = []
+        self.start = None
+        self.end = None
+
+    # Make this the thread's active profile for the block
+    @contextmanager
+    def active(self):
+        previous = getattr(_local, 'profile', None)
+        _local.profile = self
+        self.start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.end = time.perf_counter()
+            _local.profile = previous
+
+    @contextmanager
+    def span(self, kind, name):
+        # [kind, name, start, end, time in child spans]
+        span = [kind, name, time.perf_counter(), None, 0.0]
+        self._open.append(span)
+        try:
+            yield
+        finally:
+            span[3] = time.perf_counter()
+            self._open.pop()
+            if self._open:
+                self._open[-1][4] += span[3] - span[2]
+            self.spans.append(span)
+
+    @property
+    def total_ms(self):
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    # {phase: (exclusive ms, spans)} for every phase, with OTHER for the rest
+    def breakdown(self):
+        phases = {kind: [0.0, 0] for kind in PHASES}
+        for kind, name, start, end, children in self.spans:
+            entry = phases.setdefault(kind, [0.0, 0])
+            entry[0] += (end - start - children) * 1000
+            entry[1] += 1
+        phases[OTHER] = [self.total_ms - sum(ms for ms, count in phases.values()), 0]
+        return {kind: (round(ms, 2), count) for kind, (ms, count) in phases.items()}
+
+    # The n longest spans as (kind, name, ms)
+    def slowest(self, n=10):
+        spans = sorted(self.spans, key=lambda span: span[3] - span[2], reverse=True)
+        return [(kind, name, round((end - start) * 1000, 2)) for kind, name, start, end, children in spans[:n]]
+
+    # Trace event format: the render as one span with the phase spans inside
+    def chrome_trace(self):
+        def event(name, kind, start, end):
+            return {'name': name, 'cat': kind, 'ph': 'X', 'pid': 1, 'tid': 1,
+                    'ts': round((start - self.start) * 1e6, 1), 'dur': round((end - start) * 1e6, 1)}
+        events = [event(f"page: {self.page}", 'page', self.start, self.end or time.perf_counter())]
+        events += [event(name, kind, start, end) for kind, name, start, end, children in sorted(self.spans, key=lambda span: span[2])]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'page': self.page, 'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at))}}
+
+    # Write the trace to PROFILE_DIR (when set); returns the file written or None
+    def save(self, directory=PROFILE_DIR):
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        path = os.path.join(directory, f"{stamp}-{self.page.lower().replace(' ', '_')}-{os.getpid()}-{id(self) % 10000}.trace.json")
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+def active_profile():
+    return getattr(_local, 'profile', None)
+
+# Time the block as a `kind` span of the thread's active profile, if any
+def phase(kind, name=None):
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return _idle
+    return profile.span(kind, name or kind)
+
+# Wrap a function so each call is a `kind` span
+def timed_call(func, kind, name=None):
+    name = name or getattr(func, '__qualname__', repr(func))
+
+    def call(*args, **kwargs):
+        with phase(kind, name):
+            return func(*args, **kwargs)
+    call.__wrapped__ = func
+    return call
+
+# Proxy whose method calls are `kind` spans, e.g. Timed(BookRepository(), 'sql').
+# Other attributes (listing, row_type) pass through untouched.
+class Timed:
+    def __init__(self, target, kind):
+        self._target = target
+        self._kind = kind
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if isinstance(attr, types.MethodType) and not name.startswith('_'):
+            return timed_call(attr, self._kind, f"{type(self._target).__name__}.{name}")
+        return attr
+
+# A function-level profile of one block: cProfile, or pyinstrument when it
+# is installed and asked for
+class Capture:
+    def __init__(self, tool='cprofile'):
+        self.tool = tool
+        self._profiler = None
+        if tool == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                self.tool = 'cprofile'
+            else:
+                self._profiler = Profiler()
+        if self._profiler is None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+    @contextmanager
+    def running(self):
+        if self.tool == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+        try:
+            yield self
+        finally:
+            if self.tool == 'pyinstrument':
+                self._profiler.stop()
+            else:
+                self._profiler.disable()
+
+    # The heaviest functions by cumulative time, as text
+    def summary(self, limit=30):
+        if self.tool == 'pyinstrument':
+            return self._profiler.output_text(unicode=True, color=False)
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    # (file name, bytes, mime type) of the capture in its tool's standard
+    # format: a speedscope profile from pyinstrument, pstats from cProfile
+    # (for snakeviz, gprof2dot or flameprof)
+    def export(self, stem):
+        if self.tool == 'pyinstrument':
+            from pyinstrument.renderers import SpeedscopeRenderer
+            return f"{stem}.speedscope.json", self._profiler.output(SpeedscopeRenderer()).encode(), "application/json"
+        import marshal
+        import pstats
+        stats = pstats.Stats(self._profiler)
+        return f"{stem}.pstats", marshal.dumps(stats.stats), "application/octet-stream"
@@ -0,0 +1,140 @@
+import sys
+from datetime import datetime, timedelta
+
+# Loan activity rollups behind the Reports page.
+# loan_rollups holds loan counts per (scope, grain, period, key): per book,
+# per member, per category and in total ('all'), by local day and by month.
+# Triggers on loans keep it current as loans are written, so the reports
+# aggregate a few rollup rows instead of scanning the whole loan history,
+# and "last N days" reports are range reads on the primary key.
+#
+# Periods are local dates as integers: 20240131 for a day, 202401 for a
+# month. The key column has no declared type, so book and member ids stay
+# integers (and join to their tables) while categories stay text. Loans are
+# counted against the book's current category; NULL categories are ''.
+
+GRAINS = {'day': '%Y%m%d', 'month': '%Y%m'}
+
+# scope -> key expression for a loans row
+SCOPES = {
+    'all': "''",
+    'book': "IFNULL({row}.book_id, 0)",
+    'member': "IFNULL({row}.member_id, 0)",
+    'category': "IFNULL((SELECT category FROM books WHERE book_id = {row}.book_id), '')",
+}
+
+# Loan columns that move a loan between rollup rows
+_TRACKED = ['loan_date', 'book_id', 'member_id']
+
+def _period(grain, row):
+    return f"IFNULL(CAST(strftime('{GRAINS[grain]}', {row}.loan_date, 'unixepoch', 'localtime') AS INTEGER), 0)"
+
+def _bump(row, delta):
+    return ''.join(f"""
+            INSERT INTO loan_rollups (scope, grain, period, key, loans)
+            VALUES ('{scope}', '{grain}', {_period(grain, row)}, {key.format(row=row)}, {delta})
+            ON CONFLICT (scope, grain, period, key) DO UPDATE SET loans = loans + {delta};"""
+        for scope, key in SCOPES.items() for grain in GRAINS)
+
+# Move a book's loans from one category to another, using its book rollups
+def _recategorize(book_id, old_category, new_category):
+    return ''.join(f"""
+            INSERT INTO loan_rollups (scope, grain, period, key, loans)
+            SELECT 'category', grain, period, IFNULL({category}, ''), {sign}loans
+            FROM loan_rollups WHERE scope = 'book' AND key = {book_id} AND loans != 0
+            ON CONFLICT (scope, grain, period, key) DO UPDATE SET loans = loans + excluded.loans;"""
+        for category, sign in ((old_category, '-'), (new_category, '')))
+
+# Create the rollup table and its triggers, then fill it
+def create_loan_rollups(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS loan_rollups (
+        scope TEXT NOT NULL,
+        grain TEXT NOT NULL,
+        period INTEGER NOT NULL,
+        key NOT NULL,
+        loans INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, grain, period, key)
+    ) WITHOUT ROWID
+    ''')
+    changed = ' OR '.join(f"old.{col} IS NOT new.{col}" for col in _TRACKED)
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_rollups_ai AFTER INSERT ON loans BEGIN {_bump('new', 1)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_rollups_ad AFTER DELETE ON loans BEGIN {_bump('old', -1)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_rollups_au AFTER UPDATE OF {', '.join(_TRACKED)} ON loans WHEN {changed} BEGIN {_bump('old', -1)}{_bump('new', 1)} END")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS books_rollups_au AFTER UPDATE OF category ON books WHEN old.category IS NOT new.category
+    BEGIN {_recategorize('new.book_id', 'old.category', 'new.category')} END""")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS books_rollups_ad AFTER DELETE ON books BEGIN {_recategorize('old.book_id', 'old.category', 'NULL')} END")
+    rebuild_rollups(c)
+
+# Recompute the rollups with GROUP BY scans over loans
+def actual_rollups(c):
+    counts = {}
+    for scope, key in SCOPES.items():
+        for grain in GRAINS:
+            for period, k, n in c.execute(f"SELECT {_period(grain, 'l')}, {key.format(row='l')}, COUNT(*) FROM loans l GROUP BY 1, 2"):
+                counts[(scope, grain, period, k)] = n
+    return counts
+
+# Replace the rollup rows of the given scopes (all of them by default) with
+# freshly computed counts. The counts are aggregated inside SQLite, so
+# memory stays flat however long the history.
+def rebuild_rollups(c, scopes=SCOPES):
+    rows = 0
+    for scope in scopes:
+        key = SCOPES[scope]
+        c.execute("DELETE FROM loan_rollups WHERE scope = ?", (scope,))
+        for grain in GRAINS:
+            rows += c.execute(f"""
+            INSERT INTO loan_rollups (scope, grain, period, key, loans)
+            SELECT '{scope}', '{grain}', {_period(grain, 'l')}, {key.format(row='l')}, COUNT(*) FROM loans l GROUP BY 3, 4
+            """).rowcount
+    return rows
+
+# Compare stored rollups against actual counts.
+# Returns a list of (scope, grain, period, key, stored, actual) for every row that drifted.
+def verify_rollups(conn):
+    stored = {tuple(row[:4]): row[4] for row in conn.execute("SELECT scope, grain, period, key, loans FROM loan_rollups") if row[4] != 0}
+    actual = actual_rollups(conn)
+    drift = []
+    for rollup in sorted(set(stored) | set(actual), key=repr):
+        if stored.get(rollup, 0) != actual.get(rollup, 0):
+            drift.append((*rollup, stored.get(rollup, 0), actual.get(rollup, 0)))
+    return drift
+
+# Period of a moment at the given grain
+def period_of(moment, grain='day'):
+    return int(moment.strftime(GRAINS[grain]))
+
+# (grain, first period) covering the last `days` days up to now, or every
+# month when days is None
+def window(days=None, now=None):
+    if days is None:
+        return 'month', 0
+    return 'day', period_of((now or datetime.now()) - timedelta(days=days - 1))
+
+# Verify the rollups and rebuild them through the writer if they drifted
+def reconcile(path=None):
+    import library_db
+    drift = verify_rollups(library_db.get_connection(path))
+    if drift:
+        library_db.run_write(rebuild_rollups, path=path)
+    return drift
+
+def main(argv):
+    import library_db
+    command = argv[1] if len(argv) > 1 else 'verify'
+    if command == 'rebuild':
+        print(f"Rebuilt {library_db.run_write(rebuild_rollups)} rollup rows")
+    elif command in ('verify', 'reconcile'):
+        drift = reconcile() if command == 'reconcile' else verify_rollups(library_db.get_connection())
+        for scope, grain, period, key, stored, actual in drift:
+            print(f"{scope}/{grain}/{period}[{key}]: stored {stored}, actual {actual}")
+        print(f"{len(drift)} rollup rows drifted" + (" (rebuilt)" if drift and command == 'reconcile' else ""))
+        return 1 if drift and command == 'verify' else 0
+    else:
+        print("usage: python library_rollups.py [verify|reconcile|rebuild]")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
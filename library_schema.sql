@@ -41,6 +41,28 @@ CREATE TABLE reservations (
     status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'fulfilled', 'cancelled', 'expired'))
 );
 
+-- Secondary indexes for the hot access paths
+CREATE INDEX idx_loans_open_due ON loans (status, due_date) WHERE status IN ('borrowed', 'overdue');
+CREATE INDEX idx_loans_borrowed_due ON loans (due_date) WHERE status = 'borrowed';
+CREATE INDEX idx_loans_loan_date ON loans (loan_date);
+CREATE INDEX idx_loans_status_loan_date ON loans (status, loan_date);
+CREATE INDEX idx_loans_book_status ON loans (book_id, status);
+CREATE INDEX idx_loans_member_loan_date ON loans (member_id, loan_date);
+CREATE INDEX idx_loans_fines ON loans (return_date, member_id, fine_amount) WHERE fine_amount > 0;
+CREATE INDEX idx_books_status ON books (status);
+CREATE INDEX idx_books_category ON books (category);
+CREATE INDEX idx_reservations_book_status ON reservations (book_id, status);
+CREATE INDEX idx_reservations_date ON reservations (reservation_date);
+CREATE INDEX idx_members_status ON members (membership_status);
+
+-- Sort indexes for the paged listings
+CREATE INDEX idx_books_title ON books (title);
+CREATE INDEX idx_books_author ON books (author);
+CREATE INDEX idx_books_added_date ON books (added_date);
+CREATE INDEX idx_members_last_name ON members (last_name);
+CREATE INDEX idx_members_membership_date ON members (membership_date);
+CREATE INDEX idx_loans_due_date ON loans (due_date);
+
 -- Trigger to update book status when borrowed
 CREATE OR REPLACE FUNCTION update_book_status_on_loan() RETURNS TRIGGER AS $$
 BEGIN
@@ -0,0 +1,121 @@
+import re
+
+# Search box fields mapped to FTS5 columns
+BOOK_FIELDS = {
+    'Title': ['title'],
+    'Author': ['author'],
+    'Category': ['category'],
+}
+MEMBER_FIELDS = {
+    'Name': ['first_name', 'last_name'],
+}
+
+# Column weights for bm25(), in FTS table column order
+BOOK_WEIGHTS = (10.0, 5.0, 2.0, 1.0)      # title, author, category, isbn
+MEMBER_WEIGHTS = (5.0, 5.0, 2.0, 1.0)     # first_name, last_name, email, phone
+
+_TOKENS = re.compile(r'"([^"]*)"|(\S+)')
+_ISBN = re.compile(r'^[0-9Xx-]+$')
+_PHONE = re.compile(r'^[0-9+()\s.-]+$')
+
+def _quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+# Turn a search box entry into an FTS5 query.
+# Bare words match as prefixes, "quoted text" matches as a phrase, and
+# field:word restricts a word to one column (e.g. author:tolkien).
+def build_match(term, columns=None, field_columns=None):
+    parts = []
+    for phrase, word in _TOKENS.findall(term):
+        # A quoted token, possibly empty
+        if not word:
+            if phrase.strip():
+                parts.append(_quote(phrase))
+            continue
+        field, sep, rest = word.partition(':')
+        if sep and rest and field_columns and field.lower() in field_columns:
+            parts.append(f"{field.lower()} : {_quote(rest)}*")
+        else:
+            parts.append(f"{_quote(word)}*")
+    if not parts:
+        return None
+    query = ' '.join(parts)
+    if columns:
+        query = f"{{{' '.join(columns)}}} : ({query})"
+    return query
+
+def has_search_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'").fetchone() is not None
+
+# Substring lookup through a trigram table (needs at least three characters)
+def _trigram(conn, table, fts_table, key, column, term, limit):
+    if len(term) >= 3:
+        return conn.execute(f"""
+        SELECT t.* FROM {fts_table} f
+        JOIN {table} t ON t.{key} = f.rowid
+        WHERE {fts_table} MATCH ?
+        LIMIT ?
+        """, (f"{column} : {_quote(term)}", limit)).fetchall()
+    return conn.execute(f"SELECT * FROM {table} WHERE {column} LIKE ? LIMIT ?", (f"%{term}%", limit)).fetchall()
+
+# Ranked full-text lookup
+def _ranked(conn, table, fts_table, key, weights, query, limit):
+    return conn.execute(f"""
+    SELECT t.* FROM {fts_table} f
+    JOIN {table} t ON t.{key} = f.rowid
+    WHERE {fts_table} MATCH ?
+    ORDER BY bm25({fts_table}, {', '.join(str(w) for w in weights)})
+    LIMIT ?
+    """, (query, limit)).fetchall()
+
+# Search books across title, author, category and ISBN in one box.
+# field narrows the search to one of BOOK_FIELDS or 'ISBN'.
+def search_books(conn, term, field=None, limit=200):
+    term = term.strip()
+    if not term:
+        return []
+    if not has_search_index(conn):
+        return _like_books(conn, term, field, limit)
+
+    isbn_like = field is None and _ISBN.match(term) and any(ch.isdigit() for ch in term)
+    # Long digit runs are ISBN fragments; short ones may be titles like "1984"
+    if field == 'ISBN' or (isbn_like and sum(ch.isdigit() for ch in term) >= 5):
+        return _trigram(conn, 'books', 'books_isbn_tri', 'book_id', 'isbn', term.replace('-', ''), limit)
+
+    query = build_match(term, BOOK_FIELDS.get(field), ['title', 'author', 'category', 'isbn'])
+    if query is None:
+        return []
+    results = _ranked(conn, 'books', 'books_fts', 'book_id', BOOK_WEIGHTS, query, limit)
+    if not results and isbn_like:
+        results = _trigram(conn, 'books', 'books_isbn_tri', 'book_id', 'isbn', term.replace('-', ''), limit)
+    return results
+
+# Search members across name, email and phone in one box.
+# field narrows the search to 'Name', 'Email' or 'Phone'.
+def search_members(conn, term, field=None, limit=200):
+    term = term.strip()
+    if not term:
+        return []
+    if not has_search_index(conn):
+        return _like_members(conn, term, field, limit)
+
+    if field == 'Email' or (field is None and '@' in term):
+        return _trigram(conn, 'members', 'members_contact_tri', 'member_id', 'email', term, limit)
+    if field == 'Phone' or (field is None and _PHONE.match(term) and any(ch.isdigit() for ch in term)):
+        return _trigram(conn, 'members', 'members_contact_tri', 'member_id', 'phone', term, limit)
+
+    query = build_match(term, MEMBER_FIELDS.get(field), ['first_name', 'last_name', 'email', 'phone'])
+    if query is None:
+        return []
+    return _ranked(conn, 'members', 'members_fts', 'member_id', MEMBER_WEIGHTS, query, limit)
+
+# LIKE-based search for SQLite builds without FTS5
+def _like_books(conn, term, field, limit):
+    columns = {'Title': ['title'], 'Author': ['author'], 'ISBN': ['isbn'], 'Category': ['category']}.get(field, ['title', 'author', 'isbn', 'category'])
+    where = ' OR '.join(f"{col} LIKE ?" for col in columns)
+    return conn.execute(f"SELECT * FROM books WHERE {where} LIMIT ?", [f"%{term}%"] * len(columns) + [limit]).fetchall()
+
+def _like_members(conn, term, field, limit):
+    columns = {'Name': ['first_name', 'last_name'], 'Email': ['email'], 'Phone': ['phone']}.get(field, ['first_name', 'last_name', 'email', 'phone'])
+    where = ' OR '.join(f"{col} LIKE ?" for col in columns)
+    return conn.execute(f"SELECT * FROM members WHERE {where} LIMIT ?", [f"%{term}%"] * len(columns) + [limit]).fetchall()
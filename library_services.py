@@ -0,0 +1,508 @@
+import json
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import library_cache
+import library_db
+from library_circulation import LOAN_DAYS, checkout_batch, checkout_loan, return_batch
+from library_holds import delete_hold, hold_queue, place_hold, release_books, set_hold_status
+from library_ledger import WINDOW_TOTALS, record_payment, window_totals
+from library_paging import BOOKS, LOANS, MEMBERS, count_rows, fetch_page
+from library_rollups import period_of, window
+from library_search import search_books, search_members
+from library_stats import read_counters, read_total
+
+# Data access for the app, the API, jobs and benchmarks.
+# Repositories and services own the SQL; callers get namedtuple rows whose
+# fields are the query's columns, and nothing here imports Streamlit, pandas
+# or plotly. Statements are module constants, so each pooled connection
+# compiles one once and then reuses it from sqlite3's statement cache.
+#
+# Reads run on the calling thread's pooled connection; snapshot() wraps
+# several of them in one read transaction so they see the same data. Each
+# write is one writer job and so one transaction: a check and the change it
+# guards (no deleting a book that is out on loan) commit together, and
+# nothing from another desk can land in between.
+
+Book = namedtuple('Book', 'book_id title author isbn publication_year category status shelf_location added_date')
+Member = namedtuple('Member', 'member_id first_name last_name email phone address membership_date membership_status')
+Loan = namedtuple('Loan', 'loan_id book_title member loan_date due_date return_date status fine_amount')
+
+# Choices for the desk's drop-downs
+BookChoice = namedtuple('BookChoice', 'book_id title held_for')
+MemberChoice = namedtuple('MemberChoice', 'member_id name')
+
+MemberLoan = namedtuple('MemberLoan', 'loan_id book_title loan_date due_date status')
+RecentLoan = namedtuple('RecentLoan', 'loan_id book_title member loan_date due_date status')
+LoanDetails = namedtuple('LoanDetails', 'loan_id title author member loan_date due_date return_date status fine_amount category')
+OpenLoan = namedtuple('OpenLoan', 'loan_id book_id book_title member due_date category')
+
+Reservation = namedtuple('Reservation', 'reservation_id book_title member reservation_date expiry_date status place_in_line')
+QueuedBook = namedtuple('QueuedBook', 'book_id title waiting')
+QueueEntry = namedtuple('QueueEntry', 'reservation_id member reservation_date expiry_date')
+
+OverdueLoan = namedtuple('OverdueLoan', 'book_title author member due_date category')
+PopularBook = namedtuple('PopularBook', 'book_id book_title author number_of_loans')
+CategoryLoans = namedtuple('CategoryLoans', 'category number_of_loans')
+ActiveMember = namedtuple('ActiveMember', 'member_name number_of_loans')
+MemberFines = namedtuple('MemberFines', 'member_name fines_assessed fines_paid')
+FineTotals = namedtuple('FineTotals', 'assessed paid')
+StatusCount = namedtuple('StatusCount', 'status count')
+CategoryCount = namedtuple('CategoryCount', 'category count')
+DecadeCount = namedtuple('DecadeCount', 'decade count')
+MonthlyLoans = namedtuple('MonthlyLoans', 'month loan_count')
+LoanTrend = namedtuple('LoanTrend', 'year category loans average_days_out late_share')
+
+BOOK_SELECT = f"SELECT {', '.join(Book._fields)} FROM books"
+MEMBER_SELECT = f"SELECT {', '.join(Member._fields)} FROM members"
+
+# Write job: change a book's status
+def set_book_status(conn, book_id, status):
+    conn.execute("UPDATE books SET status = ? WHERE book_id = ?", (status, book_id))
+
+# Write job: add a book, returning its book_id
+def add_book(conn, title, author, isbn, publication_year, category, status, shelf_location):
+    return conn.execute("""
+    INSERT INTO books (title, author, isbn, publication_year, category, status, shelf_location)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    RETURNING book_id
+    """, (title, author, isbn, publication_year, category, status, shelf_location)).fetchone()[0]
+
+def update_book(conn, book_id, title, author, isbn, publication_year, category, shelf_location):
+    conn.execute("""
+    UPDATE books
+    SET title = ?, author = ?, isbn = ?, publication_year = ?, category = ?, shelf_location = ?
+    WHERE book_id = ?
+    """, (title, author, isbn, publication_year, category, shelf_location, book_id))
+
+# Write job: delete a book unless it is out on loan. Returns whether it was deleted.
+def delete_book(conn, book_id):
+    if conn.execute("SELECT 1 FROM loans WHERE book_id = ? AND status = 'borrowed' LIMIT 1", (book_id,)).fetchone():
+        return False
+    conn.execute("DELETE FROM books WHERE book_id = ?", (book_id,))
+    return True
+
+def set_member_status(conn, member_id, status):
+    conn.execute("UPDATE members SET membership_status = ? WHERE member_id = ?", (status, member_id))
+
+# Write job: add a member, returning the member_id, or None if the email is taken
+def add_member(conn, first_name, last_name, email, phone, address, status):
+    if conn.execute("SELECT 1 FROM members WHERE email = ?", (email,)).fetchone():
+        return None
+    return conn.execute("""
+    INSERT INTO members (first_name, last_name, email, phone, address, membership_status)
+    VALUES (?, ?, ?, ?, ?, ?)
+    RETURNING member_id
+    """, (first_name, last_name, email, phone, address, status)).fetchone()[0]
+
+def update_member(conn, member_id, first_name, last_name, email, phone, address):
+    conn.execute("""
+    UPDATE members
+    SET first_name = ?, last_name = ?, email = ?, phone = ?, address = ?
+    WHERE member_id = ?
+    """, (first_name, last_name, email, phone, address, member_id))
+
+# Write job: delete a member with no active loans. Returns whether it was deleted.
+def delete_member(conn, member_id):
+    if conn.execute("SELECT 1 FROM loans WHERE member_id = ? AND status = 'borrowed' LIMIT 1", (member_id,)).fetchone():
+        return False
+    conn.execute("DELETE FROM members WHERE member_id = ?", (member_id,))
+    return True
+
+# Write job: change a loan's status, closing it out when it is returned
+def set_loan_status(conn, loan_id, new_status, now=None):
+    if new_status == 'returned':
+        # Return date, fine and the next hold, as for a desk return
+        row = conn.execute("SELECT book_id, due_date, category FROM loans l LEFT JOIN books b USING (book_id) WHERE loan_id = ?", (loan_id,)).fetchone()
+        if row is not None:
+            from library_fines import compute_fines
+            now = (now or datetime.now()).replace(microsecond=0)
+            book_id, due_date, category = row
+            days, fines = compute_fines([due_date], [now], [category])
+            conn.execute("""
+            UPDATE loans SET status = 'returned', return_date = ?, fine_amount = ?
+            WHERE loan_id = ?
+            """, (now, float(fines[0]), loan_id))
+            release_books(conn, [book_id], now)
+            return
+    conn.execute("UPDATE loans SET status = ? WHERE loan_id = ?", (new_status, loan_id))
+
+# Round a timestamp up to the next whole minute, so "now"-relative report
+# queries share cache entries for up to a minute
+def minute_ceiling(moment):
+    floor = moment.replace(second=0, microsecond=0)
+    return floor if floor == moment else floor + timedelta(minutes=1)
+
+# Common plumbing: the pooled read connection, typed reads and writer jobs
+class Service:
+    def __init__(self, path=None):
+        self.path = path
+
+    @property
+    def conn(self):
+        return library_db.get_connection(self.path)
+
+    def _all(self, row_type, sql, params=()):
+        return [row_type._make(row) for row in self.conn.execute(sql, params)]
+
+    def _one(self, row_type, sql, params=()):
+        row = self.conn.execute(sql, params).fetchone()
+        return row_type._make(row) if row is not None else None
+
+    # Read through the query cache; entries are dropped when their tables are
+    # written. Inside snapshot() the cache is bypassed: a cached result may
+    # predate the snapshot the block's other reads see.
+    def _cached(self, row_type, sql, params=(), ttl=None):
+        if self.conn.in_transaction:
+            return self._all(row_type, sql, params)
+        return [row_type._make(row) for row in library_cache.cached_query(self.conn, sql, params, ttl, self.path)]
+
+    # Run func(conn, *args) as one transaction on the writer and wait for it
+    def _write(self, func, *args):
+        return library_db.run_write(func, *args, path=self.path)
+
+    # Run the reads in the block against one snapshot of the database
+    @contextmanager
+    def snapshot(self):
+        conn = self.conn
+        if conn.in_transaction:
+            yield self
+            return
+        conn.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            conn.commit()
+
+# A table with a paged listing
+class ListingService(Service):
+    listing = None
+    row_type = None
+
+    # One page of the listing; see library_paging.fetch_page
+    def page(self, sort=None, descending=None, filters=None, page_size=50, cursor=None):
+        rows, next_cursor = fetch_page(self.conn, self.listing, sort, descending, filters, page_size, cursor)
+        return [self.row_type._make(row) for row in rows], next_cursor
+
+    # (count, exact) of the listing's rows under the filters
+    def count(self, filters=None):
+        return count_rows(self.conn, self.listing, filters)
+
+class BookRepository(ListingService):
+    listing = BOOKS
+    row_type = Book
+
+    def get(self, book_id):
+        return self._one(Book, f"{BOOK_SELECT} WHERE book_id = ?", (book_id,))
+
+    # Books by id in one query, as {book_id: Book}
+    def get_many(self, book_ids):
+        rows = self._all(Book, f"{BOOK_SELECT} WHERE book_id IN (SELECT value FROM json_each(?))",
+                         (json.dumps(list(book_ids)),))
+        return {book.book_id: book for book in rows}
+
+    def search(self, term, field=None, limit=200):
+        return [Book._make(row) for row in search_books(self.conn, term, field, limit)]
+
+    # Books that can be lent: on the shelf, or on the hold shelf for someone
+    def lendable(self):
+        return self._all(BookChoice, """
+        SELECT b.book_id, b.title, CASE WHEN b.status = 'reserved' THEN m.first_name || ' ' || m.last_name END
+        FROM books b
+        LEFT JOIN reservations r ON r.book_id = b.book_id AND r.status = 'ready'
+        LEFT JOIN members m ON r.member_id = m.member_id
+        WHERE b.status = 'available' OR b.status = 'reserved'
+        """)
+
+    # Books that can be reserved: out on loan or on the hold shelf
+    def reservable(self):
+        return self._all(BookChoice, "SELECT book_id, title, NULL FROM books WHERE status IN ('borrowed', 'reserved')")
+
+    def add(self, title, author, isbn, publication_year, category, status, shelf_location):
+        return self._write(add_book, title, author, isbn, publication_year, category, status, shelf_location)
+
+    def update(self, book_id, title, author, isbn, publication_year, category, shelf_location):
+        self._write(update_book, book_id, title, author, isbn, publication_year, category, shelf_location)
+
+    def set_status(self, book_id, status):
+        self._write(set_book_status, book_id, status)
+
+    def delete(self, book_id):
+        return self._write(delete_book, book_id)
+
+class MemberRepository(ListingService):
+    listing = MEMBERS
+    row_type = Member
+
+    def get(self, member_id):
+        return self._one(Member, f"{MEMBER_SELECT} WHERE member_id = ?", (member_id,))
+
+    # Members by id in one query, as {member_id: Member}
+    def get_many(self, member_ids):
+        rows = self._all(Member, f"{MEMBER_SELECT} WHERE member_id IN (SELECT value FROM json_each(?))",
+                         (json.dumps(list(member_ids)),))
+        return {member.member_id: member for member in rows}
+
+    def search(self, term, field=None, limit=200):
+        return [Member._make(row) for row in search_members(self.conn, term, field, limit)]
+
+    # Members who may borrow
+    def active(self):
+        return self._all(MemberChoice, "SELECT member_id, first_name || ' ' || last_name FROM members WHERE membership_status = 'active'")
+
+    # Every member, by name
+    def by_name(self):
+        return self._all(MemberChoice, "SELECT member_id, first_name || ' ' || last_name FROM members ORDER BY last_name, first_name")
+
+    # A member's loans, newest first, optionally only those in one status
+    def loans(self, member_id, status=None, limit=-1):
+        return self._all(MemberLoan, """
+        SELECT l.loan_id, b.title, l.loan_date, l.due_date, l.status
+        FROM loans l
+        JOIN books b ON l.book_id = b.book_id
+        WHERE l.member_id = ?1 AND (?2 IS NULL OR l.status = ?2)
+        ORDER BY l.loan_date DESC
+        LIMIT ?3
+        """, (member_id, status, limit))
+
+    def add(self, first_name, last_name, email, phone, address, status):
+        return self._write(add_member, first_name, last_name, email, phone, address, status)
+
+    def update(self, member_id, first_name, last_name, email, phone, address):
+        self._write(update_member, member_id, first_name, last_name, email, phone, address)
+
+    def set_status(self, member_id, status):
+        self._write(set_member_status, member_id, status)
+
+    def delete(self, member_id):
+        return self._write(delete_member, member_id)
+
+class LoanService(ListingService):
+    listing = LOANS
+    row_type = Loan
+
+    def details(self, loan_id):
+        return self._one(LoanDetails, """
+        SELECT l.loan_id, b.title, b.author, m.first_name || ' ' || m.last_name,
+               l.loan_date, l.due_date, l.return_date, l.status, l.fine_amount, b.category
+        FROM loans l
+        JOIN books b ON l.book_id = b.book_id
+        JOIN members m ON l.member_id = m.member_id
+        WHERE l.loan_id = ?
+        """, (loan_id,))
+
+    def recent(self, limit=5):
+        return self._cached(RecentLoan, """
+        SELECT l.loan_id, b.title, m.first_name || ' ' || m.last_name, l.loan_date, l.due_date, l.status
+        FROM loans l
+        JOIN books b ON l.book_id = b.book_id
+        JOIN members m ON l.member_id = m.member_id
+        ORDER BY l.loan_date DESC
+        LIMIT ?
+        """, (limit,))
+
+    # Loans that are still out
+    def open_loans(self):
+        return self._all(OpenLoan, """
+        SELECT l.loan_id, b.book_id, b.title, m.first_name || ' ' || m.last_name, l.due_date, b.category
+        FROM loans l
+        JOIN books b ON l.book_id = b.book_id
+        JOIN members m ON l.member_id = m.member_id
+        WHERE l.status IN ('borrowed', 'overdue')
+        """)
+
+    # Lend one book; returns a result dict with 'ok' and the loan or a 'message'
+    def checkout(self, book_id, member_id, loan_days=LOAN_DAYS):
+        return self._write(checkout_loan, book_id, member_id, loan_days)
+
+    # Lend (book_id, member_id) pairs in one transaction, one result per item
+    def checkout_many(self, items, loan_days=LOAN_DAYS):
+        return self._write(checkout_batch, list(items), loan_days)
+
+    # Return loans in one transaction, charging fines as of now
+    def return_many(self, loan_ids):
+        return self._write(return_batch, list(loan_ids))
+
+    def return_loan(self, loan_id):
+        return self.return_many([loan_id])[0]
+
+    def set_status(self, loan_id, status):
+        self._write(set_loan_status, loan_id, status)
+
+    # Record a fine payment, in dollars
+    def record_payment(self, member_id, amount):
+        return self._write(record_payment, member_id, amount)
+
+class ReservationService(Service):
+    # Reservations, newest first, with pending holds' place in line; every
+    # one, or only those of a book, a member or a status. The place is
+    # counted on the hold queue index, so it holds under any filter.
+    def all(self, book_id=None, member_id=None, status=None, limit=-1):
+        return self._all(Reservation, """
+        SELECT r.reservation_id, b.title, m.first_name || ' ' || m.last_name,
+               r.reservation_date, r.expiry_date, r.status,
+               CASE WHEN r.status = 'pending' THEN (
+                   SELECT COUNT(*) FROM reservations q
+                   WHERE q.book_id = r.book_id AND q.status = 'pending' AND q.queue_position <= r.queue_position
+               ) END
+        FROM reservations r
+        JOIN books b ON r.book_id = b.book_id
+        JOIN members m ON r.member_id = m.member_id
+        WHERE (?1 IS NULL OR r.book_id = ?1) AND (?2 IS NULL OR r.member_id = ?2) AND (?3 IS NULL OR r.status = ?3)
+        ORDER BY r.reservation_date DESC, r.reservation_id DESC
+        LIMIT ?4
+        """, (book_id, member_id, status, limit))
+
+    # Books with members waiting, longest queue first
+    def queued_books(self):
+        return self._all(QueuedBook, """
+        SELECT b.book_id, b.title, COUNT(*)
+        FROM reservations r
+        JOIN books b ON r.book_id = b.book_id
+        WHERE r.status = 'pending'
+        GROUP BY b.book_id
+        ORDER BY COUNT(*) DESC
+        """)
+
+    def queue(self, book_id):
+        return [QueueEntry._make(row) for row in hold_queue(self.conn, book_id)]
+
+    # Join the back of a book's hold queue; returns a result dict with 'ok' and the 'place'
+    def place(self, book_id, member_id, expiry_date):
+        return self._write(place_hold, book_id, member_id, expiry_date)
+
+    # Change a hold's status by hand; returns the status it ended up with
+    def set_status(self, reservation_id, status):
+        return self._write(set_hold_status, reservation_id, status)
+
+    def delete(self, reservation_id):
+        self._write(delete_hold, reservation_id)
+
+# Read-only reports. Aggregates go through the query cache, and the ones
+# relative to now take a minute-rounded now so they can share entries.
+class ReportService(Service):
+    def counters(self, scope):
+        return read_counters(self.conn, scope)
+
+    def total(self, scope):
+        return read_total(self.conn, scope)
+
+    def overdue(self, now=None):
+        return self._cached(OverdueLoan, """
+        SELECT b.title, b.author, m.first_name || ' ' || m.last_name, l.due_date, b.category
+        FROM loans l
+        JOIN books b ON l.book_id = b.book_id
+        JOIN members m ON l.member_id = m.member_id
+        WHERE l.status IN ('borrowed', 'overdue') AND l.due_date < ?
+        ORDER BY l.due_date
+        """, (now or minute_ceiling(datetime.now()),))
+
+    # Most lent books over the last `days` days (all time when None), from the
+    # rollups and per book, so editions sharing a title stay apart
+    def popular_books(self, days=None, limit=10):
+        return self._cached(PopularBook, """
+        SELECT b.book_id, b.title, b.author, r.loan_count
+        FROM (
+            SELECT key, SUM(loans) as loan_count
+            FROM loan_rollups
+            WHERE scope = 'book' AND grain = ? AND period >= ?
+            GROUP BY key
+        ) r
+        JOIN books b ON b.book_id = r.key
+        WHERE r.loan_count > 0
+        ORDER BY r.loan_count DESC, b.book_id
+        LIMIT ?
+        """, (*window(days), limit))
+
+    def popular_categories(self, days=None):
+        return self._cached(CategoryLoans, """
+        SELECT NULLIF(key, ''), SUM(loans)
+        FROM loan_rollups
+        WHERE scope = 'category' AND grain = ? AND period >= ?
+        GROUP BY key
+        HAVING SUM(loans) > 0
+        ORDER BY SUM(loans) DESC
+        """, window(days))
+
+    def active_members(self, days=None, limit=10):
+        return self._cached(ActiveMember, """
+        SELECT m.first_name || ' ' || m.last_name, r.loan_count
+        FROM (
+            SELECT key, SUM(loans) as loan_count
+            FROM loan_rollups
+            WHERE scope = 'member' AND grain = ? AND period >= ?
+            GROUP BY key
+        ) r
+        JOIN members m ON m.member_id = r.key
+        WHERE r.loan_count > 0
+        ORDER BY r.loan_count DESC, m.member_id
+        LIMIT ?
+        """, (*window(days), limit))
+
+    # Fines assessed and paid per member over the last `days` days, and the
+    # library totals, in dollars. Window totals are differences of the
+    # ledger's daily running totals; both reads see the same snapshot, so
+    # the member rows are read fresh rather than from the cache.
+    def fine_collection(self, days=None, now=None):
+        params = (window(days)[1], period_of(now or datetime.now()))
+        with self.snapshot():
+            members = self._cached(MemberFines, f"""
+            SELECT m.first_name || ' ' || m.last_name, t.assessed / 100.0, t.paid / 100.0
+            FROM ({WINDOW_TOTALS}) t
+            JOIN members m ON t.member_id = m.member_id
+            ORDER BY t.assessed DESC, t.paid DESC
+            """, params)
+            assessed, paid = window_totals(self.conn, *params)
+        return members, FineTotals(assessed / 100, paid / 100)
+
+    def books_by_status(self):
+        return self._cached(StatusCount, "SELECT status, COUNT(*) FROM books GROUP BY status")
+
+    def books_by_category(self):
+        return self._cached(CategoryCount, "SELECT category, COUNT(*) FROM books GROUP BY category ORDER BY COUNT(*) DESC")
+
+    # Books per publication decade, newest first
+    def publication_decades(self):
+        return self._cached(DecadeCount, """
+        SELECT
+            CASE
+                WHEN publication_year >= 2020 THEN '2020s'
+                WHEN publication_year >= 2010 THEN '2010s'
+                WHEN publication_year >= 2000 THEN '2000s'
+                WHEN publication_year >= 1990 THEN '1990s'
+                WHEN publication_year >= 1980 THEN '1980s'
+                WHEN publication_year >= 1970 THEN '1970s'
+                WHEN publication_year >= 1960 THEN '1960s'
+                WHEN publication_year >= 1950 THEN '1950s'
+                ELSE 'Before 1950'
+            END,
+            COUNT(*)
+        FROM books
+        GROUP BY 1
+        ORDER BY 1 DESC
+        """)
+
+    # Loans per month (1-12) of a year, months without loans left out
+    def monthly_loans(self, year):
+        return self._cached(MonthlyLoans, """
+        SELECT period % 100, loans
+        FROM loan_rollups
+        WHERE scope = 'all' AND grain = 'month' AND period BETWEEN ? AND ? AND key = '' AND loans > 0
+        ORDER BY period
+        """, (year * 100 + 1, year * 100 + 12))
+
+    # Loans per year and category with the average days out and the late
+    # share; library_analytics.loan_trends answers the same from a snapshot
+    def loan_trends(self, now=None):
+        return self._cached(LoanTrend, """
+        SELECT CAST(strftime('%Y', l.loan_date, 'unixepoch', 'localtime') AS INTEGER),
+               IFNULL(b.category, 'Uncategorized'),
+               COUNT(*),
+               AVG((IFNULL(l.return_date, ?1) - l.loan_date) / 86400.0),
+               AVG(IFNULL(l.return_date, ?1) > l.due_date)
+        FROM loans l
+        LEFT JOIN books b ON l.book_id = b.book_id
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        """, (now or minute_ceiling(datetime.now()),))
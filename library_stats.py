@@ -0,0 +1,124 @@
+import sys
+
+# Materialized counters behind the dashboard.
+# Each counter is a (scope, key) row kept current by triggers, so the
+# dashboard reads a handful of rows instead of running COUNT(*) scans.
+# NULL keys (e.g. books without a category) are stored as ''.
+
+# scope -> (table, key expression) used to rebuild and verify the counters
+COUNTERS = {
+    'books': ('books', "''"),
+    'books_status': ('books', "IFNULL(status, '')"),
+    'books_category': ('books', "IFNULL(category, '')"),
+    'members': ('members', "''"),
+    'members_status': ('members', "IFNULL(membership_status, '')"),
+    'loans': ('loans', "''"),
+    'loans_status': ('loans', "IFNULL(status, '')"),
+}
+
+# Trigger bodies per table: the counters each row contributes to
+_ROW_KEYS = {
+    'books': [('books', "''"), ('books_status', "IFNULL({row}.status, '')"), ('books_category', "IFNULL({row}.category, '')")],
+    'members': [('members', "''"), ('members_status', "IFNULL({row}.membership_status, '')")],
+    'loans': [('loans', "''"), ('loans_status', "IFNULL({row}.status, '')")],
+}
+
+# Columns whose updates move a row between counters
+_TRACKED = {
+    'books': ['status', 'category'],
+    'members': ['membership_status'],
+    'loans': ['status'],
+}
+
+def _bump(scope, key, delta):
+    return f"""
+            INSERT INTO library_stats (scope, key, value) VALUES ('{scope}', {key}, {delta})
+            ON CONFLICT (scope, key) DO UPDATE SET value = value + {delta};"""
+
+# Create the counters table and its triggers, then fill it
+def create_stats_schema(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS library_stats (
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, key)
+    ) WITHOUT ROWID
+    ''')
+    for table, keys in _ROW_KEYS.items():
+        inserts = ''.join(_bump(scope, key.format(row='new'), 1) for scope, key in keys)
+        deletes = ''.join(_bump(scope, key.format(row='old'), -1) for scope, key in keys)
+        moved = [(scope, key) for scope, key in keys if key != "''"]
+        updates = ''.join(_bump(scope, key.format(row='old'), -1) + _bump(scope, key.format(row='new'), 1) for scope, key in moved)
+        changed = ' OR '.join(f"old.{col} IS NOT new.{col}" for col in _TRACKED[table])
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_ai AFTER INSERT ON {table} BEGIN {inserts} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_ad AFTER DELETE ON {table} BEGIN {deletes} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_au AFTER UPDATE OF {', '.join(_TRACKED[table])} ON {table} WHEN {changed} BEGIN {updates} END")
+    rebuild_stats(c)
+
+# Recompute the actual counts with GROUP BY scans
+def actual_counts(c, scopes=COUNTERS):
+    counts = {}
+    for scope in scopes:
+        table, key = COUNTERS[scope]
+        for k, n in c.execute(f"SELECT {key}, COUNT(*) FROM {table} GROUP BY 1"):
+            counts[(scope, k)] = n
+    return counts
+
+# Replace the counters with freshly computed counts: all of them, or only
+# those counting rows of the given tables
+def rebuild_stats(c, tables=None):
+    scopes = [scope for scope, (table, key) in COUNTERS.items() if tables is None or table in tables]
+    counts = actual_counts(c, scopes)
+    c.executemany("DELETE FROM library_stats WHERE scope = ?", [(scope,) for scope in scopes])
+    c.executemany("INSERT INTO library_stats (scope, key, value) VALUES (?, ?, ?)", [(scope, key, n) for (scope, key), n in counts.items()])
+    return len(counts)
+
+# Compare stored counters against actual counts.
+# Returns a list of (scope, key, stored, actual) for every counter that drifted.
+def verify_stats(conn):
+    stored = {(scope, key): value for scope, key, value in conn.execute("SELECT scope, key, value FROM library_stats") if value != 0}
+    actual = actual_counts(conn)
+    drift = []
+    for counter in sorted(set(stored) | set(actual)):
+        if stored.get(counter, 0) != actual.get(counter, 0):
+            drift.append((counter[0], counter[1], stored.get(counter, 0), actual.get(counter, 0)))
+    return drift
+
+# Read one scope's counters as {key: value}, NULL keys as None
+def read_counters(conn, scope):
+    return {
+        key if key != '' else None: value
+        for key, value in conn.execute("SELECT key, value FROM library_stats WHERE scope = ? AND value != 0", (scope,))
+    }
+
+def read_total(conn, scope):
+    row = conn.execute("SELECT value FROM library_stats WHERE scope = ? AND key = ''", (scope,)).fetchone()
+    return row[0] if row else 0
+
+# Verify the counters and rebuild them through the writer if they drifted
+def reconcile(path=None):
+    import library_db
+    drift = verify_stats(library_db.get_connection(path))
+    if drift:
+        library_db.run_write(rebuild_stats, path=path)
+    return drift
+
+def main(argv):
+    import library_db
+    command = argv[1] if len(argv) > 1 else 'verify'
+    if command == 'rebuild':
+        print(f"Rebuilt {library_db.run_write(rebuild_stats)} counters")
+    elif command in ('verify', 'reconcile'):
+        drift = reconcile() if command == 'reconcile' else verify_stats(library_db.get_connection())
+        for scope, key, stored, actual in drift:
+            print(f"{scope}[{key}]: stored {stored}, actual {actual}")
+        print(f"{len(drift)} counters drifted" + (" (rebuilt)" if drift and command == 'reconcile' else ""))
+        return 1 if drift and command == 'verify' else 0
+    else:
+        print("usage: python library_stats.py [verify|reconcile|rebuild]")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,331 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import library_db
+from library_fines import DEFAULT_POLICY
+from library_ledger import backfill_ledger
+from library_rollups import rebuild_rollups
+from library_stats import rebuild_stats
+
+# Synthetic libraries for benchmarks.
+# generate() builds a database at the full schema with as many books,
+# members, loans and reservations as asked for. The same seed, sizes and
+# `now` always give the same rows. Activity is skewed like a real library:
+# loans follow a Zipf curve over books and members, titles reuse common
+# words, the loan rate grows towards the present, and most loans come back
+# within the loan period.
+#
+# The state is consistent, as the app would have left it:
+# - a book has at most one open loan and is 'borrowed' while it does;
+# - open loans past their due date are 'overdue', with fines accrued;
+# - returned loans carry their fines, and those fines are in the ledger;
+# - pending holds queue on borrowed books, and 'reserved' books have a
+#   'ready' hold.
+#
+# Rows are bulk-loaded with the secondary indexes and triggers dropped.
+# The search indexes, counters, rollups and ledger are then rebuilt in one
+# pass each, as a bulk import does.
+
+SEED = 42
+YEARS = 5
+CHUNK = 200000
+
+SCALES = {
+    'small': {'books': 10000, 'members': 2000, 'loans': 100000, 'reservations': 10000},
+    'medium': {'books': 100000, 'members': 20000, 'loans': 1000000, 'reservations': 100000},
+    'large': {'books': 1000000, 'members': 200000, 'loans': 10000000, 'reservations': 1000000},
+    'xlarge': {'books': 3000000, 'members': 500000, 'loans': 30000000, 'reservations': 3000000},
+}
+
+CATEGORIES = ["Fiction", "Non-Fiction", "Mystery", "Science Fiction", "Fantasy", "Biography", "History", "Romance", "Self-Help", "Other"]
+CATEGORY_WEIGHTS = [0.24, 0.18, 0.12, 0.09, 0.1, 0.06, 0.07, 0.08, 0.04, 0.02]
+MEMBER_STATUS_WEIGHTS = {'active': 0.9, 'expired': 0.07, 'suspended': 0.03}
+LOAN_DAYS = 14
+PICKUP_DAYS = 3
+DAY = 86400
+
+# Loans out within this many days may still be open; this share of them is
+OPEN_WINDOW = 45
+OPEN_SHARE = 0.35
+# Share of books lost, and of available books waiting on the hold shelf
+LOST_SHARE = 0.005
+READY_SHARE = 0.002
+# Share of the reservations still pending; the rest are history
+PENDING_SHARE = 0.15
+
+_ONSETS = ['b', 'c', 'd', 'f', 'g', 'h', 'j', 'k', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'w', 'br', 'ch', 'cl', 'dr', 'gr', 'sh', 'st', 'th', 'tr']
+_VOWELS = ['a', 'e', 'i', 'o', 'u', 'ai', 'ea', 'ou']
+_CODAS = ['', '', 'n', 'r', 's', 'l', 'th', 'nd', 'st', 'ck']
+
+# Deterministic pronounceable words, shortest first
+def _words(rng, count, syllables):
+    words = set()
+    while len(words) < count:
+        n = rng.integers(syllables[0], syllables[1] + 1)
+        words.add(''.join(_ONSETS[rng.integers(len(_ONSETS))] + _VOWELS[rng.integers(len(_VOWELS))] for _ in range(n))
+                  + _CODAS[rng.integers(len(_CODAS))])
+    return sorted(words, key=lambda word: (len(word), word))
+
+# Indices 0..size-1 drawn with Zipf weights 1/rank**skew, rank 0 the most likely
+def _zipf(rng, size, count, skew):
+    cdf = np.cumsum(1.0 / np.arange(1, size + 1) ** skew)
+    return np.minimum(np.searchsorted(cdf, rng.random(count) * cdf[-1]), size - 1)
+
+def _pick(rng, values, weights, count):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), count, p=np.asarray(weights) / sum(weights))]
+
+def _insert(conn, sql, rows):
+    conn.execute("BEGIN")
+    conn.executemany(sql, rows)
+    conn.execute("COMMIT")
+
+# Drop the secondary indexes and triggers of the library tables, returning their definitions
+def _drop_derived(conn):
+    saved = conn.execute("""
+    SELECT type, name, sql FROM sqlite_master
+    WHERE tbl_name IN ('books', 'members', 'loans', 'reservations', 'fine_ledger')
+      AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """).fetchall()
+    for kind, name, sql in saved:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return saved
+
+# JSON array of ids, for json_each()
+def _json_ids(ids):
+    return '[' + ','.join(map(str, np.asarray(ids).tolist())) + ']'
+
+class Generator:
+    def __init__(self, conn, books, members, loans, reservations, seed=SEED, now=None, years=YEARS, progress=None):
+        self.conn = conn
+        self.sizes = {'books': books, 'members': members, 'loans': loans, 'reservations': reservations}
+        self.rng = np.random.default_rng(seed)
+        self.now = int((now or datetime.now()).replace(microsecond=0).timestamp())
+        self.start = self.now - years * 365 * DAY
+        self.progress = progress or (lambda message: None)
+        # Popularity rank -> id, so popular books and busy members are spread over the id range
+        self.book_ids = self.rng.permutation(books) + 1
+        self.member_ids = self.rng.permutation(members) + 1
+        self.words = _words(self.rng, 4000, (1, 3))
+        self.first_names = [word.capitalize() for word in _words(self.rng, 400, (1, 2))]
+        self.last_names = [word.capitalize() for word in _words(self.rng, 1500, (2, 3))]
+        self.policy = DEFAULT_POLICY
+
+    def run(self):
+        saved = _drop_derived(self.conn)
+        self.books()
+        self.members()
+        borrowed = self.loans()
+        self.reservations(borrowed)
+        self.progress("rebuilding indexes, search, counters, rollups and the ledger")
+        self.conn.execute("BEGIN")
+        for kind, name, sql in saved:
+            self.conn.execute(sql)
+        if library_db.fts5_available(self.conn):
+            for name in library_db.SEARCH_TABLES:
+                self.conn.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+        rebuild_stats(self.conn)
+        rebuild_rollups(self.conn)
+        backfill_ledger(self.conn)
+        self.conn.execute("COMMIT")
+        self.conn.execute("ANALYZE")
+
+    def _times(self, count, lo, hi):
+        return self.rng.integers(lo, hi, count)
+
+    def books(self):
+        n = self.sizes['books']
+        self.progress(f"{n:,} books")
+        rng = self.rng
+        self.categories = _pick(rng, CATEGORIES, CATEGORY_WEIGHTS, n)
+        self.book_status = np.full(n + 1, 'available', dtype=object)
+        lost = rng.random(n + 1) < LOST_SHARE
+        self.book_status[lost] = 'lost'
+        for lo in range(0, n, CHUNK):
+            size = min(CHUNK, n - lo)
+            ids = np.arange(lo + 1, lo + size + 1)
+            lengths = rng.integers(1, 6, size)
+            words = _zipf(rng, len(self.words), int(lengths.sum()), 1.05)
+            ends = np.cumsum(lengths)
+            titles = [' '.join(self.words[w] for w in words[end - length:end]).capitalize() for end, length in zip(ends, lengths)]
+            # A few prolific authors and a long tail
+            authors = [f"{self.first_names[a % len(self.first_names)]} {self.last_names[a // len(self.first_names) % len(self.last_names)]}"
+                       for a in _zipf(rng, len(self.first_names) * len(self.last_names), size, 0.9)]
+            years = np.clip(2025 - rng.exponential(18, size).astype(int), 1800, 2025)
+            added = self._times(size, self.start - 10 * 365 * DAY, self.now)
+            rows = zip(ids.tolist(), titles, authors, [f"979{i:010d}" for i in ids.tolist()], years.tolist(), self.categories[lo:lo + size].tolist(),
+                       self.book_status[ids].tolist(), [f"{chr(65 + i % 26)}{i % 97 + 1}" for i in ids.tolist()], added.tolist())
+            _insert(self.conn, """
+            INSERT INTO books (book_id, title, author, isbn, publication_year, category, status, shelf_location, added_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def members(self):
+        n = self.sizes['members']
+        self.progress(f"{n:,} members")
+        rng = self.rng
+        for lo in range(0, n, CHUNK):
+            size = min(CHUNK, n - lo)
+            ids = np.arange(lo + 1, lo + size + 1).tolist()
+            first = [self.first_names[i] for i in rng.integers(len(self.first_names), size=size)]
+            last = [self.last_names[i] for i in rng.integers(len(self.last_names), size=size)]
+            phones = [f"555-{p // 10000:03d}-{p % 10000:04d}" for p in rng.integers(0, 10 ** 7, size).tolist()]
+            addresses = [f"{number} {self.words[w].capitalize()} St" for number, w in zip(rng.integers(1, 2000, size).tolist(), rng.integers(len(self.words), size=size).tolist())]
+            joined = self._times(size, self.start - 5 * 365 * DAY, self.now)
+            statuses = _pick(rng, list(MEMBER_STATUS_WEIGHTS), list(MEMBER_STATUS_WEIGHTS.values()), size)
+            rows = zip(ids, first, last, [f"{f.lower()}.{l.lower()}.{i}@example.org" for f, l, i in zip(first, last, ids)],
+                       phones, addresses, joined.tolist(), statuses.tolist())
+            _insert(self.conn, """
+            INSERT INTO members (member_id, first_name, last_name, email, phone, address, membership_date, membership_status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def _fines(self, late_seconds, book_ids):
+        days = np.maximum(late_seconds // DAY, 0)
+        chargeable = np.maximum(days - self.policy.grace_days, 0)
+        fines = chargeable * self.policy.rates(self.categories[book_ids - 1], len(book_ids))
+        if self.policy.max_fine is not None:
+            fines = np.minimum(fines, self.policy.max_fine)
+        return np.round(fines, 2)
+
+    # Loans in loan_date order, chunk by chunk. Returns the ids of the books out on loan.
+    def loans(self):
+        n = self.sizes['loans']
+        self.progress(f"{n:,} loans")
+        rng = self.rng
+        lent = np.zeros(self.sizes['books'] + 1, dtype=bool)
+        chunks = max(1, -(-n // CHUNK))
+        span = self.now - self.start
+        for chunk in range(chunks):
+            size = n // chunks + (1 if chunk < n % chunks else 0)
+            # Loan dates follow a density rising towards now (u ** 0.6),
+            # each chunk covering its own slice of time
+            u = np.sort(rng.uniform(chunk / chunks, (chunk + 1) / chunks, size))
+            loan_date = self.start + (u ** 0.6 * span).astype(np.int64)
+            book = self.book_ids[_zipf(rng, self.sizes['books'], size, 0.85)]
+            member = self.member_ids[_zipf(rng, self.sizes['members'], size, 0.7)]
+            due = loan_date + LOAN_DAYS * DAY
+            returned = loan_date + (rng.gamma(2.0, 5.5, size) * DAY).astype(np.int64) + 3600
+            # Recent loans of books that are on the shelf may still be out
+            maybe_open = (loan_date > self.now - OPEN_WINDOW * DAY) & (rng.random(size) < OPEN_SHARE)
+            maybe_open &= (returned > self.now) | (rng.random(size) < 0.5)
+            candidates = np.flatnonzero(maybe_open & ~lent[book] & (self.book_status[book] == 'available'))
+            books, first = np.unique(book[candidates], return_index=True)
+            is_open = np.zeros(size, dtype=bool)
+            is_open[candidates[first]] = True
+            lent[books] = True
+            returned = np.where(is_open, 0, np.minimum(returned, self.now))
+            end = np.where(is_open, self.now, returned)
+            fines = self._fines(end - due, book)
+            status = np.where(~is_open, 'returned', np.where(due < self.now, 'overdue', 'borrowed'))
+            ids = np.arange(1, size + 1) + chunk * (n // chunks) + min(chunk, n % chunks)
+            rows = zip(ids.tolist(), book.tolist(), member.tolist(), loan_date.tolist(), due.tolist(),
+                       [r or None for r in returned.tolist()], status.tolist(), fines.tolist())
+            _insert(self.conn, """
+            INSERT INTO loans (loan_id, book_id, member_id, loan_date, due_date, return_date, status, fine_amount)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        borrowed = np.flatnonzero(lent)
+        self.book_status[borrowed] = 'borrowed'
+        self.conn.execute("BEGIN")
+        self.conn.execute("UPDATE books SET status = 'borrowed' WHERE book_id IN (SELECT value FROM json_each(?))",
+                          (_json_ids(borrowed),))
+        self.conn.execute("COMMIT")
+        return borrowed
+
+    # Holds: history on popular books, queues on books out on loan, and a
+    # ready hold for each book on the hold shelf
+    def reservations(self, borrowed):
+        n = self.sizes['reservations']
+        self.progress(f"{n:,} reservations")
+        rng = self.rng
+        available = np.flatnonzero(self.book_status == 'available')
+        available = available[available > 0]
+        ready_books = rng.choice(available, min(len(available), int(self.sizes['books'] * READY_SHARE)), replace=False) if len(available) else np.array([], dtype=np.int64)
+        pending = int(n * PENDING_SHARE) if len(borrowed) else 0
+        history = max(n - pending - len(ready_books), 0)
+
+        # Popular borrowed books get the longest queues
+        rank = np.empty(self.sizes['books'] + 1, dtype=np.int64)
+        rank[self.book_ids] = np.arange(self.sizes['books'])
+        queue_books = borrowed[np.argsort(rank[borrowed], kind='stable')] if pending else borrowed
+        book = np.concatenate([
+            self.book_ids[_zipf(rng, self.sizes['books'], history, 0.85)],
+            queue_books[_zipf(rng, len(queue_books), pending, 0.9)] if pending else np.array([], dtype=np.int64),
+            ready_books,
+        ]).astype(np.int64)
+        member = self.member_ids[_zipf(rng, self.sizes['members'], len(book), 0.7)]
+        status = np.concatenate([
+            _pick(rng, ['fulfilled', 'expired', 'cancelled'], [0.6, 0.25, 0.15], history),
+            np.full(pending, 'pending', dtype=object),
+            np.full(len(ready_books), 'ready', dtype=object),
+        ])
+        made = np.concatenate([
+            self.start + (rng.random(history) ** 0.6 * (self.now - OPEN_WINDOW * DAY - self.start)).astype(np.int64),
+            self.now - rng.integers(DAY, OPEN_WINDOW * DAY, pending),
+            self.now - rng.integers(3600, PICKUP_DAYS * DAY, len(ready_books)),
+        ])
+        expiry = np.where(status == 'ready', made + PICKUP_DAYS * DAY, made + 30 * DAY)
+        # One hold per member and book
+        keep = np.sort(np.unique(book * (self.sizes['members'] + 1) + member, return_index=True)[1])
+        book, member, status, made, expiry = book[keep], member[keep], status[keep], made[keep], expiry[keep]
+        # Queue positions number each book's holds in the order they were made
+        order = np.lexsort((made, book))
+        position = np.empty(len(book), dtype=np.int64)
+        sorted_books = book[order]
+        starts = np.flatnonzero(np.r_[True, sorted_books[1:] != sorted_books[:-1]])
+        position[order] = np.arange(len(book)) - np.repeat(starts, np.diff(np.r_[starts, len(book)])) + 1
+        by_date = np.argsort(made, kind='stable')
+        for lo in range(0, len(by_date), CHUNK):
+            i = by_date[lo:lo + CHUNK]
+            _insert(self.conn, """
+            INSERT INTO reservations (book_id, member_id, reservation_date, expiry_date, status, queue_position)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, zip(book[i].tolist(), member[i].tolist(), made[i].tolist(), expiry[i].tolist(), status[i].tolist(), position[i].tolist()))
+        self.conn.execute("BEGIN")
+        self.conn.execute("UPDATE books SET status = 'reserved' WHERE book_id IN (SELECT value FROM json_each(?))",
+                          (_json_ids(ready_books),))
+        self.conn.execute("COMMIT")
+
+# Build a synthetic library database at path (which must not exist yet).
+# Returns the row counts.
+def generate(path, books, members, loans, reservations, seed=SEED, now=None, years=YEARS, progress=None):
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    conn = library_db.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        library_db.init_db(conn)
+        library_db.migrate(conn)
+        # Nothing to lose if the load is interrupted; the file is rebuilt from
+        # the seed. Index builds sort on disk so large libraries fit in memory.
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA temp_store = FILE")
+        conn.execute("PRAGMA mmap_size = 0")
+        Generator(conn, books, members, loans, reservations, seed, now, years, progress).run()
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ('books', 'members', 'loans', 'reservations', 'fine_ledger')}
+    finally:
+        conn.close()
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='library_synth.py', description='Generate a synthetic library database for benchmarks.')
+    parser.add_argument('out')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    for table in ('books', 'members', 'loans', 'reservations'):
+        parser.add_argument(f"--{table}", type=int, help=f"number of {table} (overrides --scale)")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--years', type=int, default=YEARS, help='years of loan history')
+    parser.add_argument('--now', type=datetime.fromisoformat, help='date the history ends (default: today); fix it to get the same file twice')
+    args = parser.parse_args(argv[1:])
+    sizes = {table: getattr(args, table) or size for table, size in SCALES[args.scale].items()}
+    started = time.monotonic()
+    counts = generate(args.out, **sizes, seed=args.seed, now=args.now, years=args.years, progress=lambda message: print(f"  {message}", flush=True))
+    print(f"Generated {', '.join(f'{n:,} {table}' for table, n in counts.items())} in {time.monotonic() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
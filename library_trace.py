@@ -0,0 +1,361 @@
+import bisect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import library_db
+from library_advisor import EXPLAINABLE, plan_findings
+
+# Per-statement query tracing and the slow-query log.
+# With LIBRARY_QUERY_TRACE set, new connections are TracedConnections, whose
+# cursors time every statement: the time spent in execute() plus in fetching
+# its rows, so a SELECT read row by row is timed until its last row. Each
+# normalized statement gets a call count, a latency histogram, rows read or
+# written, errors and lock wait. Lock wait is the time spent in statements
+# that take the write lock (BEGIN IMMEDIATE or EXCLUSIVE), plus statements
+# that gave up with "database is locked"; SQLite waits there, up to
+# busy_timeout, while another connection writes.
+#
+# Statements slower than LIBRARY_SLOW_MS are explained on the spot (EXPLAIN
+# QUERY PLAN with the same parameters) and written as JSON lines to a
+# rotating log, LIBRARY_SLOW_LOG. The tracer does not use the sqlite3 trace
+# callback, so it runs alongside the index advisor; its own EXPLAINs go
+# through plain cursors and are not traced.
+#
+# Tracing costs a couple of clock reads per statement and per row read one
+# at a time (about 0.3 us a row), so it is off unless asked for.
+
+TRACE = os.environ.get('LIBRARY_QUERY_TRACE')
+SLOW_MS = float(os.environ.get('LIBRARY_SLOW_MS', '100'))
+SLOW_LOG = os.environ.get('LIBRARY_SLOW_LOG', 'library_slow.log')
+SLOW_LOG_BYTES = int(os.environ.get('LIBRARY_SLOW_LOG_MB', '10')) * 1024 * 1024
+SLOW_LOG_BACKUPS = 5
+# Slow statements kept in memory for the diagnostics page
+RECENT_SLOW = 200
+# Distinct statements tracked; any more are counted together under OTHER
+MAX_STATEMENTS = 1000
+OTHER = '(other statements)'
+# Upper bounds of the latency histogram buckets, in ms; the last bucket is open
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_LOCKING = ('BEGIN IMMEDIATE', 'BEGIN EXCLUSIVE')
+_SPACES = re.compile(r"\s+")
+
+# Statements arrive with their values as parameters, so only the layout differs
+def normalize(sql):
+    return _SPACES.sub(' ', sql).strip()
+
+def _locked(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+# Parameters for the log, cut short (batch jobs bind long JSON arrays)
+def _short(params, limit=300):
+    text = repr(params)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+# Cursor that reports each statement to its connection's tracer once the
+# statement is done: when its rows run out, or the cursor runs another
+# statement, is closed or is dropped
+class TracedCursor(sqlite3.Cursor):
+    _pending = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        tracer = self.connection.tracer
+        if tracer is None:
+            return super().execute(sql, params)
+        started = time.perf_counter()
+        try:
+            super().execute(sql, params)
+        except sqlite3.Error as e:
+            tracer.record(self.connection, sql, params, time.perf_counter() - started, 0, error=e)
+            raise
+        # [tracer, sql, params, seconds so far, rows so far]
+        self._pending = [tracer, sql, params, time.perf_counter() - started, 0]
+        if self.description is None:
+            self._pending[4] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        return self._traced(super().executemany, sql, seq_of_params)
+
+    def executescript(self, script):
+        self._finish()
+        return self._traced(super().executescript, script)
+
+    # Run a statement whose rows are not read back, timing it as one call
+    def _traced(self, run, sql, *args):
+        tracer = self.connection.tracer
+        if tracer is None:
+            return run(sql, *args)
+        started = time.perf_counter()
+        try:
+            run(sql, *args)
+        except sqlite3.Error as e:
+            tracer.record(self.connection, sql, None, time.perf_counter() - started, 0, error=e)
+            raise
+        tracer.record(self.connection, sql, None, time.perf_counter() - started, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        pending = self._pending
+        if pending is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        pending[3] += time.perf_counter() - started
+        if row is None:
+            self._finish()
+        else:
+            pending[4] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        pending = self._pending
+        size = self.arraysize if size is None else size
+        if pending is None:
+            return super().fetchmany(size)
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        pending[3] += time.perf_counter() - started
+        pending[4] += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        pending = self._pending
+        if pending is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        pending[3] += time.perf_counter() - started
+        pending[4] += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        pending = self._pending
+        if pending is None:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            pending[3] += time.perf_counter() - started
+            self._finish()
+            raise
+        pending[3] += time.perf_counter() - started
+        pending[4] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            tracer, sql, params, seconds, rows = pending
+            tracer.record(self.connection, sql, params, seconds, rows)
+
+# Connection whose cursors are TracedCursors. Until a tracer attaches itself
+# (see QueryTracer.attach) the cursors time nothing.
+class TracedConnection(sqlite3.Connection):
+    tracer = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts would open plain cursors
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+# EXPLAIN QUERY PLAN detail lines, through a plain cursor so it is not traced
+def explain(conn, sql, params=()):
+    return [row[3] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+def _percentile(histogram, calls, max_ms, q):
+    seen = 0
+    for bound, count in zip(BUCKETS, histogram):
+        seen += count
+        if seen >= q * calls:
+            return min(bound, max_ms)
+    return max_ms
+
+# Statistics for every statement run on traced connections, and the slow-query log
+class QueryTracer:
+    def __init__(self, slow_ms=SLOW_MS, log_path=SLOW_LOG, log_bytes=SLOW_LOG_BYTES, log_backups=SLOW_LOG_BACKUPS):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = deque(maxlen=RECENT_SLOW)
+        self._log = None
+        if log_path:
+            import logging.handlers
+            self._log = logging.handlers.RotatingFileHandler(log_path, maxBytes=log_bytes, backupCount=log_backups, delay=True)
+
+    # Trace every connection opened from now on
+    def install(self):
+        library_db.CONNECTION_FACTORY = TracedConnection
+        if self.attach not in library_db.CONNECT_HOOKS:
+            library_db.CONNECT_HOOKS.append(self.attach)
+
+    def uninstall(self):
+        if self.attach in library_db.CONNECT_HOOKS:
+            library_db.CONNECT_HOOKS.remove(self.attach)
+        library_db.CONNECTION_FACTORY = sqlite3.Connection
+
+    def attach(self, conn):
+        if isinstance(conn, TracedConnection):
+            conn.tracer = self
+
+    def record(self, conn, sql, params, seconds, rows, error=None):
+        key = normalize(sql)
+        # Plans looked up by diagnostics are not the app's statements
+        if key.upper().startswith('EXPLAIN'):
+            return
+        ms = seconds * 1000
+        lock_ms = ms if key.upper().startswith(_LOCKING) or (error is not None and _locked(error)) else 0.0
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    key = OTHER
+                    entry = self._statements.get(key)
+                if entry is None:
+                    entry = self._statements[key] = {
+                        'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'lock_ms': 0.0,
+                        'errors': 0, 'slow': 0, 'histogram': [0] * (len(BUCKETS) + 1), 'plan': None,
+                    }
+            entry['calls'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['rows'] += rows
+            entry['lock_ms'] += lock_ms
+            entry['errors'] += error is not None
+            entry['histogram'][bisect.bisect_left(BUCKETS, ms)] += 1
+            # A sample to explain on demand
+            entry['sample'] = (sql, params)
+            if ms >= self.slow_ms:
+                entry['slow'] += 1
+        if ms >= self.slow_ms:
+            self._log_slow(conn, key, sql, params, ms, rows, lock_ms, error)
+
+    def _log_slow(self, conn, key, sql, params, ms, rows, lock_ms, error):
+        plan = []
+        if params is not None and key.upper().startswith(EXPLAINABLE + ('INSERT',)):
+            try:
+                plan = explain(conn, sql, params)
+            except sqlite3.Error as e:
+                plan = [f"could not explain: {e}"]
+        entry = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'ms': round(ms, 2),
+            'rows': rows,
+            'lock_ms': round(lock_ms, 2),
+            'error': str(error) if error is not None else None,
+            'thread': threading.current_thread().name,
+            'statement': key,
+            'params': _short(params),
+            'plan': plan,
+            'findings': ['{}: {}'.format(*finding) for finding in plan_findings(plan)],
+        }
+        with self._lock:
+            self._slow.append(entry)
+            if plan and key in self._statements:
+                self._statements[key]['plan'] = plan
+        if self._log is not None:
+            import logging
+            self._log.handle(logging.makeLogRecord({'msg': json.dumps(entry, default=str)}))
+
+    # The n statements with the highest `order` (total_ms, calls, max_ms, ...)
+    def top(self, n=20, order='total_ms'):
+        with self._lock:
+            statements = [(key, dict(entry)) for key, entry in self._statements.items()]
+        results = []
+        for key, entry in statements:
+            calls = entry['calls']
+            results.append({
+                'statement': key,
+                'calls': calls,
+                'total_ms': round(entry['total_ms'], 2),
+                'mean_ms': round(entry['total_ms'] / calls, 3),
+                'p50_ms': _percentile(entry['histogram'], calls, round(entry['max_ms'], 3), 0.5),
+                'p95_ms': _percentile(entry['histogram'], calls, round(entry['max_ms'], 3), 0.95),
+                'max_ms': round(entry['max_ms'], 3),
+                'rows': entry['rows'],
+                'lock_ms': round(entry['lock_ms'], 2),
+                'errors': entry['errors'],
+                'slow': entry['slow'],
+            })
+        results.sort(key=lambda r: r[order], reverse=True)
+        return results[:n]
+
+    # (bucket label, count) pairs of a statement's latency histogram
+    def histogram(self, key):
+        with self._lock:
+            counts = list(self._statements[key]['histogram'])
+        labels = [f"≤{bound:g} ms" for bound in BUCKETS] + [f">{BUCKETS[-1]:g} ms"]
+        return list(zip(labels, counts))
+
+    # A statement's query plan: the one captured when it was last slow, or
+    # else its sample explained now on `conn`
+    def plan(self, key, conn=None):
+        with self._lock:
+            entry = self._statements[key]
+            plan, (sql, params) = entry['plan'], entry['sample']
+        if plan is not None:
+            return plan
+        if params is None or not key.upper().startswith(EXPLAINABLE + ('INSERT',)):
+            return []
+        try:
+            return explain(conn or library_db.get_connection(), sql, params)
+        except sqlite3.Error as e:
+            return [f"could not explain: {e}"]
+
+    # Slow statements seen since the tracer started, newest first
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+# Return the process-wide tracer when LIBRARY_QUERY_TRACE is set, else None.
+# Call it before the first connection is opened; connections opened earlier
+# are not traced.
+def get_tracer():
+    global _tracer
+    if not TRACE:
+        return None
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = QueryTracer()
+            _tracer.install()
+    return _tracer
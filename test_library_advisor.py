@@ -0,0 +1,28 @@
+import library_db
+from library_advisor import IndexAdvisor, normalize, plan_findings
+
+def test_normalize_groups_statements_by_shape():
+    assert normalize("SELECT *  FROM books\n WHERE book_id = 12 AND title = 'It''s'") == "SELECT * FROM books WHERE book_id = ? AND title = ?"
+
+def test_plan_findings_flag_scans_and_sorts():
+    plan = ['SCAN loans', 'SCAN books USING INDEX idx_books_status', 'SEARCH members USING INTEGER PRIMARY KEY (rowid=?)',
+            'USE TEMP B-TREE FOR ORDER BY', 'SCAN CONSTANT ROW']
+    assert [kind for kind, detail in plan_findings(plan)] == ['full scan', 'index scan', 'temp b-tree']
+
+def test_advisor_records_and_explains_statements(db):
+    advisor = IndexAdvisor(db)
+    advisor.install()
+    try:
+        conn = library_db.connect(db)
+        for book_id in (1, 2, 3):
+            conn.execute("SELECT title FROM books WHERE book_id = ?", (book_id,)).fetchone()
+        conn.execute("SELECT COUNT(*) FROM loans WHERE fine_amount = 3").fetchone()
+        conn.close()
+    finally:
+        advisor.uninstall()
+
+    report = {row['statement']: row for row in advisor.report()}
+    assert report["SELECT title FROM books WHERE book_id = ?"]['executions'] == 3
+    assert report["SELECT title FROM books WHERE book_id = ?"]['full_scans'] == 0
+    flagged = advisor.report(only_flagged=True)
+    assert [row['statement'] for row in flagged] == ["SELECT COUNT(*) FROM loans WHERE fine_amount = ?"]
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+import library_api
+from library_api import ApiError, LibraryApi, Request, read_request
+
+@pytest.fixture
+def api(db):
+    api = LibraryApi(db, workers=2)
+    yield api
+    api.close()
+
+def _call(api, method, target, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    return asyncio.run(api.respond(Request(method, target, {}, data)))
+
+def _read(raw):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(read())
+
+def test_lookups_and_routing(api):
+    status, book = _call(api, 'GET', '/books/1')
+    assert status == 200 and book['title'] == 'To Kill a Mockingbird'
+    assert _call(api, 'GET', '/books/999') == (404, {'error': "book not found"})
+    assert _call(api, 'GET', '/nowhere')[0] == 404
+    assert _call(api, 'DELETE', '/books/1')[0] == 405
+    assert _call(api, 'GET', '/books?limit=ten') == (400, {'error': "limit must be an integer"})
+
+def test_loans_are_created_once(api):
+    status, loan = _call(api, 'POST', '/loans', {'book_id': 1, 'member_id': 2})
+    assert status == 201 and loan['ok']
+    status, refused = _call(api, 'POST', '/loans', {'book_id': 1, 'member_id': 3})
+    assert status == 409 and refused['message'] == "book is borrowed"
+
+@pytest.mark.parametrize('body', [
+    {'book_id': 'one', 'member_id': 2},
+    {'member_id': 2},
+    {'book_id': 1, 'member_id': 2, 'loan_days': 0},
+    {'book_id': 1, 'member_id': 2, 'loan_days': -14},
+    {'book_id': 1, 'member_id': 2, 'loan_days': library_api.MAX_LOAN_DAYS + 1},
+])
+def test_bad_loans_are_refused(api, body):
+    assert _call(api, 'POST', '/loans', body)[0] == 400
+    assert _call(api, 'POST', '/loans/batch', {'items': [[1, 2]], **body})[0] == (400 if 'loan_days' in body else 200)
+
+def test_refused_holds_are_conflicts(api):
+    status, refused = _call(api, 'POST', '/reservations', {'book_id': 1, 'member_id': 3})
+    assert status == 409 and refused['message'] == "book is available"
+    _call(api, 'POST', '/loans', {'book_id': 1, 'member_id': 2})
+    status, hold = _call(api, 'POST', '/reservations', {'book_id': 1, 'member_id': 3, 'expiry_date': '2030-01-01T00:00:00'})
+    assert status == 201 and hold['place'] == 1
+    assert _call(api, 'POST', '/reservations', {'book_id': 1, 'member_id': 3})[0] == 409
+
+def test_requests_are_parsed():
+    request = _read(b'POST /loans?x=1 HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}')
+    assert (request.method, request.path, request.query, request.body) == ('POST', '/loans', {'x': '1'}, b'{}')
+    assert request.headers['connection'] == 'close'
+    assert _read(b'') is None
+
+@pytest.mark.parametrize('length, status', [('abc', 400), ('-1', 400), ('+2', 400), ('1_0', 400), ('2 2', 400),
+                                            (str(library_api.MAX_BODY + 1), 413)])
+def test_bad_content_lengths_are_refused(length, status):
+    with pytest.raises(ApiError) as refused:
+        _read(f'POST /loans HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}'.encode())
+    assert refused.value.status == status
+
+def test_the_server_answers_a_malformed_request_and_hangs_up(api):
+    async def exchange():
+        server = await asyncio.start_server(api.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'POST /loans HTTP/1.1\r\nContent-Length: lots\r\n\r\n{}')
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+        return response
+
+    head, _, body = asyncio.run(exchange()).partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 400 Bad Request') and b'Connection: close' in head
+    assert json.loads(body) == {'error': "invalid Content-Length"}
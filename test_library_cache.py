@@ -0,0 +1,89 @@
+from collections import namedtuple
+
+import library_cache
+import library_db
+from library_cache import QueryCache, read_tables
+from library_services import Service
+
+TITLE = "SELECT title FROM books WHERE book_id = ?"
+
+def _retitle(db, title, book_id=1):
+    library_db.execute_write("UPDATE books SET title = ? WHERE book_id = ?", (title, book_id), path=db)
+
+def test_read_tables():
+    assert read_tables("SELECT * FROM loans l JOIN books b ON b.book_id = l.book_id LEFT JOIN \"members\" m") == {'loans', 'books', 'members'}
+
+def test_repeated_reads_are_served_from_the_cache(conn, db):
+    cache = QueryCache()
+    assert cache.query(conn, TITLE, (1,), path=db) == [('To Kill a Mockingbird',)]
+    assert cache.query(conn, "SELECT  title\n FROM books WHERE book_id = ?", (1,), path=db) == [('To Kill a Mockingbird',)]
+    assert cache.query(conn, TITLE, (2,), path=db) == [('1984',)]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+
+def test_a_write_through_the_writer_is_never_served_stale(conn, db):
+    library_cache.cached_query(conn, TITLE, (1,), path=db)
+    _retitle(db, 'Go Set a Watchman')
+    assert library_cache.cached_query(conn, TITLE, (1,), path=db) == [('Go Set a Watchman',)]
+
+def test_a_write_from_another_process_is_never_served_stale(conn, db, monkeypatch):
+    cache = QueryCache()
+    cache.query(conn, TITLE, (1,), path=db)
+    # Another process's writer: this process's listeners never hear about it
+    monkeypatch.setattr(library_db, 'WRITE_LISTENERS', [])
+    _retitle(db, 'Go Set a Watchman')
+    assert cache.query(conn, TITLE, (1,), path=db) == [('Go Set a Watchman',)]
+    assert cache.stats()['invalidations'] == 1
+
+def test_writes_drop_only_entries_that_read_the_table(conn, db):
+    cache = QueryCache()
+    cache.query(conn, TITLE, (1,), path=db)
+    cache.query(conn, "SELECT COUNT(*) FROM members", path=db)
+    cache.invalidate(db, {'books'})
+    assert cache.stats()['entries'] == 1
+    cache.query(conn, "SELECT COUNT(*) FROM members", path=db)
+    assert cache.stats()['hits'] == 1
+
+def test_a_write_during_the_query_keeps_its_result_out(conn, db):
+    cache = QueryCache()
+
+    class Racing:
+        def execute(self, sql, params=()):
+            if sql == TITLE:
+                cache.invalidate(db, {'books'})
+            return conn.execute(sql, params)
+
+    cache.query(Racing(), TITLE, (1,), path=db)
+    assert cache.stats()['entries'] == 0
+
+def test_entries_expire_and_the_least_recently_used_are_evicted(conn, db):
+    cache = QueryCache()
+    cache.query(conn, TITLE, (1,), ttl=0, path=db)
+    cache.query(conn, TITLE, (1,), path=db)
+    assert cache.stats()['expirations'] == 1
+
+    size = {book_id: library_cache.result_size(conn.execute(TITLE, (book_id,)).fetchall()) for book_id in (1, 2, 3)}
+    # Room for book 1 and one other
+    small = QueryCache(max_bytes=size[1] + max(size[2], size[3]))
+    for book_id in (1, 2, 1, 3):
+        small.query(conn, TITLE, (book_id,), path=db)
+    # Book 2 was the least recently used when book 3 came in
+    assert small.stats()['evictions'] == 1
+    small.query(conn, TITLE, (1,), path=db)
+    small.query(conn, TITLE, (2,), path=db)
+    assert (small.stats()['hits'], small.stats()['misses']) == (2, 4)
+
+def test_reads_inside_a_snapshot_bypass_the_cache(db):
+    Title = namedtuple('Title', 'title')
+
+    class Titles(Service):
+        def get(self, book_id):
+            return self._cached(Title, TITLE, (book_id,))
+
+    titles = Titles(db)
+    titles.get(5)
+    before = library_cache.cache_stats()
+    with titles.snapshot():
+        assert titles.get(5) == [Title('The Hobbit')]
+    after = library_cache.cache_stats()
+    assert (after['hits'], after['misses']) == (before['hits'], before['misses'])
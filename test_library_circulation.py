@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import library_db
+from library_circulation import checkout, checkout_batch, checkout_books, checkout_loan, return_batch, return_books
+
+NOW = datetime(2026, 3, 20, 12, 0, 0)
+
+def _messages(results):
+    return [result.get('message', 'ok') for result in results]
+
+def test_a_batch_lends_what_it_can_and_says_why_not(db, conn):
+    conn.execute("UPDATE members SET membership_status = 'suspended' WHERE member_id = 5")
+    conn.execute("UPDATE books SET status = 'lost' WHERE book_id = 6")
+    items = [(1, 1), (2, 2), (1, 3), (99, 1), (3, 99), (4, 5), (6, 1)]
+    results = library_db.run_write(checkout_batch, items, 7, NOW, path=db)
+    assert _messages(results) == ['ok', 'ok', 'book is already in this batch', 'book not found',
+                                  'member not found', 'member is suspended', 'book is lost']
+    assert results[0]['due_date'] == NOW + timedelta(days=7)
+    loans = conn.execute("SELECT loan_id, book_id, member_id, status FROM loans WHERE status = 'borrowed' ORDER BY book_id").fetchall()
+    assert loans == [(results[0]['loan_id'], 1, 1, 'borrowed'), (results[1]['loan_id'], 2, 2, 'borrowed')]
+    assert conn.execute("SELECT status FROM books WHERE book_id IN (1, 2, 3)").fetchall() == [('borrowed',), ('borrowed',), ('available',)]
+
+    # Lent books cannot go out again until they are back
+    assert _messages(checkout_books([(1, 4)], path=db)) == ['book is borrowed']
+
+def test_a_batch_returns_open_loans_and_charges_fines(db, conn):
+    lent = library_db.run_write(checkout_batch, [(1, 1), (2, 2)], 14, NOW - timedelta(days=20), path=db)
+    loan_ids = [result['loan_id'] for result in lent]
+    results = library_db.run_write(return_batch, loan_ids + [loan_ids[0], 999, 1], NOW, path=db)
+    assert _messages(results) == ['ok', 'ok', 'loan is already in this batch', 'loan not found', 'loan is returned']
+    assert results[0]['fine'] == results[1]['fine'] > 0
+    assert conn.execute("SELECT status, return_date, fine_amount FROM loans WHERE loan_id = ?", (loan_ids[0],)).fetchone() == \
+        ('returned', NOW, results[0]['fine'])
+    assert conn.execute("SELECT status FROM books WHERE book_id IN (1, 2)").fetchall() == [('available',), ('available',)]
+    assert _messages(return_books(loan_ids[:1], path=db)) == ['loan is returned']
+
+def test_checkout_explains_a_refusal(db, conn):
+    conn.execute("UPDATE members SET membership_status = 'expired' WHERE member_id = 5")
+    assert checkout(1, 1, path=db)['ok']
+    assert [checkout(*item, path=db)['message'] for item in [(1, 2), (99, 2), (2, 99), (2, 5)]] == \
+        ['book is borrowed', 'book not found', 'member not found', 'member is expired']
+
+def test_racing_desks_lend_a_book_once(db, conn):
+    desks = 8
+    start = threading.Barrier(desks)
+
+    # Every desk on its own connection, as separate processes would be
+    def desk(member_id):
+        own = library_db.connect(db, isolation_level=None)
+        try:
+            start.wait(5)
+            own.execute("BEGIN")
+            result = checkout_loan(own, 3, member_id, now=NOW)
+            own.execute("COMMIT")
+            return result
+        finally:
+            own.close()
+
+    with ThreadPoolExecutor(desks) as pool:
+        results = list(pool.map(desk, [1 + i % 6 for i in range(desks)]))
+    assert sum(result['ok'] for result in results) == 1
+    assert {result.get('message') for result in results if not result['ok']} == {'book is borrowed'}
+    assert conn.execute("SELECT COUNT(*) FROM loans WHERE book_id = 3").fetchone()[0] == 1
+
+    # And through the writer, many threads asking at once
+    with ThreadPoolExecutor(desks) as pool:
+        results = list(pool.map(lambda member_id: checkout(4, member_id, path=db), range(1, 7)))
+    assert sum(result['ok'] for result in results) == 1
+    assert conn.execute("SELECT COUNT(*) FROM loans WHERE book_id = 4 AND status = 'borrowed'").fetchone()[0] == 1
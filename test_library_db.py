@@ -0,0 +1,161 @@
+import calendar
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+
+import library_db
+
+def _columns(conn, table):
+    return {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _in_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+def test_a_thread_keeps_its_connection(db):
+    pool = library_db.ConnectionPool(db)
+    assert pool.connection() is pool.connection()
+    assert pool.stats()['opens'] == 1 and pool.stats()['hits'] == 1
+    pool.close()
+
+def test_connections_of_finished_threads_are_reused(db):
+    pool = library_db.ConnectionPool(db)
+    first = _in_thread(pool.connection)
+    second = _in_thread(pool.connection)
+    assert second is first
+    stats = pool.stats()
+    assert (stats['opens'], stats['reuses'], stats['in_use'], stats['idle']) == (1, 1, 0, 1)
+    pool.close()
+
+def test_a_full_pool_waits_for_a_thread_to_finish(db):
+    pool = library_db.ConnectionPool(db, max_size=1)
+    holding = threading.Event()
+    done = threading.Event()
+
+    def hold():
+        pool.connection()
+        holding.set()
+        done.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    holding.wait(5)
+    threading.Timer(0.1, done.set).start()
+    _in_thread(pool.connection)
+    holder.join()
+    stats = pool.stats()
+    assert stats['waits'] == 1 and stats['opens'] == 1
+    pool.close()
+
+def test_a_rolled_back_connection_goes_back_to_the_pool(db):
+    pool = library_db.ConnectionPool(db)
+
+    def leave_open():
+        conn = pool.connection()
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM books").fetchone()
+        return conn
+
+    conn = _in_thread(leave_open)
+    pool.stats()
+    assert not conn.in_transaction
+    pool.close()
+
+def test_bootstrap_runs_once_per_database(db, monkeypatch):
+    calls = []
+    monkeypatch.setattr(library_db, 'migrate', lambda conn: calls.append(conn))
+    library_db.bootstrap(db)
+    assert calls == []
+    assert library_db.get_connection(db) is library_db.get_connection(db)
+
+def test_bootstrap_enables_wal_and_the_tuned_pragmas(db, conn):
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == library_db.PRAGMAS['busy_timeout']
+
+def test_write_queue_rolls_back_a_failed_job_only(db, conn):
+    def fail(c):
+        c.execute("UPDATE books SET shelf_location = 'X9' WHERE book_id = 1")
+        raise ValueError("boom")
+
+    writer = library_db.get_writer(db)
+    failed = writer.submit(fail)
+    moved = writer.submit(lambda c: c.execute("UPDATE books SET shelf_location = 'Z1' WHERE book_id = 2").rowcount)
+    assert moved.result() == 1
+    with pytest.raises(ValueError):
+        failed.result()
+    shelves = dict(conn.execute("SELECT book_id, shelf_location FROM books WHERE book_id IN (1, 2)"))
+    assert shelves == {1: 'A1', 2: 'Z1'}
+
+def test_write_queue_commits_queued_jobs_together(db, conn):
+    writer = library_db.WriteQueue(db)
+    release = threading.Event()
+    blocker = writer.submit(lambda c: release.wait(5))
+    jobs = [writer.submit(lambda c, i=i: c.execute("UPDATE books SET shelf_location = ? WHERE book_id = 3", (f"Q{i}",)).rowcount)
+            for i in range(50)]
+    release.set()
+    assert blocker.result() and [job.result() for job in jobs] == [1] * 50
+    stats = writer.stats()
+    assert stats['jobs'] == 51 and stats['commits'] <= 2
+    assert conn.execute("SELECT shelf_location FROM books WHERE book_id = 3").fetchone() == ('Q49',)
+    writer.close()
+
+def test_write_listeners_hear_about_trigger_maintained_tables(db, monkeypatch):
+    heard = []
+    monkeypatch.setattr(library_db, 'WRITE_LISTENERS', [lambda path, tables: heard.append(tables)])
+    library_db.execute_write("UPDATE books SET status = 'maintenance' WHERE book_id = 4", path=db)
+    assert {'books', 'library_stats'} <= heard[-1]
+
+def test_write_queue_fails_fast_when_the_database_cannot_be_opened(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        library_db.WriteQueue(str(tmp_path / 'missing' / 'library.db'))
+
+def test_legacy_database_is_unversioned(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    assert library_db.schema_version(conn) == 0
+    assert conn.execute("SELECT typeof(loan_date) FROM loans").fetchone() == ('text',)
+    conn.close()
+
+def test_migrations_bring_legacy_database_to_latest(db, conn):
+    assert library_db.schema_version(conn) == library_db.MIGRATIONS[-1][0]
+    for table in ['books', 'members', 'loans', 'reservations', 'library_stats', 'loan_rollups',
+                  'fine_ledger', 'fine_daily', 'dropped_schema', 'table_versions']:
+        assert _columns(conn, table), table
+    assert 'queue_position' in _columns(conn, 'reservations')
+    # The data survives the table rebuilds
+    assert conn.execute("SELECT COUNT(*) FROM books").fetchone()[0] == 11
+    assert conn.execute("SELECT COUNT(*) FROM members").fetchone()[0] == 6
+
+def test_migrations_create_the_access_path_indexes(db, conn):
+    indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_loans_open_due', 'idx_loans_borrowed_due', 'idx_books_status', 'idx_members_status'} <= indexes
+    plan = ' '.join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT loan_id FROM loans WHERE status = 'borrowed' AND due_date < 0"))
+    assert 'idx_loans_' in plan
+
+def test_migrations_store_timestamps_as_epoch_seconds(db, conn):
+    for table, (date_columns, columns) in library_db.EPOCH_TABLES.items():
+        for name in date_columns:
+            kinds = {kind for (kind,) in conn.execute(f"SELECT DISTINCT typeof({name}) FROM {table}")}
+            assert kinds <= {'integer', 'null'}, (table, name, kinds)
+
+def test_migrations_read_legacy_text_in_the_right_zone(db, conn):
+    def epoch(table, column, key, value):
+        return conn.execute(f"SELECT CAST({column} AS INTEGER) FROM {table} WHERE {key} = ?", (value,)).fetchone()[0]
+
+    # Defaults filled in by CURRENT_TIMESTAMP are UTC
+    assert epoch('books', 'added_date', 'book_id', 1) == calendar.timegm((2025, 3, 17, 14, 36, 17))
+    assert epoch('members', 'membership_date', 'member_id', 6) == calendar.timegm((2025, 3, 17, 14, 36, 55))
+    # The app wrote local time, as did the seeding of the sample members
+    assert epoch('members', 'membership_date', 'member_id', 1) == int(datetime(2025, 3, 17, 20, 6, 17).timestamp())
+    assert epoch('loans', 'loan_date', 'loan_id', 1) == int(datetime(2025, 3, 17, 20, 10, 33).timestamp())
+
+def test_migrate_is_idempotent(db, conn):
+    before = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+    library_db.migrate(library_db.connect(db))
+    after = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+    assert after == before
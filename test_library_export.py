@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+
+import pytest
+
+import library_export
+from library_export import ChunkReader, export_chunks, export_stream, export_to
+
+def _export(name, fmt='csv', db=None, workers=1, **kwargs):
+    out = io.BytesIO()
+    rows = export_to(name, out, fmt, path=db, workers=workers, **kwargs)
+    return rows, out.getvalue()
+
+def test_csv_and_jsonl(db):
+    rows, data = _export('books', 'csv', db)
+    table = list(csv.reader(io.StringIO(data.decode())))
+    assert rows == 11 and len(table) == 12
+    assert table[0] == [name for name, kind in library_export.EXPORTS['books'].columns]
+    assert table[1][:3] == ['1', 'To Kill a Mockingbird', 'Harper Lee']
+
+    rows, data = _export('loans', 'jsonl', db)
+    records = [json.loads(line) for line in data.decode().splitlines()]
+    assert rows == len(records) > 0
+    assert set(records[0]) == {name for name, kind in library_export.EXPORTS['loans'].columns}
+
+def test_parquet(db, conn):
+    pq = pytest.importorskip('pyarrow.parquet')
+    rows, data = _export('members', 'parquet', db)
+    table = pq.read_table(io.BytesIO(data))
+    assert rows == table.num_rows == 6
+    # The same local wall-clock times the app reads
+    assert table.column('membership_date').to_pylist() == \
+        [moment for (moment,) in conn.execute("SELECT membership_date FROM members ORDER BY member_id")]
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl', 'parquet'])
+def test_partitioned_exports_match_a_single_pass(db, monkeypatch, fmt):
+    if fmt == 'parquet':
+        pq = pytest.importorskip('pyarrow.parquet')
+    single = _export('books', fmt, db)
+    monkeypatch.setattr(library_export, 'PARTITION_ROWS', 3)
+    calls = []
+    partitioned = _export('books', fmt, db, workers=4, batch_size=2, progress=calls.append)
+    assert partitioned[0] == single[0] == sum(calls)
+    if fmt == 'parquet':
+        assert pq.read_table(io.BytesIO(partitioned[1])).equals(pq.read_table(io.BytesIO(single[1])))
+    else:
+        assert partitioned[1] == single[1]
+
+def test_every_partition_reads_one_snapshot(db, conn, monkeypatch):
+    monkeypatch.setattr(library_export, 'PARTITION_ROWS', 3)
+    renamed = []
+
+    # Commit a change to the last partition once the export is under way
+    def rename(n):
+        if not renamed:
+            conn.execute("UPDATE books SET title = 'Renamed' WHERE book_id = 10")
+            renamed.append(n)
+
+    rows, data = _export('books', 'csv', db, workers=4, batch_size=1, progress=rename)
+    assert renamed and rows == 11
+    titles = {row[0]: row[1] for row in csv.reader(io.StringIO(data.decode()))}
+    assert titles['10'] == 'The Da Vinci Code'
+    assert conn.execute("SELECT title FROM books WHERE book_id = 10").fetchone() == ('Renamed',)
+
+def test_chunks_stream_through_a_reader(db):
+    chunks = list(export_chunks('books', 'csv', path=db, batch_size=3))
+    assert len(chunks) > 3
+    reader = export_stream('books', 'csv', path=db)
+    reader.seek(0)
+    pieces = iter(lambda: reader.read(100), b'')
+    assert b''.join(pieces) == b''.join(chunks)
+    with pytest.raises(io.UnsupportedOperation):
+        reader.seek(0)
+
+def test_chunk_reader_reads_across_chunks():
+    reader = ChunkReader([b'ab', b'', b'cde', b'f'])
+    assert reader.read(4) == b'ab'
+    assert reader.read() == b'cdef'
+    assert reader.read() == b''
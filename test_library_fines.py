@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from library_fines import FinePolicy, add_fine_columns, compute_fines, to_datetimes
+
+NOW = datetime(2026, 3, 20, 12, 0, 0)
+
+def test_flat_rate_per_whole_day_overdue():
+    due = [NOW - timedelta(days=3), NOW - timedelta(days=3, hours=-1), NOW + timedelta(days=2)]
+    days, fines = compute_fines(due, policy=FinePolicy(daily_rate=0.5), now=NOW)
+    assert days.tolist() == [3, 2, 0]
+    assert fines.tolist() == [1.5, 1.0, 0.0]
+
+def test_returned_loans_stop_accruing_and_open_ones_run_to_now():
+    due = [NOW - timedelta(days=10), NOW - timedelta(days=10)]
+    returned = [NOW - timedelta(days=6), None]
+    days, fines = compute_fines(due, returned, policy=FinePolicy(daily_rate=0.25), now=NOW)
+    assert days.tolist() == [4, 10]
+    assert fines.tolist() == [1.0, 2.5]
+
+def test_grace_days_category_rates_and_cap():
+    policy = FinePolicy(daily_rate=0.5, category_rates={'Reference': 2.0}, grace_days=2, max_fine=10.0)
+    due = [NOW - timedelta(days=5)] * 3 + [NOW - timedelta(days=30)]
+    days, fines = compute_fines(due, categories=['Fiction', 'Reference', None, 'Reference'], policy=policy, now=NOW)
+    assert days.tolist() == [5, 5, 5, 30]
+    assert fines.tolist() == [1.5, 6.0, 1.5, 10.0]
+
+def test_missing_due_date_is_never_fined():
+    days, fines = compute_fines([None, NOW - timedelta(days=1)], policy=FinePolicy(), now=NOW)
+    assert days.tolist() == [0, 1]
+    assert fines.tolist() == [0.0, 0.5]
+
+def test_epoch_seconds_datetimes_and_legacy_text_agree():
+    moment = NOW - timedelta(days=4)
+    as_text = to_datetimes([moment.strftime('%Y-%m-%d %H:%M:%S')])
+    assert (to_datetimes([moment]) == as_text).all()
+    assert (to_datetimes([int(moment.timestamp())]) == as_text).all()
+    assert np.isnat(to_datetimes([None])).all()
+
+def test_policy_from_json(tmp_path):
+    path = tmp_path / 'policy.json'
+    path.write_text(json.dumps({'daily_rate': 1.0, 'category_rates': {'DVD': 3.0}, 'max_fine': 20}))
+    policy = FinePolicy.from_json(str(path))
+    assert (policy.daily_rate, policy.category_rates, policy.grace_days, policy.max_fine) == (1.0, {'DVD': 3.0}, 0, 20)
+
+def test_add_fine_columns():
+    df = pd.DataFrame({'Due': [NOW - timedelta(days=2), NOW], 'Returned': [None, None]})
+    add_fine_columns(df, 'Due', 'Returned', policy=FinePolicy(daily_rate=0.5), now=NOW)
+    assert df['Days Overdue'].tolist() == [2, 0]
+    assert df['Fine Amount'].tolist() == [1.0, 0.0]
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import library_db
+from library_circulation import checkout_batch, return_batch
+from library_holds import PICKUP_DAYS, expire_holds_batch, hold_queue, place_hold, queue_place, set_hold_status
+
+NOW = datetime.now().replace(microsecond=0)
+LATER = NOW + timedelta(days=30)
+
+def write(db, func, *args, **kwargs):
+    return library_db.run_write(func, *args, path=db, **kwargs)
+
+def lend(db, book_id, member_id, now=NOW):
+    result, = write(db, checkout_batch, [(book_id, member_id)], now=now)
+    return result
+
+def book_status(conn, book_id):
+    return conn.execute("SELECT status FROM books WHERE book_id = ?", (book_id,)).fetchone()[0]
+
+def hold_status(conn, reservation_id):
+    return conn.execute("SELECT status FROM reservations WHERE reservation_id = ?", (reservation_id,)).fetchone()[0]
+
+# Book 2 out on loan to member 1 with members 2, 3 and 4 queued for it
+def queued(db):
+    loan = lend(db, 2, 1)
+    holds = [write(db, place_hold, 2, member_id, LATER, now=NOW + timedelta(seconds=member_id)) for member_id in (2, 3, 4)]
+    return loan['loan_id'], [hold['reservation_id'] for hold in holds]
+
+def test_holds_queue_in_the_order_they_are_placed(db, conn):
+    loan_id, holds = queued(db)
+    assert [queue_place(conn, reservation_id) for reservation_id in holds] == [1, 2, 3]
+    assert [row[0] for row in hold_queue(conn, 2)] == holds
+
+    refused = write(db, place_hold, 2, 3, LATER)
+    assert not refused['ok'] and refused['message'] == "member already has a pending hold on this book"
+
+def test_holds_are_only_placed_on_books_that_are_out_for_active_members(db, conn):
+    loan = lend(db, 2, 1)
+    conn.execute("UPDATE members SET membership_status = 'suspended' WHERE member_id = 5")
+    conn.execute("UPDATE books SET status = 'lost' WHERE book_id = 4")
+    refusals = [write(db, place_hold, book_id, member_id, LATER) for book_id, member_id in [(3, 2), (4, 2), (99, 2), (2, 99), (2, 5)]]
+    assert [(hold['ok'], hold['message']) for hold in refusals] == [
+        (False, "book is available"), (False, "book is lost"), (False, "book not found"),
+        (False, "member not found"), (False, "member is suspended")]
+    assert conn.execute("SELECT COUNT(*) FROM reservations").fetchone()[0] == 0
+
+    # A book on the hold shelf for someone else can be queued for
+    assert write(db, place_hold, 2, 2, LATER)['ok']
+    write(db, return_batch, [loan['loan_id']], now=NOW)
+    assert book_status(conn, 2) == 'reserved'
+    assert write(db, place_hold, 2, 3, LATER)['place'] == 1
+
+def test_a_return_hands_the_book_to_the_first_in_line(db, conn):
+    loan_id, holds = queued(db)
+    write(db, return_batch, [loan_id], now=NOW)
+
+    assert book_status(conn, 2) == 'reserved'
+    assert hold_status(conn, holds[0]) == 'ready'
+    expiry = conn.execute("SELECT expiry_date FROM reservations WHERE reservation_id = ?", (holds[0],)).fetchone()[0]
+    assert expiry == NOW + timedelta(days=PICKUP_DAYS)
+    assert [queue_place(conn, reservation_id) for reservation_id in holds[1:]] == [1, 2]
+
+    assert lend(db, 2, 3)['message'] == "book is held for another member"
+    assert lend(db, 2, 2)['ok']
+    assert hold_status(conn, holds[0]) == 'fulfilled'
+    assert book_status(conn, 2) == 'borrowed'
+
+def test_dropping_a_ready_hold_passes_the_book_on(db, conn):
+    loan_id, holds = queued(db)
+    write(db, return_batch, [loan_id], now=NOW)
+    write(db, set_hold_status, holds[0], 'cancelled')
+    assert hold_status(conn, holds[1]) == 'ready'
+    assert book_status(conn, 2) == 'reserved'
+
+def test_a_lapsed_ready_hold_expires_and_the_next_member_is_served(db, conn):
+    loan_id, holds = queued(db)
+    # The second in line let their hold lapse while waiting
+    conn.execute("UPDATE reservations SET expiry_date = ? WHERE reservation_id = ?", (NOW - timedelta(days=1), holds[1]))
+    write(db, return_batch, [loan_id], now=NOW - timedelta(days=PICKUP_DAYS + 1))
+
+    assert write(db, expire_holds_batch, NOW, 100) == 2
+    assert [hold_status(conn, reservation_id) for reservation_id in holds] == ['expired', 'expired', 'ready']
+    assert book_status(conn, 2) == 'reserved'
+
+def test_marking_a_hold_ready_needs_the_book_on_the_shelf(db, conn):
+    loan_id, holds = queued(db)
+    # Still out on loan: the hold stays queued where it was
+    assert write(db, set_hold_status, holds[0], 'ready') == 'pending'
+    assert book_status(conn, 2) == 'borrowed'
+    assert [queue_place(conn, reservation_id) for reservation_id in holds] == [1, 2, 3]
+
+    # Book 3 was held while out, then put back on the shelf by hand
+    lend(db, 3, 5)
+    shelf_hold = write(db, place_hold, 3, 2, LATER)['reservation_id']
+    conn.execute("UPDATE books SET status = 'available' WHERE book_id = 3")
+    assert write(db, set_hold_status, shelf_hold, 'ready') == 'ready'
+    assert book_status(conn, 3) == 'reserved'
+
+def test_a_hold_put_back_in_the_queue_joins_the_back(db, conn):
+    loan_id, holds = queued(db)
+    write(db, return_batch, [loan_id], now=NOW)
+    assert write(db, set_hold_status, holds[0], 'pending') == 'pending'
+    # The book went to the next in line and the old holder queues behind the rest
+    assert hold_status(conn, holds[1]) == 'ready'
+    assert [row[0] for row in hold_queue(conn, 2)] == [holds[2], holds[0]]
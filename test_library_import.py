@@ -0,0 +1,97 @@
+import io
+import json
+
+import pytest
+
+import library_db
+from library_import import RowError, clean_row, drop_book_indexes, import_books, read_marc
+from library_rollups import verify_rollups
+from library_search import search_books
+from library_stats import verify_stats
+
+CSV = """Title,Author,ISBN,Year,Genre,Shelf
+Dune,Frank Herbert,978-0-441-17271-9,1965,Science Fiction,S1
+Nineteen Eighty-Four,George Orwell,9780451524935,,,
+,Nobody,,,,
+Bad Year,Someone,,MMXX,,
+"""
+
+def _marc(fields):
+    directory = data = b''
+    for tag, subfields in fields:
+        body = b'  ' + b''.join(b'\x1f' + code.encode() + value.encode() for code, value in subfields) + b'\x1e'
+        directory += tag.encode() + b'%04d%05d' % (len(body), len(data))
+        data += body
+    base = 24 + len(directory) + 1
+    leader = b'%05dnam a22%05d a 4500' % (base + len(data) + 1, base)
+    return leader + directory + b'\x1e' + data + b'\x1d'
+
+def _indexes(conn):
+    return {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE tbl_name = 'books' AND type IN ('index', 'trigger') AND sql IS NOT NULL")}
+
+def test_clean_row():
+    assert clean_row({'Title': ' Dune ', 'authors': 'Frank Herbert', 'isbn10': '0-441-17271-7', 'published': '1965.0'}) == \
+        ('Dune', 'Frank Herbert', '0441172717', 1965, None, 'available', None)
+    for record, message in [({'title': 'Dune'}, 'author is required'),
+                            ({'title': 'Dune', 'author': 'Herbert', 'isbn': '12345'}, 'invalid ISBN'),
+                            ({'title': 'Dune', 'author': 'Herbert', 'year': '3000'}, 'out of range'),
+                            ({'title': 'Dune', 'author': 'Herbert', 'status': 'stolen'}, 'invalid status'),
+                            (['Dune'], 'not an object')]:
+        with pytest.raises(RowError, match=message):
+            clean_row(record)
+
+def test_csv_import_inserts_updates_and_rejects(db, conn):
+    result = import_books(io.BytesIO(CSV.encode()), 'csv', path=db, batch_size=2)
+    assert result.as_dict() == {'read': 4, 'inserted': 1, 'updated': 1, 'rejected': 2}
+    assert [number for number, message in result.errors] == [3, 4]
+    assert conn.execute("SELECT title, publication_year, category, shelf_location FROM books WHERE isbn = '9780441172719'").fetchone() == \
+        ('Dune', 1965, 'Science Fiction', 'S1')
+    # An update keeps the fields the import leaves empty, and the status
+    assert conn.execute("SELECT title, category, status FROM books WHERE book_id = 2").fetchone() == \
+        ('Nineteen Eighty-Four', 'Fiction', 'available')
+
+def test_jsonl_rejects_a_bad_line_and_carries_on(db, conn):
+    lines = [json.dumps({'title': 'Emma', 'author': 'Jane Austen'}), '{oops', json.dumps({'title': 'Persuasion', 'author': 'Jane Austen'})]
+    result = import_books(io.BytesIO('\n'.join(lines).encode()), 'jsonl', path=db)
+    assert (result.inserted, result.rejected) == (2, 1)
+    assert result.errors[0][0] == 2 and 'invalid JSON' in result.errors[0][1]
+
+def test_marc_records(db, conn):
+    record = _marc([('020', [('a', '9780441172719 (pbk.)')]),
+                    ('100', [('a', 'Herbert, Frank,')]),
+                    ('245', [('a', 'Dune :'), ('b', 'a novel /')]),
+                    ('264', [('c', 'c1965.')]),
+                    ('650', [('a', 'Science fiction.')])])
+    assert next(read_marc(io.BytesIO(b'\n' + record))) == {
+        'title': 'Dune: a novel', 'author': 'Herbert, Frank', 'isbn': '9780441172719',
+        'publication_year': '1965', 'category': 'Science fiction', 'shelf_location': None}
+    result = import_books(io.BytesIO(record + b'not a MARC record\x1d'), 'marc', path=db)
+    assert (result.inserted, result.rejected) == (1, 1)
+    assert 'invalid MARC record' in result.errors[0][1]
+
+def test_bulk_import_puts_back_the_indexes_and_what_they_maintain(db, conn):
+    before = _indexes(conn)
+    seen = []
+    import_books(io.BytesIO(CSV.encode()), 'csv', path=db, drop_indexes=True,
+                 progress=lambda result: seen.append(_indexes(conn)))
+    # Dropped for the load, back afterwards
+    assert seen and not seen[0] & {'idx_books_status', 'books_fts_ai'}
+    assert _indexes(conn) == before
+    assert conn.execute("SELECT COUNT(*) FROM dropped_schema").fetchone()[0] == 0
+    assert [row[0] for row in search_books(conn, "dune herbert")]
+    assert verify_stats(conn) == [] and verify_rollups(conn) == []
+
+def test_a_load_that_never_restored_is_recovered(db, conn, monkeypatch):
+    before = _indexes(conn)
+    library_db.run_write(drop_book_indexes, path=db)
+    conn.execute("INSERT INTO books (title, author, category, status) VALUES ('Solaris', 'Stanislaw Lem', 'Science Fiction', 'available')")
+    rebuilt = []
+    rebuild_stats = library_db.rebuild_stats
+    monkeypatch.setattr(library_db, 'rebuild_stats', lambda c, tables: rebuilt.append(set(tables)) or rebuild_stats(c, tables))
+    library_db.recover_dropped_schema(library_db.connect(db))
+    assert _indexes(conn) == before
+    # Only the books counters are rebuilt; the members triggers were never dropped
+    assert rebuilt == [{'books'}]
+    assert [row[0] for row in search_books(conn, "solaris")]
+    assert verify_stats(conn) == [] and verify_rollups(conn) == []
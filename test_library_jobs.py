@@ -0,0 +1,73 @@
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+import library_db
+import library_jobs
+from library_circulation import checkout_batch
+from library_jobs import JOBS, Scheduler, accrue_fines_batch, last_runs, mark_overdue_batch, run_job
+
+NOW = datetime.now().replace(microsecond=0)
+
+@pytest.fixture
+def scheduler(db):
+    scheduler = Scheduler(db).start()
+    yield scheduler
+    scheduler.stop()
+
+# Books 2, 3 and 4 lent 20, 10 and 1 days ago for a week
+def _lend_late(db):
+    for book_id, days_ago in ((2, 20), (3, 10), (4, 1)):
+        library_db.run_write(checkout_batch, [(book_id, 2)], loan_days=7, now=NOW - timedelta(days=days_ago), path=db)
+
+def _loans(conn):
+    return conn.execute("SELECT book_id, status, fine_amount FROM loans WHERE status != 'returned' ORDER BY book_id").fetchall()
+
+def test_overdue_loans_are_marked_and_charged(db, conn):
+    _lend_late(db)
+    assert library_db.run_write(mark_overdue_batch, NOW, 500, path=db) == 2
+    assert _loans(conn) == [(2, 'overdue', 6.5), (3, 'overdue', 1.5), (4, 'borrowed', 0.0)]
+
+    # A day later the fines have grown; walking in small batches covers every loan
+    later = NOW + timedelta(days=1)
+    updated, after = library_db.run_write(accrue_fines_batch, later, (0, 0), 1, path=db)
+    assert updated == 1 and after is not None
+    assert library_db.run_write(accrue_fines_batch, later, after, 1, path=db)[0] == 1
+    assert _loans(conn) == [(2, 'overdue', 7.0), (3, 'overdue', 2.0), (4, 'borrowed', 0.0)]
+
+def test_runs_are_recorded(db, conn, monkeypatch):
+    _lend_late(db)
+    assert run_job('overdue_sweep', db) == 2
+    monkeypatch.setitem(JOBS, 'boom', (lambda path: 1 / 0, 3600))
+    with pytest.raises(RuntimeError, match='division by zero'):
+        run_job('boom', db)
+    runs = {job: (rows, error) for job, last_run, duration, rows, error, count in last_runs(conn)}
+    assert runs['overdue_sweep'] == (2, None) and runs['boom'] == (0, 'division by zero')
+
+def test_triggered_jobs_report_their_result(scheduler, monkeypatch):
+    monkeypatch.setitem(JOBS, 'answer', (lambda path: 42, 3600))
+    monkeypatch.setitem(JOBS, 'boom', (lambda path: 1 / 0, 3600))
+    assert scheduler.trigger('answer').result(timeout=10) == 42
+    with pytest.raises(RuntimeError):
+        scheduler.trigger('boom').result(timeout=10)
+    assert scheduler.trigger('answer').result(timeout=10) == 42
+
+def test_unknown_jobs_are_refused_and_the_scheduler_keeps_running(scheduler, monkeypatch):
+    with pytest.raises(KeyError):
+        scheduler.trigger('bogus')
+    monkeypatch.setattr(library_jobs, '_scheduler', scheduler)
+    with pytest.raises(KeyError):
+        library_jobs.trigger_job('bogus')
+    monkeypatch.setitem(JOBS, 'answer', (lambda path: 42, 3600))
+    assert library_jobs.trigger_job('answer').result(timeout=10) == 42
+
+def test_a_request_for_a_job_unregistered_since_does_not_stop_the_scheduler(scheduler, monkeypatch):
+    gone = Future()
+    with scheduler._lock:
+        scheduler._requested['gone'] = [gone]
+    scheduler._wake.set()
+    with pytest.raises(KeyError):
+        gone.result(timeout=10)
+    monkeypatch.setitem(JOBS, 'answer', (lambda path: 42, 3600))
+    assert scheduler.trigger('answer').result(timeout=10) == 42
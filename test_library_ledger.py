@@ -0,0 +1,65 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import library_db
+from library_circulation import checkout_batch, return_batch
+from library_ledger import ALL_MEMBERS, rebuild_fine_daily, record_payment, verify_ledger, window_totals
+from library_rollups import period_of
+
+def _late_return(db, items, days_late, now):
+    lent = library_db.run_write(checkout_batch, items, loan_days=1, now=now - timedelta(days=days_late + 1), path=db)
+    returned = library_db.run_write(return_batch, [r['loan_id'] for r in lent], now=now, path=db)
+    return {r['loan_id']: r['fine'] for r in returned}
+
+def _ledger_cents(conn, loan_id):
+    return conn.execute("SELECT SUM(amount_cents) FROM fine_ledger WHERE loan_id = ?", (loan_id,)).fetchone()[0]
+
+def test_returns_and_payments_post_to_the_ledger(db, conn):
+    now = datetime.now().replace(microsecond=0)
+    fines = _late_return(db, [(2, 2), (3, 3)], 6, now)
+    assert all(fine > 0 for fine in fines.values())
+    for loan_id, fine in fines.items():
+        assert _ledger_cents(conn, loan_id) == round(fine * 100)
+    library_db.run_write(record_payment, 2, 1.25, now=now, path=db)
+
+    assert verify_ledger(conn) == []
+    today = period_of(now)
+    assert window_totals(conn, today, today) == (round(sum(fines.values()) * 100), 125)
+    assert window_totals(conn, today + 1, today + 1) == (0, 0)
+
+def test_corrections_are_new_entries(db, conn):
+    now = datetime.now().replace(microsecond=0)
+    (loan_id, fine), = _late_return(db, [(2, 2)], 4, now).items()
+    conn.execute("UPDATE loans SET fine_amount = 0.75 WHERE loan_id = ?", (loan_id,))
+    kinds = conn.execute("SELECT amount_cents FROM fine_ledger WHERE loan_id = ? ORDER BY entry_id", (loan_id,)).fetchall()
+    assert [cents for (cents,) in kinds] == [round(fine * 100), -round(fine * 100), 75]
+    assert verify_ledger(conn) == []
+
+def test_ledger_is_append_only(db, conn):
+    _late_return(db, [(2, 2)], 2, datetime.now())
+    with pytest.raises(sqlite3.DatabaseError, match='append-only'):
+        conn.execute("UPDATE fine_ledger SET amount_cents = 0")
+    with pytest.raises(sqlite3.DatabaseError, match='append-only'):
+        conn.execute("DELETE FROM fine_ledger")
+
+def test_verify_reports_drift_and_rebuild_repairs_daily_totals(db, conn):
+    now = datetime.now().replace(microsecond=0)
+    (loan_id, fine), = _late_return(db, [(2, 2)], 3, now).items()
+    conn.execute("UPDATE fine_daily SET cum_assessed = cum_assessed + 100 WHERE member_id = ?", (ALL_MEMBERS,))
+    problems = verify_ledger(conn)
+    assert len(problems) == 1 and problems[0].startswith(f"member {ALL_MEMBERS} day {period_of(now)}")
+
+    conn.execute("BEGIN")
+    rebuild_fine_daily(conn)
+    conn.execute("COMMIT")
+    assert verify_ledger(conn) == []
+
+    # An assessment the loan does not carry is reported against the loan
+    conn.execute("INSERT INTO fine_ledger (entry_date, member_id, loan_id, kind, amount_cents) VALUES (?, 2, ?, 'assessment', 10)",
+                 (now, loan_id))
+    assert verify_ledger(conn) == [f"loan {loan_id}: ledger {round(fine * 100) + 10} cents, loan {round(fine * 100)} cents"]
+
+def test_the_migration_posts_existing_fines(db, conn):
+    assert verify_ledger(conn) == []
@@ -0,0 +1,54 @@
+import pytest
+
+import library_paging
+from library_paging import BOOKS, LOANS, count_rows, fetch_page
+
+# Twenty books by one author, all added at the same moment, between the others
+@pytest.fixture
+def ties(conn):
+    conn.executemany("INSERT INTO books (title, author, isbn, category, status, added_date) VALUES (?, 'Harper Lee', ?, ?, 'available', 1700000000)",
+                     [(f"Tie {i:02d}", f"tie-{i}", 'Fiction' if i % 2 else 'Poetry') for i in range(20)])
+    return conn
+
+def _walk(conn, listing, sort, descending, filters=None, page_size=3):
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = fetch_page(conn, listing, sort, descending, filters, page_size, cursor)
+        seen += [row[0] for row in rows]
+        pages += 1
+        if cursor is None:
+            return seen, pages
+
+def _expected(conn, sort_column, descending, where=''):
+    direction = 'DESC' if descending else 'ASC'
+    return [row[0] for row in conn.execute(f"SELECT book_id FROM books {where} ORDER BY {sort_column} {direction}, book_id {direction}")]
+
+@pytest.mark.parametrize('sort, column', [('Author', 'author'), ('Added Date', 'added_date'), ('Title', 'title'), ('Book ID', 'book_id')])
+@pytest.mark.parametrize('descending', [False, True])
+def test_pages_cover_every_row_once_across_equal_sort_keys(ties, sort, column, descending):
+    seen, pages = _walk(ties, BOOKS, sort, descending)
+    assert seen == _expected(ties, column, descending)
+    assert pages == -(-len(seen) // 3)
+
+def test_filters_apply_to_every_page(ties):
+    seen, pages = _walk(ties, BOOKS, 'Author', False, {'Category': 'Poetry', 'Status': None})
+    assert seen == _expected(ties, 'author', False, "WHERE category = 'Poetry'")
+    assert len(seen) == 10
+
+def test_rows_added_behind_the_cursor_do_not_shift_later_pages(ties):
+    first, cursor = fetch_page(ties, BOOKS, 'Author', False, None, 5)
+    ties.execute("INSERT INTO books (title, author, isbn, status) VALUES ('Early', 'Aardvark', 'early', 'available')")
+    rest, cursor = fetch_page(ties, BOOKS, 'Author', False, None, 100, cursor)
+    ids = [row[0] for row in first + rest]
+    assert len(ids) == len(set(ids)) == 31
+
+def test_last_page_has_no_cursor(conn):
+    rows, cursor = fetch_page(conn, LOANS, page_size=1)
+    assert len(rows) == 1 and cursor is None
+
+def test_counts_are_estimated_past_the_cap(ties, monkeypatch):
+    assert count_rows(ties, BOOKS) == (31, True)
+    assert count_rows(ties, BOOKS, {'Category': 'Poetry'}) == (10, True)
+    monkeypatch.setattr(library_paging, 'COUNT_CAP', 5)
+    count, exact = count_rows(ties, BOOKS)
+    assert not exact and count >= 5
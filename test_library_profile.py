@@ -0,0 +1,64 @@
+import json
+import marshal
+import time
+
+import streamlit as st
+
+from library_pages.profiling import SERIALIZING, instrumented_streamlit
+from library_profile import OTHER, Capture, PageProfile, Timed, active_profile, phase
+
+class Repo:
+    listing = 'books'
+
+    def get(self, key):
+        time.sleep(0.01)
+        return key
+
+def test_phases_are_charged_their_own_time(tmp_path):
+    profile = PageProfile('Books')
+    with profile.active():
+        assert active_profile() is profile
+        with phase('plotly', 'chart'):
+            time.sleep(0.02)
+            with phase('serialize', 'st.plotly_chart'):
+                time.sleep(0.03)
+        assert Timed(Repo(), 'sql').get(3) == 3
+    assert active_profile() is None
+
+    breakdown = profile.breakdown()
+    assert set(breakdown) == {'sql', 'frame', 'plotly', 'serialize', OTHER}
+    assert breakdown['sql'][1] == breakdown['plotly'][1] == breakdown['serialize'][1] == 1
+    assert breakdown['plotly'][0] >= 20 and breakdown['serialize'][0] >= 30
+    # The chart is not charged for its serialization
+    (_, chart, chart_ms), (_, serialize, serialize_ms) = profile.slowest(2)
+    assert (chart, serialize) == ('chart', 'st.plotly_chart')
+    assert abs(breakdown['plotly'][0] + breakdown['serialize'][0] - chart_ms) < 0.1
+    assert abs(sum(ms for ms, count in breakdown.values()) - profile.total_ms) < 0.1
+
+    trace = json.load(open(profile.save(str(tmp_path))))
+    assert [event['name'] for event in trace['traceEvents']] == ['page: Books', 'chart', 'st.plotly_chart', 'Repo.get']
+    assert trace['otherData']['page'] == 'Books'
+
+def test_nothing_is_recorded_without_an_active_profile():
+    with phase('sql'):
+        pass
+    repo = Timed(Repo(), 'sql')
+    assert repo.get(1) == 1 and repo.listing == 'books'
+    assert PageProfile('Books').save(None) is None
+
+def test_cprofile_captures():
+    capture = Capture('cprofile')
+    with capture.running():
+        Repo().get(1)
+    assert 'get' in capture.summary()
+    name, data, mime = capture.export('books')
+    assert name == 'books.pstats' and marshal.loads(data)
+
+def test_streamlit_elements_are_wrapped_only_while_profiled_runs_are_inside():
+    originals = {name: getattr(st, name) for name in SERIALIZING}
+    with instrumented_streamlit():
+        with instrumented_streamlit():
+            assert all(getattr(st, name).__wrapped__ is originals[name] for name in SERIALIZING)
+        # Another run is still inside
+        assert st.dataframe is not originals['dataframe']
+    assert {name: getattr(st, name) for name in SERIALIZING} == originals
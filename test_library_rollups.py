@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import library_db
+from library_circulation import checkout_batch, return_batch
+from library_rollups import period_of, rebuild_rollups, reconcile, verify_rollups
+
+def _lend(db, items, now):
+    return [r['loan_id'] for r in library_db.run_write(checkout_batch, items, now=now, path=db)]
+
+def test_triggers_keep_rollups_current(db, conn):
+    now = datetime.now().replace(microsecond=0)
+    loans = _lend(db, [(2, 1), (3, 2), (4, 3)], now - timedelta(days=40))
+    _lend(db, [(5, 1)], now)
+    library_db.run_write(return_batch, loans[:2], now=now, path=db)
+    conn.execute("UPDATE books SET category = 'Classics' WHERE book_id = 3")
+    conn.execute("DELETE FROM loans WHERE loan_id = ?", (loans[2],))
+    conn.execute("DELETE FROM books WHERE book_id = 5")
+    assert verify_rollups(conn) == []
+
+    month = period_of(now, 'month')
+    counts = dict(conn.execute("SELECT key, loans FROM loan_rollups WHERE scope = 'category' AND grain = 'month' AND period = ?", (month,)))
+    # The deleted book's loan is no longer counted under its old category
+    assert counts.get('Fantasy', 0) == 0 and counts.get('', 0) == 1
+
+def test_verify_reports_drift_and_reconcile_repairs_it(db, conn):
+    _lend(db, [(2, 1), (3, 2)], datetime.now())
+    conn.execute("UPDATE loan_rollups SET loans = loans + 2 WHERE scope = 'book' AND grain = 'day' AND key = 2")
+    conn.execute("DELETE FROM loan_rollups WHERE scope = 'member' AND grain = 'month' AND key = 2")
+
+    drift = verify_rollups(conn)
+    assert sorted((scope, grain, key, stored - actual) for scope, grain, period, key, stored, actual in drift) == [
+        ('book', 'day', 2, 2), ('member', 'month', 2, -1)]
+    assert reconcile(db) == drift
+    assert verify_rollups(conn) == []
+
+def test_rebuild_only_touches_the_given_scopes(db, conn):
+    _lend(db, [(2, 1)], datetime.now())
+    conn.execute("UPDATE loan_rollups SET loans = loans + 1 WHERE scope IN ('book', 'member')")
+    conn.execute("BEGIN")
+    rebuild_rollups(conn, ['book'])
+    conn.execute("COMMIT")
+    assert {row[0] for row in verify_rollups(conn)} == {'member'}
+
+def test_the_migration_fills_the_rollups_from_the_loans(db, conn):
+    assert conn.execute("SELECT SUM(loans) FROM loan_rollups WHERE scope = 'book' AND grain = 'day'").fetchone()[0] == 1
+    assert verify_rollups(conn) == []
@@ -0,0 +1,50 @@
+import pytest
+
+from library_search import build_match, search_books, search_members
+
+def _ids(rows):
+    return [row[0] for row in rows]
+
+def test_build_match():
+    assert build_match("tolk") == '"tolk"*'
+    assert build_match('"great gatsby" fitz') == '"great gatsby" "fitz"*'
+    assert build_match("author:tolkien hob", None, ['title', 'author']) == 'author : "tolkien"* "hob"*'
+    # Unknown fields are searched as plain words
+    assert build_match("shelf:a1", None, ['title']) == '"shelf:a1"*'
+    assert build_match("hob", ['title']) == '{title} : ("hob"*)'
+    assert build_match('  ""  ') is None
+
+def test_words_match_as_prefixes_across_fields(conn):
+    assert sorted(_ids(search_books(conn, "tolk"))) == [5, 8]
+    assert _ids(search_books(conn, "great gats")) == [3]
+    assert _ids(search_books(conn, "author:orwell farm")) == [9]
+    assert _ids(search_books(conn, "1984")) == [2]
+    assert sorted(_ids(search_books(conn, "fantasy", field='Category'))) == [5, 6, 8]
+    assert search_books(conn, "fantasy", field='Title') == []
+
+def test_title_matches_rank_above_author_matches(conn):
+    conn.execute("INSERT INTO books (title, author, isbn, category, status) VALUES ('Orwell', 'Someone Else', '111', 'Biography', 'available')")
+    new_id = conn.execute("SELECT MAX(book_id) FROM books").fetchone()[0]
+    assert _ids(search_books(conn, "orwell"))[0] == new_id
+
+def test_isbn_fragments_use_the_trigram_index(conn):
+    assert _ids(search_books(conn, "0061120")) == [1]
+    assert _ids(search_books(conn, "978-0-451", field='ISBN')) == [2, 9]
+
+def test_the_index_follows_writes(conn):
+    conn.execute("UPDATE books SET title = 'Nineteen Eighty-Four' WHERE book_id = 2")
+    assert search_books(conn, "1984") == []
+    assert _ids(search_books(conn, "nineteen")) == [2]
+    conn.execute("DELETE FROM books WHERE book_id = 2")
+    assert search_books(conn, "nineteen") == []
+
+def test_members_by_name_email_and_phone(conn):
+    assert _ids(search_members(conn, "jan")) == [2]
+    assert _ids(search_members(conn, "smith@exa")) == [2]
+    assert _ids(search_members(conn, "555-56")) == [2]
+    assert _ids(search_members(conn, "lagis", field='Name')) == [6]
+
+@pytest.mark.parametrize('term', ['"', 'a"b', 'NEAR(', '*', 'title:', "o'brien", 'AND OR NOT'])
+def test_user_input_never_breaks_the_query(conn, term):
+    search_books(conn, term)
+    search_members(conn, term)
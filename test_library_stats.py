@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import library_db
+from library_circulation import checkout_batch
+from library_stats import read_counters, read_total, rebuild_stats, reconcile, verify_stats
+
+def test_migration_fills_the_counters_from_existing_rows(db, conn):
+    assert verify_stats(conn) == []
+    assert read_total(conn, 'books') == 11
+    assert read_counters(conn, 'loans_status') == {'returned': 1}
+
+def test_triggers_keep_counters_current(db, conn):
+    available = read_counters(conn, 'books_status')['available']
+    library_db.run_write(checkout_batch, [(2, 1), (3, 2)], now=datetime.now(), path=db)
+    conn.execute("UPDATE members SET membership_status = 'suspended' WHERE member_id = 3")
+    conn.execute("INSERT INTO books (title, author, isbn, category, status) VALUES ('New', 'Someone', 'x-1', NULL, 'available')")
+
+    assert read_counters(conn, 'books_status')['available'] == available - 1
+    assert read_counters(conn, 'books_status')['borrowed'] == 2
+    assert read_counters(conn, 'books_category')[None] == 1
+    assert read_counters(conn, 'members_status')['suspended'] == 1
+    assert read_total(conn, 'loans') == 3
+    assert verify_stats(conn) == []
+
+def test_verify_reports_drift_and_reconcile_repairs_it(db, conn):
+    conn.execute("UPDATE library_stats SET value = value + 5 WHERE scope = 'books' AND key = ''")
+    conn.execute("DELETE FROM library_stats WHERE scope = 'loans_status'")
+    drift = verify_stats(conn)
+    assert drift == [('books', '', 16, 11), ('loans_status', 'returned', 0, 1)]
+    assert reconcile(db) == drift
+    assert verify_stats(conn) == []
+
+def test_rebuild_only_touches_the_given_tables(db, conn):
+    conn.execute("UPDATE library_stats SET value = value + 1 WHERE scope IN ('books', 'loans')")
+    conn.execute("BEGIN")
+    rebuild_stats(conn, ['loans'])
+    conn.execute("COMMIT")
+    assert [scope for scope, key, stored, actual in verify_stats(conn)] == ['books']
@@ -0,0 +1,74 @@
+import json
+import sqlite3
+
+import pytest
+
+import library_db
+import library_trace
+from library_trace import OTHER, QueryTracer, TracedConnection
+
+BOOKS_BY_STATUS = "SELECT book_id FROM books WHERE status = ?"
+
+@pytest.fixture
+def tracer(db, tmp_path):
+    tracer = QueryTracer(slow_ms=1000, log_path=str(tmp_path / 'slow.log'))
+    tracer.install()
+    yield tracer
+    tracer.uninstall()
+
+@pytest.fixture
+def traced(tracer, db):
+    conn = library_db.connect(db, isolation_level=None)
+    yield conn
+    conn.close()
+
+def _stats(tracer, sql):
+    return {entry['statement']: entry for entry in tracer.top(100)}[library_trace.normalize(sql)]
+
+def test_statements_are_timed_until_their_rows_are_read(tracer, traced):
+    assert isinstance(traced, TracedConnection) and traced.tracer is tracer
+    cursor = traced.execute(BOOKS_BY_STATUS, ('available',))
+    assert tracer.top() == []
+    assert cursor.fetchone() is not None and len(list(cursor)) == 10
+    traced.execute("SELECT   book_id\n FROM books WHERE status = ?", ('lost',)).fetchall()
+    stats = _stats(tracer, BOOKS_BY_STATUS)
+    # Layouts of one statement are counted together
+    assert (stats['calls'], stats['rows'], stats['errors']) == (2, 11, 0)
+    assert sum(count for label, count in tracer.histogram(stats['statement'])) == 2
+    assert stats['p50_ms'] <= stats['p95_ms'] <= stats['max_ms']
+
+def test_writes_errors_and_lock_waits_are_counted(tracer, traced):
+    traced.execute("BEGIN IMMEDIATE")
+    assert traced.execute("UPDATE books SET shelf_location = 'Z9' WHERE category = ?", ('Fantasy',)).rowcount == 3
+    traced.executemany("UPDATE books SET shelf_location = ? WHERE book_id = ?", [('Y1', 1), ('Y2', 2)])
+    traced.execute("ROLLBACK")
+    with pytest.raises(sqlite3.OperationalError):
+        traced.execute("SELECT nothing FROM books")
+    assert _stats(tracer, "UPDATE books SET shelf_location = 'Z9' WHERE category = ?")['rows'] == 3
+    assert _stats(tracer, "UPDATE books SET shelf_location = ? WHERE book_id = ?")['rows'] == 2
+    assert _stats(tracer, "BEGIN IMMEDIATE")['lock_ms'] > 0
+    assert _stats(tracer, "SELECT nothing FROM books")['errors'] == 1
+
+def test_slow_statements_are_explained_and_logged(tracer, traced):
+    tracer.slow_ms = 0
+    traced.execute(BOOKS_BY_STATUS, ('available',)).fetchall()
+    slow, = tracer.slow_queries()
+    assert slow['statement'] == BOOKS_BY_STATUS and slow['rows'] == 11
+    assert slow['plan'] and tracer.plan(BOOKS_BY_STATUS) == slow['plan']
+    logged = [json.loads(line) for line in open(tracer.log_path)]
+    assert [entry['statement'] for entry in logged] == [BOOKS_BY_STATUS]
+    # The tracer's own EXPLAINs are not traced
+    assert all(not entry['statement'].startswith('EXPLAIN') for entry in tracer.top(100))
+
+def test_statements_past_the_limit_are_counted_together(tracer, traced, monkeypatch):
+    monkeypatch.setattr(library_trace, 'MAX_STATEMENTS', 2)
+    for n in range(4):
+        traced.execute(f"SELECT {n}").fetchall()
+    assert sorted(entry['statement'] for entry in tracer.top()) == [OTHER, 'SELECT 0', 'SELECT 1']
+    assert _stats(tracer, OTHER)['calls'] == 2
+
+def test_uninstalled_tracers_leave_new_connections_alone(tracer, db):
+    tracer.uninstall()
+    conn = library_db.connect(db)
+    assert type(conn) is sqlite3.Connection
+    conn.close()